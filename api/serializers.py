@@ -146,8 +146,9 @@ class ScreenshotSerializer(serializers.ModelSerializer):
 
 class ProductionListingSerializer(serializers.HyperlinkedModelSerializer):
 	demozoo_url = serializers.SerializerMethodField(read_only=True)
-	author_nicks = AuthorNickSerializer(many=True, read_only=True)
-	author_affiliation_nicks = AuthorNickSerializer(many=True, read_only=True)
+	# read from the production's byline cache where possible, rather than fetching nicks for each row
+	author_nicks = AuthorNickSerializer(source='author_nicks_with_authors', many=True, read_only=True)
+	author_affiliation_nicks = AuthorNickSerializer(source='author_affiliation_nicks_with_groups', many=True, read_only=True)
 	release_date = serializers.SerializerMethodField(read_only=True)
 	platforms = PlatformSerializer(many=True, read_only=True)
 	types = ProductionTypeSummarySerializer(many=True, read_only=True)
@@ -4,6 +4,8 @@ import json
 
 from django.test import TestCase, override_settings
 
+from productions.models import MemberProduction
+
 
 class TestApiRoot(TestCase):
 	def test_get_root(self):
@@ -64,6 +66,10 @@ class TestProductions(TestCase):
 class TestReleasers(TestCase):
 	fixtures = ['tests/gasman.json']
 
+	def setUp(self):
+		# fixtures are loaded without the signal handlers that maintain this
+		MemberProduction.refresh()
+
 	def test_get_releasers(self):
 		response = self.client.get('/api/v1/releasers/')
 		self.assertEqual(response.status_code, 200)
@@ -99,3 +105,12 @@ class TestReleasers(TestCase):
 
 		response_data = json.loads(response.content)
 		self.assertIn("Madrielle", [result['title'] for result in response_data])
+
+	def test_get_releaser_member_prods_paginated(self):
+		response = self.client.get('/api/v1/releasers/2/member_productions/?page=1')
+		self.assertEqual(response.status_code, 200)
+
+		response_data = json.loads(response.content)
+		self.assertIsNone(response_data['previous'])
+		self.assertEqual(response_data['count'], len(response_data['results']))
+		self.assertIn("Madrielle", [result['title'] for result in response_data['results']])
@@ -1,5 +1,6 @@
 from rest_framework import viewsets
 from rest_framework.decorators import detail_route, list_route
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
 from demoscene.models import Releaser
@@ -31,7 +32,7 @@ class ProductionTypeViewSet(viewsets.ReadOnlyModelViewSet):
 
 
 class ProductionViewSet(ListDetailModelViewSet):
-	queryset = Production.objects.prefetch_related('platforms', 'types', 'author_nicks__releaser', 'author_affiliation_nicks__releaser')
+	queryset = Production.objects.prefetch_related('platforms', 'types')
 	list_serializer_class = serializers.ProductionListingSerializer
 	serializer_class = serializers.ProductionSerializer
 
@@ -44,9 +45,7 @@ class ReleaserViewSet(ListDetailModelViewSet):
 	@detail_route()
 	def productions(self, request, pk):
 		releaser = Releaser.objects.get(pk=pk)
-		queryset = releaser.productions().order_by('-release_date_date').prefetch_related(
-			'platforms', 'types', 'author_nicks__releaser', 'author_affiliation_nicks__releaser'
-		)
+		queryset = releaser.productions().order_by('-release_date_date').prefetch_related('platforms', 'types')
 		serializer = serializers.ProductionListingSerializer(
 			queryset, many=True, context={'request': request}
 		)
@@ -55,9 +54,17 @@ class ReleaserViewSet(ListDetailModelViewSet):
 	@detail_route()
 	def member_productions(self, request, pk):
 		releaser = Releaser.objects.get(pk=pk)
-		queryset = releaser.member_productions().order_by('-release_date_date').prefetch_related(
-			'platforms', 'types', 'author_nicks__releaser', 'author_affiliation_nicks__releaser'
-		)
+		queryset = releaser.member_productions().order_by('-release_date_date', 'id').prefetch_related('platforms', 'types')
+		# groups can have thousands of member productions, so clients can ask for them
+		# a page at a time with ?page=; without it, the full list is returned as before
+		if 'page' in request.query_params:
+			paginator = PageNumberPagination()
+			page = paginator.paginate_queryset(queryset, request, view=self)
+			serializer = serializers.ProductionListingSerializer(
+				page, many=True, context={'request': request}
+			)
+			return paginator.get_paginated_response(serializer.data)
+
 		serializer = serializers.ProductionListingSerializer(
 			queryset, many=True, context={'request': request}
 		)
@@ -5,18 +5,29 @@ from parties.models import Party
 from productions.models import Production
 
 
+PRODUCTION_FACETS = [('supertype', 'supertype', 50), ('platform', 'platform_ids', 51), ('year', 'release_year', 52)]
+RELEASER_FACETS = [('is_group', 'is_group', 53)]
+PARTY_FACETS = [('year', 'start_year', 52)]
+
+
 class ProductionIndexer(Indexer):
 	fields = [('asciified_title', 1000), 'tags_string', 'indexed_notes']
+	facets = PRODUCTION_FACETS
+	prefetch_related = ['tags', 'platforms']
 space.add_index(Production, ProductionIndexer, attach_as='indexer')
 
 
 class ReleaserIndexer(Indexer):
 	fields = [('asciified_all_names_string', 1000), ('asciified_public_real_name', 500), 'asciified_location', 'plaintext_notes']
+	facets = RELEASER_FACETS
+	prefetch_related = ['nicks__variants']
 space.add_index(Releaser, ReleaserIndexer, attach_as='indexer')
 
 
 class ReleaserIndexerWithRealNames(Indexer):
 	fields = [('asciified_all_names_string', 1000), ('asciified_real_name', 500), 'asciified_location', 'plaintext_notes']
+	facets = RELEASER_FACETS
+	prefetch_related = ['nicks__variants']
 space.add_index(Releaser, ReleaserIndexerWithRealNames, attach_as='indexer_with_real_names')
 
 
@@ -24,29 +35,43 @@ space.add_index(Releaser, ReleaserIndexerWithRealNames, attach_as='indexer_with_
 
 class PartyIndexer(Indexer):
 	fields = [('asciified_name', 1000), 'asciified_location', ('tagline', 200), 'plaintext_notes']
+	facets = PARTY_FACETS
 space.add_index(Party, PartyIndexer, attach_as='indexer')
 
 complete_indexer = CompositeIndexer(Production.indexer, Releaser.indexer, Party.indexer)
 complete_indexer_with_real_names = CompositeIndexer(Production.indexer, Releaser.indexer_with_real_names, Party.indexer)
 
 
+# The name indexes are searched together with the complete ones (see search.forms), so they
+# carry the same facets for filtering; only the complete indexes' documents are counted.
+
 class ProductionNameIndexer(Indexer):
 	fields = ['asciified_title']
+	facets = PRODUCTION_FACETS
+	count_facets = False
 space.add_index(Production, ProductionNameIndexer, attach_as='name_indexer')
 
 
 class ReleaserNameIndexer(Indexer):
 	fields = ['asciified_all_names_string', 'asciified_public_real_name']
+	facets = RELEASER_FACETS
+	count_facets = False
+	prefetch_related = ['nicks__variants']
 space.add_index(Releaser, ReleaserNameIndexer, attach_as='name_indexer')
 
 
 class ReleaserNameIndexerWithRealNames(Indexer):
 	fields = ['asciified_all_names_string', 'asciified_real_name']
+	facets = RELEASER_FACETS
+	count_facets = False
+	prefetch_related = ['nicks__variants']
 space.add_index(Releaser, ReleaserNameIndexerWithRealNames, attach_as='name_indexer_with_real_names')
 
 
 class PartyNameIndexer(Indexer):
 	fields = ['asciified_name', 1000]
+	facets = PARTY_FACETS
+	count_facets = False
 space.add_index(Party, PartyNameIndexer, attach_as='name_indexer')
 
 name_indexer = CompositeIndexer(Production.name_indexer, Releaser.name_indexer, Party.name_indexer)
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# as MembershipName.REFRESH_SQL, for all memberships
+POPULATE_MEMBERSHIP_NAMES_SQL = '''
+    INSERT INTO demoscene_membershipname (member_id, group_id, name_of, name)
+    SELECT demoscene_membership.member_id, demoscene_membership.group_id, 'group', LOWER(demoscene_nickvariant.name)
+    FROM demoscene_membership
+    INNER JOIN demoscene_nick ON (demoscene_nick.releaser_id = demoscene_membership.group_id)
+    INNER JOIN demoscene_nickvariant ON (demoscene_nickvariant.nick_id = demoscene_nick.id)
+    UNION ALL
+    SELECT demoscene_membership.member_id, demoscene_membership.group_id, 'member', LOWER(demoscene_nickvariant.name)
+    FROM demoscene_membership
+    INNER JOIN demoscene_nick ON (demoscene_nick.releaser_id = demoscene_membership.member_id)
+    INNER JOIN demoscene_nickvariant ON (demoscene_nickvariant.nick_id = demoscene_nick.id)
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('demoscene', '0004_blacklistedtag'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MembershipName',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name_of', models.CharField(choices=[(b'group', b'Group'), (b'member', b'Member')], max_length=6)),
+                ('name', models.CharField(max_length=255)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='demoscene.Releaser')),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='demoscene.Releaser')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='membershipname',
+            index_together=set([('name_of', 'name')]),
+        ),
+        migrations.RunSQL(POPULATE_MEMBERSHIP_NAMES_SQL, migrations.RunSQL.noop),
+        # index for exact and prefix matches on LOWER(name)
+        migrations.RunSQL(
+            "CREATE INDEX demoscene_nickvariant_lower_name ON demoscene_nickvariant (LOWER(name) text_pattern_ops)",
+            "DROP INDEX demoscene_nickvariant_lower_name",
+        ),
+        # trigram index for similarity matches. Creating the pg_trgm extension needs superuser
+        # rights, so it must be done before migrating (see README.md)
+        migrations.RunSQL(
+            "CREATE INDEX demoscene_nickvariant_lower_name_trgm ON demoscene_nickvariant USING gin (LOWER(name) gin_trgm_ops)",
+            "DROP INDEX demoscene_nickvariant_lower_name_trgm",
+        ),
+    ]
@@ -1,7 +1,9 @@
 from collections import OrderedDict as SortedDict
 
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 # from django.utils.datastructures import SortedDict
 from django.contrib.contenttypes.models import ContentType
@@ -14,7 +16,7 @@ from unidecode import unidecode
 
 from lib.strip_markup import strip_markup
 from lib.prefetch_snooping import ModelWithPrefetchSnooping
-from demoscene.utils import groklinks
+from demoscene.utils import fragment_cache, groklinks
 
 DATE_PRECISION_CHOICES = [
 	('d', 'Day'),
@@ -88,15 +90,10 @@ class Releaser(models.Model, ModelWithPrefetchSnooping):
 
 	def member_productions(self):
 		# Member productions are those which list this group in the 'affiliations' portion of the byline,
-		# OR the author is a SUBGROUP of this group (regardless of whether this parent group is named as an affiliation).
+		# OR the author is a SUBGROUP of this group (regardless of whether this parent group is named as an affiliation),
+		# with subgroups followed to any depth. These are precomputed in productions.models.MemberProduction.
 		from productions.models import Production
-
-		subgroup_nick_ids = list(Nick.objects.filter(releaser__is_group=True, releaser__group_memberships__group=self).values_list('id', flat=True))
-
-		return Production.objects.filter(
-			Q(author_affiliation_nicks__in=list(self.nicks.all()))
-			| Q(author_nicks__in=subgroup_nick_ids)
-		).distinct()
+		return Production.objects.filter(member_production_entries__group=self)
 
 	def credits(self):
 		from productions.models import Credit
@@ -194,7 +191,11 @@ class Releaser(models.Model, ModelWithPrefetchSnooping):
 
 	@property
 	def all_names_string(self):
-		all_names = [nv.name for nv in NickVariant.objects.filter(nick__releaser=self)]
+		if self.has_prefetched('nicks'):
+			# use the prefetched nicks (and, ideally, nicks__variants) to avoid another SQL query
+			all_names = [nv.name for nick in self.nicks.all() for nv in nick.variants.all()]
+		else:
+			all_names = [nv.name for nv in NickVariant.objects.filter(nick__releaser=self)]
 		return ', '.join(all_names)
 
 	@property
@@ -327,8 +328,10 @@ class Nick(models.Model):
 
 			self._has_written_nick_variant_list = False
 
-	def name_with_affiliations(self):
-		groups = self.releaser.current_groups()
+	def name_with_affiliations(self, groups=None):
+		# groups may be passed in if they have already been fetched (see BylineResolver)
+		if groups is None:
+			groups = self.releaser.current_groups()
 
 		if groups:
 			if sum([len(group.name) for group in groups]) >= 20:
@@ -413,6 +416,24 @@ class NickVariant(models.Model):
 				except IndexError:  # no autocompletions available
 					return ''
 
+	@staticmethod
+	def _membership_scores(group_ids=[], group_names=[], member_names=[]):
+		"""
+		Return a dict of releaser ID => score for releasers that are members of any of the
+		given groups, members of a group with any of the given names, or (if neither of those
+		are given) groups with a member with any of the given names
+		"""
+		if group_ids:
+			scores = Membership.objects.filter(group_id__in=group_ids).values_list('member_id')
+		elif group_names:
+			scores = MembershipName.objects.filter(name_of='group', name__in=group_names).values_list('member_id')
+		elif member_names:
+			scores = MembershipName.objects.filter(name_of='member', name__in=member_names).values_list('group_id')
+		else:
+			return {}
+
+		return dict(scores.annotate(score=models.Count('id')).order_by())
+
 	@staticmethod
 	def autocompletion_search(query, **kwargs):
 		limit = kwargs.get('limit')
@@ -425,55 +446,39 @@ class NickVariant(models.Model):
 		member_names = [name.lower() for name in kwargs.get('member_names', [])]
 
 		if query:
+			# These conditions are written against LOWER(name) so that they can use the
+			# expression indexes on demoscene_nickvariant (see migration 0005)
 			if exact:
-				nick_variants = NickVariant.objects.filter(name__iexact=query)
+				where = ["LOWER(demoscene_nickvariant.name) = LOWER(%s)"]
+				params = [query]
 			else:
-				nick_variants = NickVariant.objects.filter(name__istartswith=query)
+				where = ["LOWER(demoscene_nickvariant.name) LIKE LOWER(%s)"]
+				params = [re.sub(r'([\\%_])', r'\\\1', query) + '%']
+			nick_variants = NickVariant.objects.extra(where=where, params=params)
 
 			if groups_only:
 				nick_variants = nick_variants.filter(nick__releaser__is_group=True)
 			elif sceners_only:
 				nick_variants = nick_variants.filter(nick__releaser__is_group=False)
 			else:
-				# nasty hack to ensure that we're joining on releaser, for the 'group_names' subquery
+				# nasty hack to ensure that we're joining on nick, for the 'score' expression
 				nick_variants = nick_variants.filter(nick__releaser__is_group__in=[True, False])
 
-			if group_ids:
-				# Add a 'score' field that prioritises releasers that are members of any of the specified groups
-				select = SortedDict([
-					('score', '''
-						SELECT COUNT(*) FROM demoscene_membership
-						WHERE demoscene_membership.member_id = demoscene_releaser.id
-						AND demoscene_membership.group_id IN %s
-					'''),
-				])
-				select_params = [tuple(group_ids)]
-			elif group_names:
-				# Add a 'score' field that prioritises releasers that are members of a group with one of the given names
-				select = SortedDict([
-					('score', '''
-						SELECT COUNT(*) FROM demoscene_membership
-						INNER JOIN demoscene_releaser AS demogroup ON (demoscene_membership.group_id = demogroup.id)
-						INNER JOIN demoscene_nick AS group_nick ON (demogroup.id = group_nick.releaser_id)
-						INNER JOIN demoscene_nickvariant AS group_nickvariant ON (group_nick.id = group_nickvariant.nick_id)
-						WHERE demoscene_membership.member_id = demoscene_releaser.id
-						AND LOWER(group_nickvariant.name) IN %s
-					'''),
-				])
-				select_params = [tuple(group_names)]
-			elif member_names:
-				# Add a 'score' field that prioritises groups that have members with one of the given names
+			# Add a 'score' field that prioritises releasers that are members of the specified groups
+			# (or groups with the specified members). The scores are looked up in a single query
+			# and passed in as a CASE expression, rather than counted for each candidate row
+			releaser_ids_by_score = {}
+			for releaser_id, score in NickVariant._membership_scores(group_ids, group_names, member_names).iteritems():
+				releaser_ids_by_score.setdefault(score, []).append(releaser_id)
+
+			if releaser_ids_by_score:
 				select = SortedDict([
-					('score', '''
-						SELECT COUNT(*) FROM demoscene_membership
-						INNER JOIN demoscene_releaser AS member ON (demoscene_membership.member_id = member.id)
-						INNER JOIN demoscene_nick AS member_nick ON (member.id = member_nick.releaser_id)
-						INNER JOIN demoscene_nickvariant AS member_nickvariant ON (member_nick.id = member_nickvariant.nick_id)
-						WHERE demoscene_membership.group_id = demoscene_releaser.id
-						AND LOWER(member_nickvariant.name) IN %s
-					'''),
+					('score', 'CASE %s ELSE 0 END' % ' '.join(
+						'WHEN demoscene_nick.releaser_id IN %%s THEN %d' % score
+						for score in sorted(releaser_ids_by_score)
+					)),
 				])
-				select_params = [tuple(member_names)]
+				select_params = [tuple(releaser_ids_by_score[score]) for score in sorted(releaser_ids_by_score)]
 			else:
 				select = SortedDict([
 					('score', '0'),
@@ -520,6 +525,96 @@ class Membership(models.Model):
 		return "%s / %s" % (self.member.name, self.group.name)
 
 
+def with_supergroup_ids(releaser_ids):
+	"""Return the given releaser ids along with the ids of all groups they belong to, at any depth"""
+	from django.db import connection
+
+	releaser_ids = tuple(set(releaser_ids))
+	if not releaser_ids:
+		return set()
+
+	cursor = connection.cursor()
+	cursor.execute('''
+		WITH RECURSIVE supergroups(releaser_id) AS (
+			SELECT demoscene_releaser.id FROM demoscene_releaser WHERE demoscene_releaser.id IN %s
+			UNION
+			SELECT demoscene_membership.group_id
+			FROM supergroups
+			INNER JOIN demoscene_membership ON (demoscene_membership.member_id = supergroups.releaser_id)
+		)
+		SELECT releaser_id FROM supergroups
+	''', [releaser_ids])
+	return set(releaser_id for (releaser_id,) in cursor.fetchall())
+
+
+class MembershipName(models.Model):
+	"""
+	Denormalised lookup of group memberships by name, used to score nick autocompletion
+	results: for each membership, one row per (lowercased) nick variant name of the group
+	and of the member. Kept up to date by the signal handlers below.
+	"""
+	member = models.ForeignKey(Releaser, related_name='+')
+	group = models.ForeignKey(Releaser, related_name='+')
+	name_of = models.CharField(max_length=6, choices=[('group', 'Group'), ('member', 'Member')])
+	name = models.CharField(max_length=255)
+
+	REFRESH_SQL = '''
+		INSERT INTO demoscene_membershipname (member_id, group_id, name_of, name)
+		SELECT demoscene_membership.member_id, demoscene_membership.group_id, 'group', LOWER(demoscene_nickvariant.name)
+		FROM demoscene_membership
+		INNER JOIN demoscene_nick ON (demoscene_nick.releaser_id = demoscene_membership.group_id)
+		INNER JOIN demoscene_nickvariant ON (demoscene_nickvariant.nick_id = demoscene_nick.id)
+		WHERE %(condition)s
+		UNION ALL
+		SELECT demoscene_membership.member_id, demoscene_membership.group_id, 'member', LOWER(demoscene_nickvariant.name)
+		FROM demoscene_membership
+		INNER JOIN demoscene_nick ON (demoscene_nick.releaser_id = demoscene_membership.member_id)
+		INNER JOIN demoscene_nickvariant ON (demoscene_nickvariant.nick_id = demoscene_nick.id)
+		WHERE %(condition)s
+	'''
+
+	@staticmethod
+	def refresh(releaser_ids=None):
+		"""Rebuild the rows for memberships involving any of releaser_ids (or all memberships, if None)"""
+		from django.db import connection
+
+		if releaser_ids is None:
+			MembershipName.objects.all().delete()
+			condition, params = 'TRUE', []
+		else:
+			releaser_ids = tuple(set(releaser_ids))
+			if not releaser_ids:
+				return
+			MembershipName.objects.filter(Q(member_id__in=releaser_ids) | Q(group_id__in=releaser_ids)).delete()
+			condition = 'demoscene_membership.member_id IN %s OR demoscene_membership.group_id IN %s'
+			params = [releaser_ids, releaser_ids]
+
+		cursor = connection.cursor()
+		cursor.execute(MembershipName.REFRESH_SQL % {'condition': condition}, params + params)
+
+	class Meta:
+		index_together = [
+			['name_of', 'name'],
+		]
+
+
+# Refreshes are deferred until the transaction commits, so that they see the final state of
+# the database rather than a releaser partway through being deleted
+
+@receiver([post_save, post_delete], sender=Membership)
+def refresh_membership_names_for_membership(sender, **kwargs):
+	releaser_ids = [kwargs['instance'].member_id, kwargs['instance'].group_id]
+	transaction.on_commit(lambda: MembershipName.refresh(releaser_ids))
+
+
+@receiver([post_save, post_delete], sender=NickVariant)
+def refresh_membership_names_for_nick_variant(sender, **kwargs):
+	# look up the releaser now: if the variant is being deleted along with its nick,
+	# the nick will be gone by the time the transaction commits
+	releaser_ids = list(Nick.objects.filter(id=kwargs['instance'].nick_id).values_list('releaser_id', flat=True))
+	transaction.on_commit(lambda: MembershipName.refresh(releaser_ids))
+
+
 class AccountProfile(models.Model):
 	user = models.ForeignKey(User, unique=True)
 	demozoo0_id = models.IntegerField(null=True, blank=True, verbose_name='Demozoo v0 ID')
@@ -624,6 +719,49 @@ class Edit(models.Model):
 		]
 
 
+@receiver(post_save, sender=Edit)
+def invalidate_fragments_for_edit(sender, **kwargs):
+	# edits made through forms (including changes to many-to-many relations, which don't
+	# trigger post_save) are all logged, so this catches anything the save signals miss
+	if not fragment_cache.is_enabled() or kwargs.get('raw'):
+		return
+
+	edit = kwargs['instance']
+	for content_type_id, object_id in [
+		(edit.focus_content_type_id, edit.focus_object_id),
+		(edit.focus2_content_type_id, edit.focus2_object_id),
+	]:
+		if content_type_id and object_id:
+			model = ContentType.objects.get_for_id(content_type_id).model_class()
+			fragment_cache.invalidate(list(model._default_manager.filter(pk=object_id)))
+
+
+def releaser_fragment_dependencies(releaser_ids):
+	"""
+	Return a list of (model, ids) pairs for the objects whose cached page fragments
+	(see demoscene.utils.fragment_cache) display any of the given releasers
+	"""
+	from productions.models import Production, Credit, production_fragment_dependencies
+
+	releaser_ids = set(releaser_ids)
+	production_ids = set(Production.author_nicks.through.objects.filter(nick__releaser_id__in=releaser_ids).values_list('production_id', flat=True))
+	production_ids.update(Production.author_affiliation_nicks.through.objects.filter(nick__releaser_id__in=releaser_ids).values_list('production_id', flat=True))
+	production_ids.update(Credit.objects.filter(nick__releaser_id__in=releaser_ids).values_list('production_id', flat=True))
+
+	return [(Releaser, releaser_ids)] + production_fragment_dependencies(production_ids)
+
+
+fragment_cache.register(Releaser, lambda releasers: releaser_fragment_dependencies(
+	[releaser.id for releaser in releasers]
+))
+fragment_cache.register(Nick, lambda nicks: releaser_fragment_dependencies(
+	[nick.releaser_id for nick in nicks]
+))
+fragment_cache.register(Membership, lambda memberships: [
+	(Releaser, [membership.member_id for membership in memberships] + [membership.group_id for membership in memberships]),
+])
+
+
 class CaptchaQuestion(models.Model):
 	question = models.TextField(help_text="HTML is allowed. Keep questions factual and simple - remember that our potential users are not always followers of mainstream demoparty culture")
 	answer = models.CharField(max_length=255, help_text="Answers are not case sensitive (the correct answer will be accepted regardless of capitalisation)")
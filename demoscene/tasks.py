@@ -1,9 +1,10 @@
 from celery.task import task
 from django.db import connection
 import random
+import time
 from itertools import groupby
 
-from parties.models import Party
+from parties.models import Party, ResultsFile
 from sceneorg.models import File
 
 @task(rate_limit = '6/m', ignore_result = True)
@@ -13,14 +14,96 @@ def add_sceneorg_results_file_to_party(party_id, file_id):
 	party.add_sceneorg_file_as_results_file(file)
 
 
-def find_sceneorg_results_files(callback=None):
-	parties = Party.objects.filter(results_files__isnull = True)
-	for party in parties:
-		file = party.sceneorg_results_file()
-		if file:
-			add_sceneorg_results_file_to_party.delay(party.id, file.id)
-			if callback:
-				callback(party)
+# number of results files to fetch from scene.org in one add_sceneorg_results_files_to_parties task
+RESULTS_FILE_BATCH_SIZE = 10
+
+# pause between fetches from the scene.org FTP server within a task
+RESULTS_FILE_FETCH_INTERVAL = 10
+
+# one task per 100 seconds, each fetching up to RESULTS_FILE_BATCH_SIZE files at
+# RESULTS_FILE_FETCH_INTERVAL apart: 6 fetches a minute, as one-file-per-task did at 6/m
+@task(rate_limit = '36/h', ignore_result = True)
+def add_sceneorg_results_files_to_parties(matches):
+	# matches is a list of (party_id, file_id) pairs, as returned by find_sceneorg_results_file_matches
+	parties = Party.objects.in_bulk([party_id for party_id, file_id in matches])
+	files = File.objects.in_bulk([file_id for party_id, file_id in matches])
+	# skip parties that have gained a results file since the task was queued
+	parties_with_results = set(
+		ResultsFile.objects.filter(party_id__in=parties.keys()).values_list('party_id', flat=True)
+	)
+
+	for i, (party_id, file_id) in enumerate(matches):
+		if party_id not in parties or file_id not in files or party_id in parties_with_results:
+			continue
+		if i > 0:
+			# be gentle with the scene.org FTP server
+			time.sleep(RESULTS_FILE_FETCH_INTERVAL)
+		parties[party_id].add_sceneorg_file_as_results_file(files[file_id])
+
+
+def find_sceneorg_results_file_matches(since=None, party_ids=None):
+	"""
+	Return a list of (party_id, file_id) pairs for parties without results files which have a
+	results.txt file in one of their linked scene.org directories, choosing the same file as
+	Party.sceneorg_results_file. If `since` is given, only parties where one of those
+	candidate files has first been seen at or after that time are considered; if `party_ids`
+	is given, only those parties are.
+	"""
+	params = []
+	extra_conditions = ''
+	if party_ids is not None:
+		if not party_ids:
+			return []
+		extra_conditions += '''
+			AND link.party_id IN %s
+		'''
+		params.append(tuple(party_ids))
+	if since is not None:
+		extra_conditions += '''
+			AND link.party_id IN (
+				SELECT new_link.party_id
+				FROM sceneorg_file AS new_file
+				CROSS JOIN subpaths AS new_subpath
+				INNER JOIN parties_partyexternallink AS new_link ON (
+					new_link.link_class = 'SceneOrgFolder'
+					AND new_file.path = new_link.parameter || new_subpath.name
+				)
+				WHERE new_file.first_seen_at >= %s AND NOT new_file.is_deleted
+			)
+		'''
+		params.append(since)
+
+	cursor = connection.cursor()
+	cursor.execute('''
+		WITH subpaths (priority, name) AS (
+			VALUES (0, 'info/results.txt'), (1, 'misc/results.txt'), (2, 'results.txt')
+		)
+		SELECT DISTINCT ON (link.party_id) link.party_id, file.id
+		FROM parties_partyexternallink AS link
+		CROSS JOIN subpaths AS subpath
+		INNER JOIN sceneorg_file AS file ON (
+			file.path = link.parameter || subpath.name AND NOT file.is_deleted
+		)
+		WHERE link.link_class = 'SceneOrgFolder'
+		AND NOT EXISTS (
+			SELECT 1 FROM parties_resultsfile WHERE parties_resultsfile.party_id = link.party_id
+		)
+		%s
+		ORDER BY link.party_id, link.id, subpath.priority
+	''' % extra_conditions, params)
+	return cursor.fetchall()
+
+
+def find_sceneorg_results_files(callback=None, since=None, party_ids=None):
+	matches = find_sceneorg_results_file_matches(since=since, party_ids=party_ids)
+
+	for i in range(0, len(matches), RESULTS_FILE_BATCH_SIZE):
+		add_sceneorg_results_files_to_parties.delay(matches[i:i + RESULTS_FILE_BATCH_SIZE])
+
+	if callback and matches:
+		parties = Party.objects.in_bulk([party_id for party_id, file_id in matches])
+		for party_id, file_id in matches:
+			callback(parties[party_id])
 
 
 @task(ignore_result=True)
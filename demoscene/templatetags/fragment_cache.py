@@ -0,0 +1,57 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+
+from demoscene.utils import fragment_cache
+
+register = template.Library()
+
+
+class CachedFragmentNode(template.Node):
+	def __init__(self, nodelist, name, objects):
+		self.nodelist = nodelist
+		self.name = name
+		self.objects = objects
+
+	def render(self, context):
+		request = context.get('request')
+		# fragments for logged-in users include per-user edit controls and CSRF tokens
+		if not fragment_cache.is_enabled() or request is None or request.user.is_authenticated():
+			return self.nodelist.render(context)
+
+		objects, values = [], []
+		for arg in self.objects:
+			value = arg.resolve(context)
+			if hasattr(value, '_meta'):
+				objects.append(value)
+			else:
+				values.append(value)
+
+		key = fragment_cache.fragment_key(
+			self.name.resolve(context), objects,
+			# read-only mode changes the edit controls shown to anonymous users
+			settings.SITE_IS_WRITEABLE, *values
+		)
+		content = cache.get(key)
+		if content is None:
+			content = self.nodelist.render(context)
+			cache.set(key, content, settings.FRAGMENT_CACHE_TIMEOUT)
+		return content
+
+
+@register.tag
+def cachedfragment(parser, token):
+	"""
+	Usage: {% cachedfragment "name" object1 object2 ... %} ... {% endcachedfragment %}
+
+	For anonymous users, cache the enclosed content against the current versions of the given
+	objects, as tracked by demoscene.utils.fragment_cache. Arguments that are not model instances
+	(such as a page number) are included in the cache key as they are.
+	"""
+	bits = token.split_contents()
+	if len(bits) < 3:
+		raise template.TemplateSyntaxError("'%s' tag requires a fragment name and at least one object" % bits[0])
+
+	nodelist = parser.parse(('endcachedfragment',))
+	parser.delete_first_token()
+	return CachedFragmentNode(nodelist, parser.compile_filter(bits[1]), [parser.compile_filter(bit) for bit in bits[2:]])
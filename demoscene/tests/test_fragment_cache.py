@@ -0,0 +1,75 @@
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, RequestFactory
+from django.test.utils import override_settings
+
+from demoscene.models import Releaser, Edit
+from demoscene.utils import fragment_cache
+
+
+@override_settings(FRAGMENT_CACHE_TIMEOUT=60)
+class TestCachedFragmentTag(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.releaser = Releaser(id=123, name="Gasman", is_group=False)
+		self.template = Template('{% load fragment_cache %}{% cachedfragment "name" releaser %}{{ releaser.name }}{% endcachedfragment %}')
+
+	def render(self, user):
+		request = RequestFactory().get('/')
+		request.user = user
+		return self.template.render(Context({'request': request, 'releaser': self.releaser}))
+
+	def test_anonymous_users_get_cached_fragment(self):
+		self.assertEqual(self.render(AnonymousUser()), "Gasman")
+		self.releaser.name = "Shingebis"
+		self.assertEqual(self.render(AnonymousUser()), "Gasman")
+
+		# a new version of the object invalidates the fragment
+		cache.set(fragment_cache.version_key(Releaser, 123), fragment_cache.new_version() + 1)
+		self.assertEqual(self.render(AnonymousUser()), "Shingebis")
+
+	def test_logged_in_users_bypass_cache(self):
+		self.assertEqual(self.render(AnonymousUser()), "Gasman")
+		self.releaser.name = "Shingebis"
+		self.assertEqual(self.render(User(username='bob')), "Shingebis")
+
+	def test_non_model_arguments_vary_key(self):
+		template = Template('{% load fragment_cache %}{% cachedfragment "name" releaser request.GET.page %}{{ releaser.name }} {{ request.GET.page }}{% endcachedfragment %}')
+		for page in ['1', '2']:
+			request = RequestFactory().get('/', {'page': page})
+			request.user = AnonymousUser()
+			self.assertEqual(template.render(Context({'request': request, 'releaser': self.releaser})), "Gasman %s" % page)
+
+
+# versions are replaced in on_commit hooks, which only run when a transaction really commits
+@override_settings(FRAGMENT_CACHE_TIMEOUT=60)
+class TestFragmentInvalidation(TransactionTestCase):
+	def setUp(self):
+		cache.clear()
+		self.releaser = Releaser.objects.create(name="Gasman", is_group=False)
+		self.template = Template('{% load fragment_cache %}{% cachedfragment "name" releaser %}{{ releaser.name }}{% endcachedfragment %}')
+
+	def render(self):
+		request = RequestFactory().get('/')
+		request.user = AnonymousUser()
+		releaser = Releaser.objects.get(id=self.releaser.id)
+		return self.template.render(Context({'request': request, 'releaser': releaser}))
+
+	def test_save_invalidates_fragment(self):
+		self.assertEqual(self.render(), "Gasman")
+
+		self.releaser.name = "Shingebis"
+		self.releaser.save()
+		self.assertEqual(self.render(), "Shingebis")
+
+	def test_edit_invalidates_fragment(self):
+		self.assertEqual(self.render(), "Gasman")
+
+		# change the name without sending signals, as an edit to a many-to-many relation would
+		Releaser.objects.filter(id=self.releaser.id).update(name="Shingebis")
+		self.assertEqual(self.render(), "Gasman")
+
+		user = User.objects.create_user(username='bob')
+		Edit.objects.create(action_type='edit_releaser', focus=self.releaser, description="Renamed", user=user)
+		self.assertEqual(self.render(), "Shingebis")
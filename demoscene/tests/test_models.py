@@ -2,10 +2,10 @@ from __future__ import unicode_literals
 
 import datetime
 
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 
 from demoscene.models import Releaser, Nick
-from productions.models import Production
+from productions.models import MemberProduction, Production
 
 
 class TestReleaser(TestCase):
@@ -48,6 +48,14 @@ class TestReleaser(TestCase):
 			'/groups/%d/' % self.hooy_program.id
 		)
 
+	def test_all_names_string(self):
+		self.assertEqual(self.gasman.all_names_string, "Gasman")
+
+		# with nick variants prefetched (as the search indexers do), no further queries are needed
+		gasman = Releaser.objects.prefetch_related('nicks__variants').get(id=self.gasman.id)
+		with self.assertNumQueries(0):
+			self.assertEqual(gasman.all_names_string, "Gasman")
+
 	def test_history_url(self):
 		self.assertEqual(
 			self.gasman.get_history_url(),
@@ -83,6 +91,8 @@ class TestReleaserProductions(TestCase):
 		)
 		fakeprod.author_nicks.add(fakescener.nicks.first())
 		fakeprod.author_affiliation_nicks.add(raww_arse.nicks.first())
+		# the closure table is refreshed on commit, which never happens within a TestCase
+		MemberProduction.refresh()
 
 		raww_arse_member_prods = sorted(
 			[prod.title for prod in raww_arse.member_productions()]
@@ -98,6 +108,55 @@ class TestReleaserProductions(TestCase):
 			["Fakeprod", "Laesq24 Giftro", "Madrielle"]
 		)
 
+	def test_get_member_productions_of_nested_subgroups(self):
+		raww_arse = Releaser.objects.get(name="Raww Arse")
+		papaya_dezign = Releaser.objects.get(name="Papaya Dezign")
+
+		# a subgroup of Papaya Dezign, which is itself a subgroup of Raww Arse
+		subsubgroup = Releaser.objects.create(name="Papaya Juniors", is_group=True)
+		subsubgroup.group_memberships.create(group=papaya_dezign)
+		prod = Production.objects.create(title="Pulped")
+		prod.author_nicks.add(subsubgroup.nicks.first())
+		MemberProduction.refresh()
+
+		self.assertIn("Pulped", [prod.title for prod in raww_arse.member_productions()])
+		self.assertIn("Pulped", [prod.title for prod in papaya_dezign.member_productions()])
+		self.assertNotIn("Pulped", [prod.title for prod in subsubgroup.member_productions()])
+
+
+# the closure table is refreshed in on_commit hooks, which only run when a transaction really commits
+class TestMemberProductionMaintenance(TransactionTestCase):
+	def setUp(self):
+		self.raww_arse = Releaser.objects.create(name="Raww Arse", is_group=True)
+		self.papaya_dezign = Releaser.objects.create(name="Papaya Dezign", is_group=True)
+		self.prod = Production.objects.create(title="Laesq24 Giftro")
+
+	def member_production_titles(self, group):
+		return [prod.title for prod in group.member_productions()]
+
+	def test_byline_changes(self):
+		self.prod.author_nicks.add(self.papaya_dezign.nicks.first())
+		self.assertIn("Laesq24 Giftro", self.member_production_titles(self.papaya_dezign))
+		self.assertNotIn("Laesq24 Giftro", self.member_production_titles(self.raww_arse))
+
+		self.prod.author_affiliation_nicks.add(self.raww_arse.nicks.first())
+		self.assertIn("Laesq24 Giftro", self.member_production_titles(self.raww_arse))
+
+		self.prod.author_nicks.clear()
+		self.prod.author_affiliation_nicks.clear()
+		self.assertNotIn("Laesq24 Giftro", self.member_production_titles(self.papaya_dezign))
+		self.assertNotIn("Laesq24 Giftro", self.member_production_titles(self.raww_arse))
+
+	def test_membership_changes(self):
+		self.prod.author_nicks.add(self.papaya_dezign.nicks.first())
+		self.assertNotIn("Laesq24 Giftro", self.member_production_titles(self.raww_arse))
+
+		membership = self.papaya_dezign.group_memberships.create(group=self.raww_arse)
+		self.assertIn("Laesq24 Giftro", self.member_production_titles(self.raww_arse))
+
+		membership.delete()
+		self.assertNotIn("Laesq24 Giftro", self.member_production_titles(self.raww_arse))
+
 
 class TestReleaserCredits(TestCase):
 	fixtures = ['tests/gasman.json']
@@ -0,0 +1,36 @@
+from __future__ import unicode_literals
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from demoscene.models import Releaser
+from demoscene.utils.nick_search import BylineSearch
+
+
+class TestBylineSearch(TestCase):
+	def setUp(self):
+		self.gasman = Releaser.objects.create(name="Gasman", is_group=False)
+		self.yerzmyey = Releaser.objects.create(name="Yerzmyey", is_group=False)
+
+		# long enough that the groups are shown by their abbreviations
+		for name, abbreviation in [("Hooy-Program", "H-Prg"), ("Raww Arse", "RA"), ("Papaya Dezign", "PD")]:
+			group = Releaser.objects.create(name=name, is_group=True)
+			nick = group.primary_nick
+			nick.abbreviation = abbreviation
+			nick.save()
+			self.gasman.group_memberships.create(group=group)
+			if name == "Hooy-Program":
+				self.yerzmyey.group_memberships.create(group=group)
+
+	def test_affiliations_are_abbreviated(self):
+		byline_search = BylineSearch("Gasman")
+		suggestion = byline_search.author_matches_data[0]['choices'][0]
+		self.assertEqual(suggestion['nameWithAffiliations'], "Gasman / H-Prg ^ PD ^ RA")
+
+	def test_query_count_does_not_depend_on_group_count(self):
+		with CaptureQueriesContext(connection) as one_group_queries:
+			BylineSearch("Yerzmyey / Hooy-Program").author_matches_data
+
+		with self.assertNumQueries(len(one_group_queries)):
+			BylineSearch("Gasman / Hooy-Program").author_matches_data
@@ -0,0 +1,112 @@
+"""
+Versioned cache of rendered template fragments (see the cachedfragment tag in
+demoscene.templatetags.fragment_cache).
+
+Each object that fragments are keyed on has a version number, held in the cache. Whenever an
+object is saved, deleted or has an Edit logged against it, the versions of every object whose
+fragments display it are replaced, so those fragments are re-rendered on the next request; the
+stale entries are never read again and simply expire.
+
+Models declare which objects display them with register(model, dependencies), where
+dependencies(instances) returns a list of (model, primary keys) pairs whose versions are to be
+replaced when any of the given instances change.
+
+Configured with the settings:
+ * FRAGMENT_CACHE_TIMEOUT: expiry time in seconds for cached fragments. 0 disables the cache.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+_dependencies = {}
+
+
+def is_enabled():
+	return bool(getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 0))
+
+
+def version_key(model, pk):
+	return 'fragment_version:%s:%s' % (model._meta.concrete_model._meta.label_lower, pk)
+
+
+def new_version():
+	# a timestamp rather than a counter, so that a version key which has been evicted
+	# can't come back with a number that was used before
+	return int(time.time() * 1000000)
+
+
+def get_versions(objects):
+	keys = [version_key(obj.__class__, obj.pk) for obj in objects]
+	versions = cache.get_many(keys)
+	for key in keys:
+		if key not in versions:
+			cache.add(key, new_version(), None)
+			versions[key] = cache.get(key)
+	return [versions[key] for key in keys]
+
+
+def fragment_key(name, objects, *vary_on):
+	"""Return the cache key for the fragment `name` rendered for the current versions of `objects`"""
+	versions = get_versions(objects)
+	params = [name] + [
+		(obj._meta.concrete_model._meta.label_lower, obj.pk, version)
+		for obj, version in zip(objects, versions)
+	] + list(vary_on)
+	return 'fragment:%s:%s' % (name, hashlib.sha1(repr(params)).hexdigest())
+
+
+def register(model, dependencies):
+	"""
+	Replace the versions of the objects returned by dependencies(instances) whenever instances
+	of `model` are saved or deleted, or have an Edit logged against them
+	"""
+	_dependencies[model] = dependencies
+
+	def handle_change(sender, **kwargs):
+		# objects loaded from fixtures may not have their related objects in place yet
+		if not kwargs.get('raw'):
+			invalidate([kwargs['instance']])
+
+	post_save.connect(handle_change, sender=model, weak=False)
+	post_delete.connect(handle_change, sender=model, weak=False)
+
+
+def invalidate(instances):
+	"""
+	Replace the versions of everything that displays the given model instances.
+	The dependencies are looked up immediately (so that deleted objects can still be followed to
+	the objects that displayed them), and the new versions are written once the transaction
+	has committed, so that fragments rendered in the meantime are not cached against them.
+	"""
+	if not is_enabled():
+		return
+
+	instances_by_model = {}
+	for instance in instances:
+		instances_by_model.setdefault(instance._meta.concrete_model, []).append(instance)
+
+	keys = set()
+	for model, model_instances in instances_by_model.iteritems():
+		if model in _dependencies:
+			for dependent_model, pks in _dependencies[model](model_instances):
+				keys.update(version_key(dependent_model, pk) for pk in pks if pk is not None)
+
+	_replace_versions(keys)
+
+
+def invalidate_objects(model, pks):
+	"""
+	Replace the versions of the given objects themselves (but not of anything that displays them),
+	once the transaction has committed
+	"""
+	if is_enabled():
+		_replace_versions(set(version_key(model, pk) for pk in pks if pk is not None))
+
+
+def _replace_versions(keys):
+	if keys:
+		transaction.on_commit(lambda: cache.set_many(dict((key, new_version()) for key in keys), None))
@@ -1,8 +1,17 @@
-from demoscene.models import NickVariant, Releaser, Nick
+from django.db import connection
+
+from demoscene.models import NickVariant, Releaser, Nick, Membership, MembershipName
+import copy
 import datetime
 import re
 
 
+SEPARATOR_CHARS = r"[\,\+\^\&]"
+
+# number of similar-looking names to suggest when there are no exact matches
+SIMILAR_NAME_LIMIT = 5
+
+
 # A placeholder for a Nick object, used as the cleaned value of a MatchedNickField
 # and the value MatchedNickWidget returns from value_from_datadict.
 # We can't use a Nick because we may not want to save it to the database yet (because
@@ -34,6 +43,29 @@ class NickSelection():
 			except Nick.DoesNotExist:
 				raise NickSelection.FailedToResolve("Tried to match the name '#{self.name}' to nick ID #{self.id} which does not exist")
 
+	@staticmethod
+	def commit_all(selections):
+		"""
+		Commit a list of NickSelections, returning the corresponding list of Nicks.
+		Existing nicks are looked up in a single query.
+		"""
+		existing_ids = [
+			int(selection.id) for selection in selections
+			if selection.id not in ('newscener', 'newgroup')
+		]
+		nicks_by_id = Nick.objects.in_bulk(existing_ids)
+
+		nicks = []
+		for selection in selections:
+			if selection.id in ('newscener', 'newgroup'):
+				nicks.append(selection.commit())
+			else:
+				try:
+					nicks.append(nicks_by_id[int(selection.id)])
+				except KeyError:
+					raise NickSelection.FailedToResolve("Tried to match the name '%s' to nick ID %s which does not exist" % (selection.name, selection.id))
+		return nicks
+
 	def __str__(self):
 		return self.name
 
@@ -61,38 +93,28 @@ class NickSearch():
 	def __init__(self, search_term, selection=None,
 		sceners_only=False, groups_only=False,
 		group_ids=[],
-		group_names=[], member_names=[]):
+		group_names=[], member_names=[],
+		nick_variants=None, similar_nick_variants=None, groups_by_releaser_id=None):
+		"""
+		nick_variants and groups_by_releaser_id may be passed in if they have already
+		been looked up (see BylineResolver); otherwise they are queried here.
+		similar_nick_variants are offered as suggestions when there are no exact
+		matches, and are only looked up by BylineResolver.
+		"""
 
 		self.search_term = search_term
 
-		nick_variants = NickVariant.autocompletion_search(
-			search_term, exact=True,
-			sceners_only=sceners_only, groups_only=groups_only,
-			group_ids=group_ids,
-			group_names=group_names, member_names=member_names)
-
-		self.suggestions = []
-
-		for nv in nick_variants:
-			suggestion = {
-				'className': ('group' if nv.nick.releaser.is_group else 'scener'),
-				'nameWithAffiliations': nv.nick.name_with_affiliations(),
-				'name': nv.nick.name,
-				'id': nv.nick_id
-			}
-			if nv.nick.releaser.country_code:
-				suggestion['countryCode'] = nv.nick.releaser.country_code.lower()
-
-			if nv.nick.differentiator:
-				suggestion['differentiator'] = nv.nick.differentiator
-				suggestion['nameWithDifferentiator'] = "%s (%s)" % (nv.nick.name, nv.nick.differentiator)
-			else:
-				suggestion['nameWithDifferentiator'] = nv.nick.name
+		if nick_variants is None:
+			nick_variants = list(NickVariant.autocompletion_search(
+				search_term, exact=True,
+				sceners_only=sceners_only, groups_only=groups_only,
+				group_ids=group_ids,
+				group_names=group_names, member_names=member_names))
 
-			if nv.nick.name != nv.name:
-				suggestion['alias'] = nv.name
-
-			self.suggestions.append(suggestion)
+		self.suggestions = [
+			self.suggestion_for_nick_variant(nv, groups_by_releaser_id)
+			for nv in (nick_variants or similar_nick_variants or [])
+		]
 
 		if not groups_only:
 			self.suggestions.append({
@@ -116,13 +138,40 @@ class NickSearch():
 			self.selection = selection
 		else:
 			# if there is a definite best-scoring nickvariant, select it
-			if nick_variants.count() == 0:
+			if len(nick_variants) == 0:
 				self.selection = None
-			elif nick_variants.count() == 1 or nick_variants[0].score > nick_variants[1].score:
+			elif len(nick_variants) == 1 or nick_variants[0].score > nick_variants[1].score:
 				self.selection = NickSelection(self.suggestions[0]['id'], self.suggestions[0]['nameWithDifferentiator'])
 			else:
 				self.selection = None
 
+	@staticmethod
+	def suggestion_for_nick_variant(nv, groups_by_releaser_id=None):
+		if groups_by_releaser_id is None:
+			name_with_affiliations = nv.nick.name_with_affiliations()
+		else:
+			name_with_affiliations = nv.nick.name_with_affiliations(groups_by_releaser_id.get(nv.nick.releaser_id, []))
+
+		suggestion = {
+			'className': ('group' if nv.nick.releaser.is_group else 'scener'),
+			'nameWithAffiliations': name_with_affiliations,
+			'name': nv.nick.name,
+			'id': nv.nick_id
+		}
+		if nv.nick.releaser.country_code:
+			suggestion['countryCode'] = nv.nick.releaser.country_code.lower()
+
+		if nv.nick.differentiator:
+			suggestion['differentiator'] = nv.nick.differentiator
+			suggestion['nameWithDifferentiator'] = "%s (%s)" % (nv.nick.name, nv.nick.differentiator)
+		else:
+			suggestion['nameWithDifferentiator'] = nv.nick.name
+
+		if nv.nick.name != nv.name:
+			suggestion['alias'] = nv.name
+
+		return suggestion
+
 	@property
 	def match_data(self):
 		return {
@@ -134,6 +183,160 @@ class NickSearch():
 		}
 
 
+class BylineResolver():
+	"""
+	Looks up candidate nick variants for all of the author and affiliation names in a byline
+	at once, in a fixed number of queries however many names there are. Authors are scored
+	by membership of groups with one of the affiliation names, and affiliations by having
+	members with one of the author names, as NickVariant.autocompletion_search does.
+	"""
+	SIMILAR_NAMES_SQL = '''
+		SELECT lookup.idx, matches.id, matches.similarity
+		FROM unnest(%s::text[], %s::boolean[]) WITH ORDINALITY AS lookup(name, groups_only, idx)
+		CROSS JOIN LATERAL (
+			SELECT demoscene_nickvariant.id,
+				similarity(LOWER(demoscene_nickvariant.name), LOWER(lookup.name)) AS similarity
+			FROM demoscene_nickvariant
+			INNER JOIN demoscene_nick ON (demoscene_nickvariant.nick_id = demoscene_nick.id)
+			INNER JOIN demoscene_releaser ON (demoscene_nick.releaser_id = demoscene_releaser.id)
+			WHERE LOWER(demoscene_nickvariant.name) %% LOWER(lookup.name)
+			AND (demoscene_releaser.is_group OR NOT lookup.groups_only)
+			ORDER BY similarity DESC
+			LIMIT %s
+		) AS matches
+	'''
+
+	def __init__(self, author_names, affiliation_names):
+		self.author_names = author_names
+		self.affiliation_names = affiliation_names
+
+		names = author_names + affiliation_names
+		groups_only = [False] * len(author_names) + [True] * len(affiliation_names)
+
+		# exact (case-insensitive) matches for all names
+		variants_by_name = {}
+		if names:
+			nick_variants = NickVariant.objects.extra(
+				where=["LOWER(demoscene_nickvariant.name) IN %s"],
+				params=[tuple(set(name.lower() for name in names))]
+			).select_related('nick__releaser')
+			for nv in nick_variants:
+				variants_by_name.setdefault(nv.name.lower(), []).append(nv)
+
+		candidates = []
+		for name, is_group in zip(names, groups_only):
+			# copy, as the same variant may be scored differently as an author and an affiliation
+			candidates.append([
+				copy.copy(nv) for nv in variants_by_name.get(name.lower(), [])
+				if nv.nick.releaser.is_group or not is_group
+			])
+
+		# similar names, for names with no exact matches
+		similar_candidates = [[] for name in names]
+		unmatched = [i for i, nick_variants in enumerate(candidates) if not nick_variants]
+		if unmatched:
+			cursor = connection.cursor()
+			cursor.execute(self.SIMILAR_NAMES_SQL, [
+				[names[i] for i in unmatched], [groups_only[i] for i in unmatched], SIMILAR_NAME_LIMIT
+			])
+			rows = cursor.fetchall()
+			nick_variants_by_id = NickVariant.objects.select_related('nick__releaser').in_bulk([row[1] for row in rows])
+			for idx, nick_variant_id, similarity in rows:
+				# copy, as the same variant may be suggested for several names
+				nv = copy.copy(nick_variants_by_id[nick_variant_id])
+				nv.similarity = similarity
+				similar_candidates[unmatched[idx - 1]].append(nv)
+
+		# membership scores for all candidates
+		releaser_ids = set(
+			nv.nick.releaser_id
+			for nick_variants in candidates + similar_candidates
+			for nv in nick_variants
+		)
+		author_scores = {}
+		affiliation_scores = {}
+		if releaser_ids and affiliation_names:
+			for member_id in MembershipName.objects.filter(
+				name_of='group', name__in=[name.lower() for name in affiliation_names],
+				member_id__in=releaser_ids
+			).values_list('member_id', flat=True):
+				author_scores[member_id] = author_scores.get(member_id, 0) + 1
+		if releaser_ids and author_names:
+			for group_id in MembershipName.objects.filter(
+				name_of='member', name__in=[name.lower() for name in author_names],
+				group_id__in=releaser_ids
+			).values_list('group_id', flat=True):
+				affiliation_scores[group_id] = affiliation_scores.get(group_id, 0) + 1
+
+		for is_group, exact_matches, similar_matches in zip(groups_only, candidates, similar_candidates):
+			scores = affiliation_scores if is_group else author_scores
+			for nv in exact_matches + similar_matches:
+				nv.score = scores.get(nv.nick.releaser_id, 0)
+				nv.is_primary_nickvariant = (nv.nick.name == nv.name)
+
+		for nick_variants in candidates:
+			nick_variants.sort(key=lambda nv: (-nv.score, -nv.is_primary_nickvariant, nv.name))
+		for nick_variants in similar_candidates:
+			nick_variants.sort(key=lambda nv: (-nv.score, -nv.similarity, -nv.is_primary_nickvariant, nv.name))
+
+		self.author_candidates = candidates[:len(author_names)]
+		self.affiliation_candidates = candidates[len(author_names):]
+		self.similar_author_candidates = similar_candidates[:len(author_names)]
+		self.similar_affiliation_candidates = similar_candidates[len(author_names):]
+
+		# current groups of all candidates, for their nameWithAffiliations; with their nicks,
+		# which Releaser.abbreviation looks at when the group names are long
+		self.groups_by_releaser_id = {}
+		if releaser_ids:
+			for membership in Membership.objects.filter(
+				member_id__in=releaser_ids, is_current=True
+			).select_related('group').prefetch_related('group__nicks').order_by('group__name'):
+				self.groups_by_releaser_id.setdefault(membership.member_id, []).append(membership.group)
+
+	@staticmethod
+	def existing_names(names, groups_only=False):
+		"""Return the subset of names that exactly (case-insensitively) match a nick variant"""
+		if not names:
+			return set()
+		nick_variants = NickVariant.objects.extra(
+			where=["LOWER(demoscene_nickvariant.name) IN %s"],
+			params=[tuple(set(name.lower() for name in names))]
+		)
+		if groups_only:
+			nick_variants = nick_variants.filter(nick__releaser__is_group=True)
+		return set(name.lower() for name in nick_variants.values_list('name', flat=True))
+
+	def nick_searches(self, author_nick_selections=[], affiliation_nick_selections=[]):
+		"""Return lists of NickSearch objects for the authors and affiliations"""
+		author_nick_searches = []
+		for (i, author_name) in enumerate(self.author_names):
+			try:
+				selection = author_nick_selections[i]
+			except IndexError:
+				selection = None
+			author_nick_searches.append(NickSearch(
+				author_name, selection,
+				nick_variants=self.author_candidates[i],
+				similar_nick_variants=self.similar_author_candidates[i],
+				groups_by_releaser_id=self.groups_by_releaser_id
+			))
+
+		affiliation_nick_searches = []
+		for (i, affiliation_name) in enumerate(self.affiliation_names):
+			try:
+				selection = affiliation_nick_selections[i]
+			except IndexError:
+				selection = None
+			affiliation_nick_searches.append(NickSearch(
+				affiliation_name, selection, groups_only=True,
+				nick_variants=self.affiliation_candidates[i],
+				similar_nick_variants=self.similar_affiliation_candidates[i],
+				groups_by_releaser_id=self.groups_by_releaser_id
+			))
+
+		return author_nick_searches, affiliation_nick_searches
+
+
 class BylineSearch():
 	def __init__(self, search_term,
 		author_nick_selections=[], affiliation_nick_selections=[],
@@ -154,10 +357,17 @@ class BylineSearch():
 
 		# Now, for any item in author_names or affiliation_names with an internal separator character,
 		# perform a pre-check for that name. If not present, split it and move on.
+		existing_author_names = BylineResolver.existing_names([
+			name.strip() for name in author_names if re.search(SEPARATOR_CHARS, name)
+		])
+		existing_affiliation_names = BylineResolver.existing_names([
+			name.strip() for name in affiliation_names if re.search(SEPARATOR_CHARS, name)
+		], groups_only=True)
+
 		vetted_author_names = []
 		for name in author_names:
-			if re.search(r"[\,\+\^\&]", name) and not NickVariant.objects.filter(name__iexact=name.strip()).exists():
-				for subname in re.split(r"[\,\+\^\&]", name):
+			if re.search(SEPARATOR_CHARS, name) and name.strip().lower() not in existing_author_names:
+				for subname in re.split(SEPARATOR_CHARS, name):
 					subname = subname.lstrip()
 					if subname:
 						vetted_author_names.append(subname)
@@ -166,8 +376,8 @@ class BylineSearch():
 
 		vetted_affiliation_names = []
 		for name in affiliation_names:
-			if re.search(r"[\,\+\^\&]", name) and not NickVariant.objects.filter(name__iexact=name.strip(), nick__releaser__is_group=True).exists():
-				for subname in re.split(r"[\,\+\^\&]", name):
+			if re.search(SEPARATOR_CHARS, name) and name.strip().lower() not in existing_affiliation_names:
+				for subname in re.split(SEPARATOR_CHARS, name):
 					subname = subname.lstrip()
 					if subname:
 						vetted_affiliation_names.append(subname)
@@ -197,26 +407,11 @@ class BylineSearch():
 		author_names = [name.strip() for name in author_names]
 		affiliation_names = [name.strip() for name in affiliation_names]
 
-		# construct a NickSearch for each element
-		self.author_nick_searches = []
-		for (i, author_name) in enumerate(author_names):
-			try:
-				selection = author_nick_selections[i]
-			except IndexError:
-				selection = None
-			self.author_nick_searches.append(
-				NickSearch(author_name, selection, group_names=affiliation_names)
-			)
-
-		self.affiliation_nick_searches = []
-		for (i, affiliation_name) in enumerate(affiliation_names):
-			try:
-				selection = affiliation_nick_selections[i]
-			except IndexError:
-				selection = None
-			self.affiliation_nick_searches.append(
-				NickSearch(affiliation_name, selection, groups_only=True, member_names=author_names)
-			)
+		# construct a NickSearch for each element, with all candidates looked up together
+		resolver = BylineResolver(author_names, affiliation_names)
+		self.author_nick_searches, self.affiliation_nick_searches = resolver.nick_searches(
+			author_nick_selections, affiliation_nick_selections
+		)
 
 		self.author_nick_selections = [nick_search.selection for nick_search in self.author_nick_searches]
 		self.affiliation_nick_selections = [nick_search.selection for nick_search in self.affiliation_nick_searches]
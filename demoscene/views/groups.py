@@ -39,7 +39,7 @@ def show(request, group_id):
 		'editing_members': (request.GET.get('editing') == 'members'),
 		'editing_subgroups': (request.GET.get('editing') == 'subgroups'),
 		'subgroupships': group.member_memberships.filter(member__is_group=True).select_related('member').defer('member__notes').order_by('-is_current', 'member__name'),
-		'member_productions': group.member_productions().select_related('default_screenshot').prefetch_related('author_nicks__releaser', 'author_affiliation_nicks__releaser', 'platforms', 'types').defer('notes', 'author_nicks__releaser__notes', 'author_affiliation_nicks__releaser__notes').order_by('-release_date_date', '-title'),
+		'member_productions': group.member_productions().select_related('default_screenshot').prefetch_related('platforms', 'types').defer('notes').order_by('-release_date_date', '-title'),
 		'external_links': external_links,
 	})
 
@@ -161,6 +161,16 @@ LOGIN_URL = '/account/login/'
 LOGIN_REDIRECT_URL = '/'
 
 DJAPIAN_DATABASE_PATH = os.path.join(FILEROOT, 'data', 'djapian')
+SEARCH_AUTOCOMPLETE_PATH = os.path.join(FILEROOT, 'data', 'autocomplete')
+
+# number of search result lists to cache per process; entries are invalidated by index commits
+DJAPIAN_RESULT_CACHE_SIZE = 1000
+# ...and their total size in bytes, as one broad search can hold thousands of hits
+DJAPIAN_RESULT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# on-disk cache of files fetched from the mirror bucket, shared between processes (see mirror/cache.py)
+MIRROR_CACHE_DIR = os.path.join(FILEROOT, 'data', 'mirror_cache')
+MIRROR_CACHE_MAX_SIZE = 1024 * 1024 * 1024
 
 DEFAULT_FILE_STORAGE = 's3boto.S3BotoStorage'
 
@@ -179,6 +189,22 @@ COMPRESS_PRECOMPILERS = (
 
 REDIS_URL = 'redis://localhost:6379/0'
 
+# wake the djapian index daemon through redis when objects change, rather than waiting for it to poll
+DJAPIAN_NOTIFY_REDIS_URL = REDIS_URL
+
+CACHES = {
+	'default': {
+		'BACKEND': 'django_redis.cache.RedisCache',
+		'LOCATION': 'redis://localhost:6379/2',
+		'KEY_PREFIX': 'demozoo',
+	}
+}
+
+# expiry time for rendered page fragments; they are invalidated by edits, so this only limits
+# how long changes made outside of the ORM (e.g. raw SQL updates) can take to appear.
+# See demoscene/utils/fragment_cache.py
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+
 # Celery settings
 import djcelery
 djcelery.setup_loader()
@@ -21,6 +21,9 @@ AWS_BOTO_CALLING_FORMAT = 'SubdomainCallingFormat'
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+# don't cache rendered page fragments, so that template changes show up immediately
+FRAGMENT_CACHE_TIMEOUT = 0
+
 INSTALLED_APPS = list(INSTALLED_APPS) + ['django_extensions']
 
 DEBUG_TOOLBAR_ENABLED = True  # set to False in local.py to disable
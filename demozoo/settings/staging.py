@@ -11,6 +11,7 @@ AWS_BOTO_FORCE_HTTP = True
 AWS_BOTO_CALLING_FORMAT = 'VHostCallingFormat'
 
 BROKER_URL = 'redis://localhost:6379/1'
+CACHES['default']['LOCATION'] = 'redis://localhost:6379/3'
 
 ALLOWED_HOSTS = ['localhost', 'staging.demozoo.org']
 
@@ -6,6 +6,14 @@ from StringIO import StringIO
 
 SECRET_KEY = 'BOOOOM'
 
+# tests can't rely on redis, and the cache would outlive each test's database transaction
+CACHES = {
+	'default': {
+		'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+	}
+}
+FRAGMENT_CACHE_TIMEOUT = 0
+
 
 # set up mock opener for urllib2
 
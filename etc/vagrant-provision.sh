@@ -13,7 +13,7 @@ apt-get update -y
 apt-get install -y python python-dev python-pip
 
 # PostgreSQL
-apt-get install -y postgresql libpq-dev
+apt-get install -y postgresql postgresql-contrib libpq-dev
 
 # libffi
 # (needed by bcrypt, which some old accounts still use as their password encryption method)
@@ -63,6 +63,9 @@ su - vagrant -c "ln -s /usr/lib/python2.7/dist-packages/xapian $VIRTUALENV_DIR/l
 # Create vagrant pgsql superuser
 su - postgres -c "createuser -s vagrant"
 
+# pg_trgm must be installed by a superuser before migrating (and in template1, for the test database)
+su - postgres -c "psql template1 -c 'CREATE EXTENSION IF NOT EXISTS pg_trgm'"
+
 # create database
 su - vagrant -c "createdb demozoo"
 
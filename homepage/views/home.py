@@ -20,18 +20,18 @@ def home(request):
 		default_screenshot__isnull=False, release_date_date__isnull=False
 	).only(
 		'id', 'title', 'release_date_date', 'release_date_precision', 'supertype',
-		'default_screenshot'
+		'default_screenshot', 'unparsed_byline', 'byline_cache'
 	).select_related(
 		'default_screenshot'
 	).prefetch_related(
-		'author_nicks', 'author_affiliation_nicks', 'platforms', 'types'
+		'platforms', 'types'
 	).order_by('-release_date_date', '-created_at')[:5]
 
 	one_year_ago = datetime.datetime.now() - datetime.timedelta(365)
 	latest_additions = Production.objects.exclude(
 		release_date_date__gte=one_year_ago
 	).prefetch_related(
-		'author_nicks', 'author_affiliation_nicks', 'platforms', 'types'
+		'platforms', 'types'
 	).order_by('-created_at')[:5]
 
 	comments = Comment.objects.select_related(
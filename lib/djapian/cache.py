@@ -0,0 +1,122 @@
+"""
+Cache of search results (hit lists, without model instances).
+
+Entries are keyed on the search parameters together with the generation of
+every database searched (see Database.get_generation), so committing to an
+index implicitly invalidates everything cached against it; stale entries
+simply age out.
+
+Configured with the settings:
+ * DJAPIAN_RESULT_CACHE_SIZE: maximum number of entries held in process
+   (LRU eviction). 0 disables the cache.
+ * DJAPIAN_RESULT_CACHE_MAX_BYTES: maximum total (pickled) size of the entries
+   held in process, since a single entry can hold every hit of a broad search.
+   Entries bigger than this are not cached.
+ * DJAPIAN_RESULT_CACHE_REDIS_URL: if set, entries are stored in Redis
+   instead, so that they are shared between processes.
+ * DJAPIAN_RESULT_CACHE_TIMEOUT: expiry time in seconds for Redis entries.
+"""
+import cPickle as pickle
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+class LocalCache(object):
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value, size = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            # re-insert to mark as most recently used
+            self._data[key] = (value, size)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._data[key] = (value, size)
+            self.size += size
+            while len(self._data) > self.max_entries or self.size > self.max_bytes:
+                self.size -= self._data.popitem(last=False)[1][1]
+
+    def _remove(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+class RedisCache(object):
+    prefix = 'djapian:results:'
+
+    def __init__(self, url, timeout):
+        import redis
+        self._redis = redis.StrictRedis.from_url(url)
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        data = self._redis.get(self.prefix + key)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(data)
+
+    def set(self, key, value):
+        self._redis.setex(self.prefix + key, self.timeout, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    def clear(self):
+        for key in self._redis.keys(self.prefix + '*'):
+            self._redis.delete(key)
+
+_cache = None
+
+def get_result_cache():
+    """Return the configured result cache, or None if caching is disabled"""
+    global _cache
+
+    if _cache is None:
+        redis_url = getattr(settings, 'DJAPIAN_RESULT_CACHE_REDIS_URL', None)
+        max_entries = getattr(settings, 'DJAPIAN_RESULT_CACHE_SIZE', 0)
+
+        if redis_url:
+            _cache = RedisCache(redis_url, getattr(settings, 'DJAPIAN_RESULT_CACHE_TIMEOUT', 3600))
+        elif max_entries:
+            _cache = LocalCache(
+                max_entries, getattr(settings, 'DJAPIAN_RESULT_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+            )
+        else:
+            _cache = False
+
+    return _cache or None
+
+def make_key(generation, *params):
+    """
+    Build a cache key from the databases' generation and the search parameters,
+    or return None if the generation is unknown (in which case nothing should be cached)
+    """
+    if generation is None:
+        return None
+    return hashlib.sha1(repr((generation,) + params)).hexdigest()
@@ -1,18 +1,113 @@
+import logging
 import os
+import shutil
+import threading
+import time
 import xapian
 
 from djapian.utils.decorators import reopen_if_modified
 
+# Read-only handles are kept open between searches (one pool per thread, since
+# Xapian handles must not be shared between threads) and reopened only when the
+# database's generation changes.
+_pool = threading.local()
+
+logger = logging.getLogger('djapian')
+
+# Open, reopen and reuse counts and cumulative open/reopen times, for all threads
+# in the process; a summary is logged every POOL_STATS_LOG_INTERVAL seconds
+POOL_STATS_LOG_INTERVAL = 300
+
+_pool_stats_lock = threading.Lock()
+_pool_stats = {
+    'opens': 0,
+    'reopens': 0,
+    'reuses': 0,
+    'open_time': 0.0,
+    'reopen_time': 0.0,
+}
+_pool_stats_logged_at = time.time()
+
+def record_pool_event(event, elapsed=None):
+    """
+    Count an 'open', 'reopen' or 'reuse' of a pooled handle, which took `elapsed`
+    seconds, and log the totals if they haven't been logged for a while
+    """
+    global _pool_stats_logged_at
+
+    with _pool_stats_lock:
+        _pool_stats[event + 's'] += 1
+        if elapsed is not None:
+            _pool_stats[event + '_time'] += elapsed
+
+        now = time.time()
+        if now - _pool_stats_logged_at < POOL_STATS_LOG_INTERVAL:
+            return
+        _pool_stats_logged_at = now
+        stats = dict(_pool_stats)
+
+    logger.info(
+        "Handle pool: %(opens)d opens (%(open_time).3fs), %(reopens)d reopens (%(reopen_time).3fs), %(reuses)d reuses",
+        stats
+    )
+
+def get_pool_stats():
+    """Return a copy of the handle pool statistics for this process"""
+    with _pool_stats_lock:
+        return dict(_pool_stats)
+
+def get_pooled_handle(key, identity, generation, open_handle):
+    """
+    Return a read-only handle for the database identified by `key`, reusing the
+    pooled one if its generation is unchanged, or reopening it if it still
+    refers to the same files on disk (`identity`). Otherwise `open_handle` is
+    called to open a new one.
+    """
+    handles = _pool.__dict__.setdefault('handles', {})
+    entry = handles.get(key)
+
+    if entry is not None:
+        handle, pooled_identity, pooled_generation = entry
+
+        # with an unknown generation there is no telling whether the handle is
+        # current, so it is reopened every time
+        if generation is not None and generation == pooled_generation:
+            record_pool_event('reuse')
+            return handle
+
+        if identity == pooled_identity:
+            start_time = time.time()
+            try:
+                handle.reopen()
+            except xapian.Error:
+                # e.g. the database was cleared and recreated; open it afresh below
+                pass
+            else:
+                record_pool_event('reopen', time.time() - start_time)
+                handles[key] = (handle, identity, generation)
+                return handle
+
+    start_time = time.time()
+    handle = open_handle()
+    record_pool_event('open', time.time() - start_time)
+    handles[key] = (handle, identity, generation)
+    return handle
+
+def clear_pool():
+    """Drop this thread's pooled handles, so that the next search opens new ones"""
+    _pool.__dict__.pop('handles', None)
+
 class Database(object):
     def __init__(self, path):
         self._path = path
 
-    def open(self, write=False):
+    def open(self, write=False, generation=None):
         """
-        Opens database for manipulations
+        Opens database for manipulations. `generation` may be passed if it has
+        already been found for this search, to save looking it up again
         """
         if not os.path.exists(self._path):
-            os.makedirs(self._path)
+            self._make_linked_directory()
 
         if write:
             database = xapian.WritableDatabase(
@@ -20,15 +115,26 @@ class Database(object):
                 xapian.DB_CREATE_OR_OPEN,
             )
         else:
-            try:
-                database = xapian.Database(self._path)
-            except xapian.DatabaseOpeningError:
-                self.create_database()
-
-                database = xapian.Database(self._path)
+            database = get_pooled_handle(
+                self._path,
+                os.path.realpath(self._path),
+                generation or self.get_generation(),
+                self._open_read_only
+            )
 
         return database
 
+    def _open_read_only(self):
+        if not os.path.exists(self._path):
+            self._make_linked_directory()
+
+        try:
+            return xapian.Database(self._path)
+        except xapian.DatabaseOpeningError:
+            self.create_database()
+
+            return xapian.Database(self._path)
+
     def create_database(self):
         database = xapian.WritableDatabase(
             self._path,
@@ -36,11 +142,42 @@ class Database(object):
         )
         del database
 
+    # Files rewritten by every commit: the version file of a glass database,
+    # and the alternating base files of a chert database's record table
+    GENERATION_FILES = ('iamglass', 'record.baseA', 'record.baseB')
+
+    def get_generation(self):
+        """
+        Return a value that changes whenever the database is committed to, derived
+        from the path and the files that every commit rewrites; or None if that
+        can't be determined (no such files exist, as with other backends or a
+        database not yet created), in which case nothing should be cached against it
+        """
+        path = os.path.realpath(self._path)
+        generation = []
+        for name in self.GENERATION_FILES:
+            try:
+                stat = os.stat(os.path.join(path, name))
+            except OSError:
+                continue
+            generation.append((name, stat.st_ino, stat.st_mtime, stat.st_size))
+
+        if not generation:
+            return None
+        return (path,) + tuple(generation)
+
     def document_count(self):
         database = self.open()
         return reopen_if_modified(database)(lambda: database.get_doccount())()
 
     def clear(self):
+        if os.path.islink(self._path):
+            # installed by replace_with; remove the link and the directory it points to
+            target = os.path.realpath(self._path)
+            os.remove(self._path)
+            shutil.rmtree(target, ignore_errors=True)
+            return
+
         try:
             for file_path in os.listdir(self._path):
                 os.remove(os.path.join(self._path, file_path))
@@ -49,22 +186,96 @@ class Database(object):
         except OSError:
             pass
 
+    def _get_versioned_path(self):
+        return '%s.%d' % (self._path, int(time.time() * 1000))
+
+    def _link_to(self, versioned_path):
+        """
+        Point the live path at `versioned_path` by renaming a new symlink over it,
+        which replaces an existing symlink atomically
+        """
+        link_path = self._path + '.link'
+        if os.path.lexists(link_path):
+            os.remove(link_path)
+        os.symlink(os.path.basename(versioned_path), link_path)
+        os.rename(link_path, self._path)
+
+    def _make_linked_directory(self):
+        """
+        Create the live path as a symlink to an empty versioned directory, so that
+        replace_with can later swap in a new database atomically
+        """
+        parent = os.path.dirname(self._path)
+        if parent and not os.path.exists(parent):
+            os.makedirs(parent)
+
+        versioned_path = self._get_versioned_path()
+        os.makedirs(versioned_path)
+        try:
+            self._link_to(versioned_path)
+        except OSError:
+            # lost a race with another process creating the database
+            shutil.rmtree(versioned_path, ignore_errors=True)
+            if not os.path.exists(self._path):
+                raise
+
+    def replace_with(self, new_path):
+        """
+        Make the database at `new_path` the live database for this path.
+
+        The live path is a symlink to a versioned directory (see
+        _make_linked_directory), and is switched to the new version by renaming a
+        new symlink over it, so readers always find a complete database.
+
+        Indexes created before databases were kept behind a symlink are plain
+        directories; a directory can't be atomically replaced by a symlink, so it
+        is moved to a versioned path and linked back first. Readers find the
+        same database throughout, apart from between those two renames.
+        """
+        if os.path.exists(self._path) and not os.path.islink(self._path):
+            legacy_path = self._get_versioned_path()
+            os.rename(self._path, legacy_path)
+            self._link_to(legacy_path)
+
+        old_path = os.path.realpath(self._path) if os.path.islink(self._path) else None
+
+        versioned_path = self._get_versioned_path()
+        os.rename(new_path, versioned_path)
+        self._link_to(versioned_path)
+
+        if old_path:
+            shutil.rmtree(old_path, ignore_errors=True)
+
 class CompositeDatabase(Database):
     def __init__(self, dbs):
         self._dbs = dbs
 
-    def open(self, write=False):
+    def open(self, write=False, generation=None):
         if write:
             raise ValueError("Composite database cannot be opened for writing")
 
-        base = self._dbs[0]
-        raw = base.open()
+        return get_pooled_handle(
+            tuple(db._path for db in self._dbs),
+            tuple(os.path.realpath(db._path) for db in self._dbs),
+            generation or self.get_generation(),
+            self._open_read_only
+        )
+
+    def _open_read_only(self):
+        # open the components afresh, rather than adding to their pooled handles
+        raw = self._dbs[0]._open_read_only()
 
         for db in self._dbs[1:]:
-            raw.add_database(db.open())
+            raw.add_database(db._open_read_only())
 
         return raw
 
+    def get_generation(self):
+        generations = tuple(db.get_generation() for db in self._dbs)
+        if None in generations:
+            return None
+        return generations
+
     def create_database(self):
         raise NotImplementedError
 
@@ -0,0 +1,111 @@
+"""
+Facets: attributes of indexed objects that results can be counted by and
+narrowed down to, without going back to the database.
+
+An indexer declares facets as (name, path, value number) tuples. For each
+document, the facet's values are stored:
+ * in the given value slot (several values are joined with commas), which a
+   ValueCountMatchSpy tallies to produce facet counts;
+ * as boolean terms, used to filter results on an exact facet value.
+
+Single-valued facets can also be filtered on a range of values
+(`year__range=(1990, 1999)`), which is applied as a value range query. Numbers
+are stored zero-padded so that they sort correctly as strings.
+
+An indexer with `count_facets = False` stores only the boolean terms. This is
+for indexes searched together with another one in a CombinedResultSet: their
+documents can be filtered by facet value (but not by range), without being
+counted a second time by the spies.
+"""
+from django.utils.encoding import smart_str
+
+import xapian
+
+VALUE_SEPARATOR = ','
+
+def serialise(value):
+    if isinstance(value, bool):
+        return value and 't' or 'f'
+    if isinstance(value, (int, long)):
+        return '%04d' % value
+    return smart_str(value)
+
+class FacetField(object):
+    def __init__(self, name, path, number):
+        self.name = name
+        self.path = path
+        self.number = number
+
+    def resolve(self, obj):
+        """Return the list of serialised values of this facet for `obj`"""
+        value = obj
+        for bit in self.path.split('.'):
+            value = getattr(value, bit)
+            if callable(value):
+                value = value()
+
+        if value is None:
+            return []
+        if not isinstance(value, (list, tuple, set)):
+            value = [value]
+        return [serialise(item) for item in value]
+
+    def term(self, value):
+        return 'XF%s:%s' % (self.name.upper(), serialise(value))
+
+    def index(self, doc, obj, with_value=True):
+        values = self.resolve(obj)
+        if values:
+            if with_value:
+                doc.add_value(self.number, VALUE_SEPARATOR.join(values))
+            for value in values:
+                doc.add_term(self.term(value), 0)
+
+def get_facet(indexer, name):
+    facet = indexer.get_facet(name)
+    if facet is None:
+        raise ValueError("Unknown facet '%s'" % name)
+    return facet
+
+def apply_filters(indexer, query, filters):
+    """
+    Restrict `query` to documents matching `filters`, a dict of facet name to
+    value (or list of alternative values), or of `<name>__range` to a (low, high) tuple
+    """
+    for key, value in sorted((filters or {}).items()):
+        if key.endswith('__range'):
+            facet = get_facet(indexer, key[:-len('__range')])
+            low, high = value
+            query = xapian.Query(
+                xapian.Query.OP_FILTER, query,
+                xapian.Query(xapian.Query.OP_VALUE_RANGE, facet.number, serialise(low), serialise(high))
+            )
+        else:
+            facet = get_facet(indexer, key)
+            if not isinstance(value, (list, tuple)):
+                value = [value]
+            query = xapian.Query(
+                xapian.Query.OP_FILTER, query,
+                xapian.Query(xapian.Query.OP_OR, [facet.term(v) for v in value])
+            )
+    return query
+
+def create_spies(indexer, names):
+    return dict(
+        (name, xapian.ValueCountMatchSpy(get_facet(indexer, name).number))
+        for name in names
+    )
+
+def read_spies(spies):
+    """
+    Return a dict of facet name to a list of (value, count) pairs, most frequent first.
+    Multi-valued entries are split so that each value is counted separately.
+    """
+    counts = {}
+    for name, spy in spies.iteritems():
+        facet_counts = {}
+        for item in spy.values():
+            for value in item.term.split(VALUE_SEPARATOR):
+                facet_counts[value] = facet_counts.get(value, 0) + item.termfreq
+        counts[name] = sorted(facet_counts.items(), key=lambda pair: (-pair[1], pair[0]))
+    return counts
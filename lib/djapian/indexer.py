@@ -1,13 +1,16 @@
 import datetime
+import logging
+import time
+from contextlib import contextmanager
 
-from django.db import models
+from django.db import models, connection
 from django.utils.itercompat import is_iterable
 from django.conf import settings
 from django.utils.encoding import smart_str
 
-from . import decider
+from . import decider, facets
 from .database import CompositeDatabase
-from .resultset import ResultSet
+from .resultset import ResultSet, CombinedResultSet
 from .utils.paging import paginate
 from .utils.commiter import Commiter
 from .utils.decorators import reopen_if_modified
@@ -15,6 +18,26 @@ from .utils import DEFAULT_WEIGHT, model_name
 
 import xapian
 
+logger = logging.getLogger('djapian')
+
+@contextmanager
+def count_queries(enabled=True):
+    """
+    Yield a function returning the number of database queries run so far in the
+    block; if not `enabled`, queries are not logged and it always returns 0
+    """
+    if not enabled:
+        yield lambda: 0
+        return
+
+    force_debug_cursor = connection.force_debug_cursor
+    connection.force_debug_cursor = True
+    initial_count = len(connection.queries_log)
+    try:
+        yield lambda: len(connection.queries_log) - initial_count
+    finally:
+        connection.force_debug_cursor = force_debug_cursor
+
 class Field(object):
     raw_types = (int, long, float, basestring, bool, models.Model,
                  datetime.time, datetime.date, datetime.datetime)
@@ -109,7 +132,14 @@ class Indexer(object):
 
     fields = []
     tags = []
+    # (name, path, value number) tuples; see djapian.facets
+    facets = []
+    # if False, facets are indexed for filtering but not counting
+    count_facets = True
     aliases = {}
+    # relations to prefetch (as for QuerySet.prefetch_related) for each page of
+    # objects being indexed, so that resolving fields does not query per object
+    prefetch_related = []
     trigger = lambda indexer, obj: True
     stemming_lang_accessor = None
     stemmer_class = xapian.Stem
@@ -157,6 +187,9 @@ class Indexer(object):
             self.tags.append(self.field_class(path, self._model, weight, prefix=tag, number=valueno))
             valueno += 1
 
+        for name, path, number in self.__class__.facets:
+            self.facets.append(facets.FacetField(name, path, number))
+
         for tag, aliases in self.__class__.aliases.iteritems():
             if self.has_tag(tag):
                 if not isinstance(aliases, (list, tuple)):
@@ -182,6 +215,11 @@ class Indexer(object):
             if field.prefix == name:
                 return field.number
 
+    def get_facet(self, name):
+        for facet in self.facets:
+            if facet.name == name:
+                return facet
+
     def get_stemmer(self, stemming_lang):
         """
         Return a stemmer instance for the requested stemming language.
@@ -203,7 +241,7 @@ class Indexer(object):
 
     # Public Indexer interface
 
-    def update(self, documents=None, after_index=None, per_page=10000, commit_each=False):
+    def update(self, documents=None, after_index=None, per_page=10000, commit_each=False, verbose=False):
         """
         Update the database with the documents.
         There are some default value and terms in a document:
@@ -227,6 +265,9 @@ class Indexer(object):
         else:
             update_queue = documents
 
+        if self.prefetch_related and isinstance(update_queue, models.query.QuerySet):
+            update_queue = update_queue.prefetch_related(*self.prefetch_related)
+
         commiter = Commiter.create(commit_each)(
             lambda: database.begin_transaction(flush=True),
             database.commit_transaction,
@@ -235,60 +276,77 @@ class Indexer(object):
 
         # Get each document received
         for page in paginate(update_queue, per_page):
-            try:
-                commiter.begin_page()
-
-                for obj in page.object_list:
-                    commiter.begin_object()
-
-                    try:
-                        if not self.trigger(obj):
-                            self.delete(obj.pk, database)
-                            continue
-
-                        doc = xapian.Document()
-
-                        # Add default terms and values
-                        uid = self._create_uid(obj)
-                        doc.add_term(self._create_uid(obj))
-                        self._insert_meta_values(doc, obj)
-
-                        generator = xapian.TermGenerator()
-                        generator.set_database(database)
-                        generator.set_document(doc)
-                        generator.set_flags(xapian.TermGenerator.FLAG_SPELLING)
-
-                        stemming_lang = self._get_stem_language(obj)
-                        if stemming_lang:
-                            stemmer = self.get_stemmer(stemming_lang)
-                            generator.set_stemmer(stemmer)
-
-                            stopper = self.get_stopper(stemming_lang)
-                            if stopper:
-                                generator.set_stopper(stopper)
+            start_time = time.time()
 
-                        # Get a weight for the object
-                        obj_weight = self._get_object_weight(obj)
-                        # Index fields
-                        self._do_index_fields(doc, generator, obj, obj_weight)
-
-                        database.replace_document(uid, doc)
-                        if after_index:
-                            after_index(obj)
-
-                        commiter.commit_object()
-                    except Exception:
-                        commiter.cancel_object()
-                        raise
-
-                commiter.commit_page()
-            except Exception:
-                commiter.cancel_page()
-                raise
+            with count_queries(enabled=verbose) as query_count:
+                try:
+                    commiter.begin_page()
+
+                    for obj in page.object_list:
+                        commiter.begin_object()
+
+                        try:
+                            if not self.trigger(obj):
+                                self.delete(obj.pk, database)
+                                continue
+
+                            doc = xapian.Document()
+
+                            # Add default terms and values
+                            uid = self._create_uid(obj)
+                            doc.add_term(self._create_uid(obj))
+                            self._insert_meta_values(doc, obj)
+
+                            generator = xapian.TermGenerator()
+                            generator.set_database(database)
+                            generator.set_document(doc)
+                            generator.set_flags(xapian.TermGenerator.FLAG_SPELLING)
+
+                            stemming_lang = self._get_stem_language(obj)
+                            if stemming_lang:
+                                stemmer = self.get_stemmer(stemming_lang)
+                                generator.set_stemmer(stemmer)
+
+                                stopper = self.get_stopper(stemming_lang)
+                                if stopper:
+                                    generator.set_stopper(stopper)
+
+                            # Get a weight for the object
+                            obj_weight = self._get_object_weight(obj)
+                            # Index fields
+                            self._do_index_fields(doc, generator, obj, obj_weight)
+                            for facet in self.facets:
+                                facet.index(doc, obj, with_value=self.count_facets)
+
+                            database.replace_document(uid, doc)
+                            if after_index:
+                                after_index(obj)
+
+                            commiter.commit_object()
+                        except Exception:
+                            commiter.cancel_object()
+                            raise
+
+                    commiter.commit_page()
+                except Exception:
+                    commiter.cancel_page()
+                    raise
+
+            if verbose:
+                logger.info(
+                    "%s: indexed %d objects in %.2fs with %d queries",
+                    self, len(page.object_list), time.time() - start_time, query_count()
+                )
 
     def search(self, query):
         return ResultSet(self, query)
 
+    def combined_search(self, secondary, query):
+        """
+        Search this indexer and `secondary` in a single pass; see CombinedResultSet
+        """
+        return CombinedResultSet(self, secondary, query)
+
     def delete(self, obj, database=None):
         """
         Delete a document from index
@@ -318,6 +376,7 @@ class Indexer(object):
 
         self.fields = [] # Simple text fields
         self.tags = [] # Prefixed fields
+        self.facets = []
         self.aliases = {}
 
     def _get_meta_values(self, obj):
@@ -340,13 +399,18 @@ class Indexer(object):
         return "UID-" + "-".join(map(smart_str, self._get_meta_values(obj)))
 
     def _do_search(self, query, offset, limit, order_by, flags, stemming_lang,
-                   filter, exclude, collapse_by, stopper):
+                   filter, exclude, collapse_by, stopper, facet_filters=None, spies=None,
+                   generation=None):
         """
         flags are as defined in the Xapian API :
         http://www.xapian.org/docs/apidoc/html/classXapian_1_1QueryParser.html
         Combine multiple values with bitwise-or (|).
+
+        facet_filters restricts the results as described in djapian.facets, and
+        spies is a list of match spies to be applied to every matching document.
+        generation is the database generation, if already known.
         """
-        database = self._db.open()
+        database = self._db.open(generation=generation)
         enquire = xapian.Enquire(database)
 
         if order_by is None or order_by[0] in (None, 'RELEVANCE'):
@@ -381,7 +445,7 @@ class Indexer(object):
 
         query, query_parser = self._parse_query(query, database, flags, stemming_lang, stopper)
         enquire.set_query(
-            query
+            facets.apply_filters(self, query, facet_filters)
         )
 
         decider = self.decider(self._model, self.tags, filter, exclude)
@@ -389,8 +453,15 @@ class Indexer(object):
         if limit is None:
             limit = self.document_count()
 
+        check_at_least = 0
+        if spies:
+            # spies only see the documents that are checked, so check them all
+            check_at_least = self.document_count()
+            for spy in spies:
+                enquire.add_matchspy(spy)
+
         return reopen_if_modified(database)(
-            lambda: enquire.get_mset(offset, limit, None, decider)
+            lambda: enquire.get_mset(offset, limit, check_at_least, None, decider)
         )(), query, query_parser
 
     def _get_stem_language(self, obj=None):
@@ -505,3 +576,14 @@ class CompositeIndexer(Indexer):
     def tag_index(self, name):
         return reduce(lambda a, b: a == b and a or None,
                       [indexer.tag_index(name) for indexer in self._indexers])
+
+    def get_facet(self, name):
+        found = [
+            indexer.get_facet(name) for indexer in self._indexers
+            if indexer.get_facet(name) is not None
+        ]
+        if not found:
+            return None
+        if len(set(facet.number for facet in found)) > 1:
+            raise ValueError("Facet `%s` uses different value numbers across indexers" % name)
+        return found[0]
@@ -1,150 +1,38 @@
 from django.core.management.base import BaseCommand, CommandError
 from django.core.exceptions import ImproperlyConfigured
-from django.db import models, transaction
-from django.contrib.contenttypes.models import ContentType
+from django.db import models
 
-import os
+import logging
 import sys
-import operator
-import time
-from datetime import datetime
 from optparse import make_option
 
 from djapian.daemonize import become_daemon
-from djapian.models import Change
+from djapian.notifier import ChangeNotifier
+from djapian.rebuild import parallel_rebuild
+from djapian.worker import IndexWorker
 from djapian import utils
-from djapian.utils.paging import paginate
-from djapian.utils.commiter import Commiter
 from djapian import IndexSpace
 
-def get_content_types(app_models, *actions):
-    lookup_args = dict(action__in=actions)
-    if app_models is not None:
-        ct_list = [ContentType.objects.get_for_model(model) for model in app_models]
-        lookup_args.update(dict(content_type__in=ct_list))
-    types = Change.objects.filter(models.Q(**lookup_args))\
-                    .values_list('content_type', flat=True)\
-                    .distinct()
-    return ContentType.objects.filter(pk__in=types)
-
-def get_indexers(content_type):
-    return reduce(
-        operator.add,
-        [space.get_indexers_for_model(content_type.model_class())
-            for space in IndexSpace.instances]
+def update_changes(verbose, timeout, once, per_page, app_models=None):
+    worker = IndexWorker(
+        batch_size=per_page,
+        verbose=verbose,
+        app_models=app_models,
+        notifier=ChangeNotifier.from_settings()
     )
 
+    if once:
+        worker.run_once()
+    else:
+        worker.run_forever(timeout)
 
-# Forcibly throw exceptions which would otherwise be swallowed up by transaction.commit_manually.
-# see http://metak4ml.blogspot.com/2011/05/django-transactioncommitmanually-mask.html
-def transact(func):
-    """
-    Usage:
-    @transaction.commit_manually
-    @transact
-    def some_function(a, b):
-        do_something()
-    """
-    def decorated(*args, **kwargs):
-        import traceback
-        try:
-            func(*args, **kwargs)
-        except Exception:
-            traceback.print_exc()
-            sys.exit()
-    return decorated
-
-
-@transact
-def update_changes(verbose, timeout, once, per_page, commit_each, app_models=None):
-    transaction.set_autocommit(False)
-    counter = [0]
-
-    def reset_counter():
-        counter[0] = 0
+def rebuild(verbose, per_page, commit_each, app_models=None, processes=1):
+    if not commit_each:
+        # build into a new database and swap it in, so searches keep working
+        # and changes made in the meantime are applied afterwards
+        parallel_rebuild(processes, per_page, verbose, app_models)
+        return
 
-    def after_index(obj):
-        counter[0] += 1
-
-        if verbose:
-            sys.stdout.write('.')
-            sys.stdout.flush()
-
-    commiter = Commiter.create(commit_each)(
-        lambda: None,
-        transaction.commit,
-        transaction.rollback
-    )
-
-    while True:
-        count = Change.objects.count()
-        if count > 0 and verbose:
-            print 'There are %d objects to update' % count
-
-        for ct in get_content_types(app_models, 'add', 'edit'):
-            indexers = get_indexers(ct)
-
-            for page in paginate(
-                            Change.objects.filter(content_type=ct, action__in=('add', 'edit'))\
-                                .select_related('content_type')\
-                                .order_by('object_id'),
-                            per_page
-                        ):# The objects must be sorted by date
-                commiter.begin_page()
-
-                try:
-                    for indexer in indexers:
-                        indexer.update(
-                            ct.model_class()._default_manager.filter(
-                                pk__in=[c.object_id for c in page.object_list]
-                            ).order_by('pk'),
-                            after_index,
-                            per_page,
-                            commit_each
-                        )
-
-                    for change in page.object_list:
-                        change.delete()
-
-                    commiter.commit_page()
-                except Exception:
-                    if commit_each:
-                        for change in page.object_list[:counter[0]]:
-                            change.delete()
-                        commiter.commit_object()
-                    else:
-                        commiter.cancel_page()
-                    raise
-
-                reset_counter()
-
-        for ct in get_content_types(app_models, 'delete'):
-            indexers = get_indexers(ct)
-
-            for change in Change.objects.filter(content_type=ct, action='delete'):
-                for indexer in indexers:
-                    indexer.delete(change.object_id)
-                change.delete()
-
-        # If using transactions and running Djapian as a daemon, transactions
-        # need to be committed on each iteration, otherwise Djapian will not
-        # catch changes. We also need to use the commit_manually decorator.
-        #
-        # Background information:
-        #
-        # Autocommit is turned off by default according to PEP 249.
-        # PEP 249 states "Database modules that do not support transactions
-        #                 should implement this method with void functionality".
-        # Consistent Nonlocking Reads (InnoDB):
-        # http://dev.mysql.com/doc/refman/5.0/en/innodb-consistent-read-example.html
-        transaction.commit()
-
-        if once:
-            break
-
-        time.sleep(timeout)
-
-def rebuild(verbose, per_page, commit_each, app_models=None):
     def after_index(obj):
         if verbose:
             sys.stdout.write('.')
@@ -155,7 +43,7 @@ def rebuild(verbose, per_page, commit_each, app_models=None):
             if app_models is None or model in app_models:
                 for indexer in indexers:
                     indexer.clear()
-                    indexer.update(None, after_index, per_page, commit_each)
+                    indexer.update(None, after_index, per_page, commit_each, verbose=verbose)
 
 class Command(BaseCommand):
     option_list = BaseCommand.option_list + (
@@ -170,17 +58,22 @@ class Command(BaseCommand):
                     help='Run update loop indefinetely'),
         make_option('--time-out', dest='timeout', default=10,
                     action='store', type='int',
-                    help='Time to sleep between each query to the'
-                         ' database (default: %default)'),
+                    help='Time to wait for a change notification before'
+                         ' polling the database (default: %default)'),
         make_option('--rebuild', dest='rebuild_index', default=False,
                     action='store_true',
                     help='Rebuild index database'),
         make_option('--per_page', dest='per_page', default=1000,
                     action='store', type='int',
-                    help='Working page size'),
+                    help='Number of objects to index per Xapian commit'),
         make_option('--commit_each', dest='commit_each', default=False,
                     action='store_true',
-                    help='Commit/flush changes on every document update'),
+                    help='Commit/flush changes on every document update,'
+                         ' rebuilding in place (rebuild only)'),
+        make_option('--processes', dest='processes', default=1,
+                    action='store', type='int',
+                    help='Rebuild in parallel with this many processes, each'
+                         ' writing a shard of the index (default: %default)'),
     )
     help = 'This is the Djapian daemon used to update the index based on djapian_change table.'
 
@@ -195,9 +88,18 @@ class Command(BaseCommand):
         rebuild_index = options['rebuild_index']
         per_page = options['per_page']
         commit_each = options['commit_each']
+        processes = options['processes']
 
         utils.load_indexes()
 
+        if verbose:
+            # the worker and indexer report progress through the djapian logger
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger = logging.getLogger('djapian')
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+
         if make_daemon:
             become_daemon()
 
@@ -209,18 +111,18 @@ class Command(BaseCommand):
             for app in app_list:
                 app_models = models.get_models(app, include_auto_created=True)
                 if rebuild_index:
-                    rebuild(verbose, per_page, commit_each, app_models)
+                    rebuild(verbose, per_page, commit_each, app_models, processes)
                 else:
                     update_changes(verbose, timeout,
                                    not (loop or make_daemon),
-                                   per_page, commit_each, app_models)
+                                   per_page, app_models)
         else:
             if rebuild_index:
-                rebuild(verbose, per_page, commit_each)
+                rebuild(verbose, per_page, commit_each, processes=processes)
             else:
                 update_changes(verbose, timeout,
                                not (loop or make_daemon),
-                               per_page, commit_each)
+                               per_page)
 
         if verbose:
             print '\n'
@@ -0,0 +1,57 @@
+"""
+Wake-up notifications for the index worker.
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger('djapian')
+
+class ChangeNotifier(object):
+    """
+    Wakes the index worker when a Change is recorded, using a single-item Redis
+    list as a doorbell (BLPOP supports a timeout, so the worker still falls back
+    on polling if a notification is lost). Enabled by setting DJAPIAN_NOTIFY_REDIS_URL.
+    """
+    key = 'djapian:changes'
+
+    def __init__(self, url):
+        import redis
+        self._redis = redis.StrictRedis.from_url(url)
+
+    @classmethod
+    def from_settings(cls):
+        url = getattr(settings, 'DJAPIAN_NOTIFY_REDIS_URL', None)
+        if url:
+            return cls(url)
+
+    def notify(self):
+        pipe = self._redis.pipeline()
+        pipe.lpush(self.key, '1')
+        pipe.ltrim(self.key, 0, 0)
+        pipe.execute()
+
+    def wait(self, timeout):
+        self._redis.blpop([self.key], timeout)
+        # several notifications may have arrived; one run will handle them all
+        self._redis.delete(self.key)
+
+_notifier = None
+
+def notify_change():
+    """Ring the doorbell once the current transaction commits; never fails the caller"""
+    global _notifier
+
+    def notify():
+        global _notifier
+        try:
+            if _notifier is None:
+                _notifier = ChangeNotifier.from_settings() or False
+            if _notifier:
+                _notifier.notify()
+        except Exception:
+            logger.exception("Failed to notify index worker")
+
+    if getattr(settings, 'DJAPIAN_NOTIFY_REDIS_URL', None):
+        transaction.on_commit(notify)
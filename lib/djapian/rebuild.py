@@ -0,0 +1,143 @@
+"""
+Parallel rebuild of indexes.
+
+Each indexer's model is split into contiguous pk ranges of roughly equal size,
+and a pool of processes indexes one range each into its own shard database.
+The shards are then compacted into a single database, which is swapped in for
+the live one (see Database.replace_with).
+
+While an indexer is being rebuilt its work directory exists (see
+is_rebuilding), and the index worker leaves changes to its model in the
+Change queue instead of writing them to the database that is about to be
+replaced. They are applied to the new database once it has been swapped in,
+so edits made during the rebuild are not lost.
+"""
+import copy
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+
+from django.apps import apps
+from django.db import connections
+
+import xapian
+
+from djapian.database import Database
+from djapian.space import IndexSpace
+from djapian.utils import model_name
+
+def get_rebuild_path(indexer):
+    return indexer._db._path + '.rebuild'
+
+def is_rebuilding(indexer):
+    return os.path.exists(get_rebuild_path(indexer))
+
+def partition_pks(queryset, parts):
+    """
+    Split the pks of `queryset` into at most `parts` (lowest, highest) ranges
+    containing roughly the same number of objects
+    """
+    pks = list(queryset.order_by('pk').values_list('pk', flat=True))
+    if not pks:
+        return []
+
+    size = -(-len(pks) // parts)  # ceiling division
+    return [
+        (pks[i], pks[min(i + size, len(pks)) - 1])
+        for i in range(0, len(pks), size)
+    ]
+
+def get_indexer(space_index, label, indexer_index):
+    model = apps.get_model(*label.split('.'))
+    return IndexSpace.instances[space_index].get_indexers()[model][indexer_index]
+
+def shard_indexer(indexer, path):
+    """Return a copy of `indexer` that writes to the database at `path`"""
+    indexer = copy.copy(indexer)
+    indexer._db = Database(path)
+    return indexer
+
+def build_shard(args):
+    space_index, label, indexer_index, shard_path, lowest_pk, highest_pk, per_page, verbose = args
+
+    # connections inherited from the parent process must not be shared
+    connections.close_all()
+
+    indexer = get_indexer(space_index, label, indexer_index)
+    queryset = indexer._model._default_manager.filter(
+        pk__gte=lowest_pk, pk__lte=highest_pk
+    ).order_by('pk')
+    shard_indexer(indexer, shard_path).update(queryset, per_page=per_page, verbose=verbose)
+    return shard_path
+
+def compact(source_paths, output_path):
+    """Merge the databases at `source_paths` into a new database at `output_path`"""
+    if hasattr(xapian.Database, 'compact'):
+        # Xapian >= 1.3
+        database = xapian.Database(source_paths[0])
+        for path in source_paths[1:]:
+            database.add_database(xapian.Database(path))
+        database.compact(output_path)
+    else:
+        subprocess.check_call(['xapian-compact'] + list(source_paths) + [output_path])
+
+def rebuild_indexer(pool, processes, space_index, model, indexer_index, per_page, verbose):
+    indexer = IndexSpace.instances[space_index].get_indexers()[model][indexer_index]
+    work_path = get_rebuild_path(indexer)
+    shutil.rmtree(work_path, ignore_errors=True)
+    os.makedirs(work_path)
+
+    try:
+        queryset = model._default_manager.all()
+        ranges = partition_pks(queryset, processes)
+
+        if verbose:
+            print "Indexing %s with %s in %d shards" % (model_name(model), indexer, len(ranges))
+
+        label = model_name(model)
+        shard_paths = pool.map(build_shard, [
+            (space_index, label, indexer_index, os.path.join(work_path, 'shard-%d' % i), lowest, highest, per_page, verbose)
+            for i, (lowest, highest) in enumerate(ranges)
+        ])
+
+        output_path = os.path.join(work_path, 'merged')
+        if shard_paths:
+            compact(shard_paths, output_path)
+        else:
+            Database(output_path).create_database()
+
+        # index anything created since we partitioned the pk range
+        if ranges:
+            created_since = queryset.filter(pk__gt=ranges[-1][1])
+        else:
+            created_since = queryset
+        shard_indexer(indexer, output_path).update(created_since.order_by('pk'), per_page=per_page)
+
+        indexer._db.replace_with(output_path)
+    finally:
+        # lets the index worker apply the changes queued up during the rebuild
+        shutil.rmtree(work_path, ignore_errors=True)
+
+    if verbose:
+        sys.stdout.write('.')
+        sys.stdout.flush()
+
+def parallel_rebuild(processes, per_page, verbose=False, app_models=None):
+    # forked workers must open their own database connections
+    connections.close_all()
+    pool = multiprocessing.Pool(processes)
+
+    try:
+        for space_index, space in enumerate(IndexSpace.instances):
+            for model, indexers in space.get_indexers().iteritems():
+                if app_models is None or model in app_models:
+                    for indexer_index in range(len(indexers)):
+                        rebuild_indexer(
+                            pool, processes, space_index, model, indexer_index,
+                            per_page, verbose
+                        )
+    finally:
+        pool.close()
+        pool.join()
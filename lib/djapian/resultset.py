@@ -6,14 +6,22 @@ from itertools import imap
 from django.apps import apps
 from django.utils.encoding import force_unicode
 
-from djapian import utils, decider
+from djapian import utils, decider, facets
+from djapian.cache import get_result_cache, make_key
 from djapian.utils.decorators import retry_if_except
 
+def get_indexer_descriptors(indexer):
+    """Identify an indexer, or the components of a CompositeIndexer, for cache keys"""
+    return tuple(
+        component.get_descriptor() for component in getattr(indexer, '_indexers', [indexer])
+    )
+
 class ResultSet(object):
     def __init__(self, indexer, query_str, offset=0, limit=None,
                  order_by=None, prefetch=False, flags=None, stemming_lang=None,
                  filter=None, exclude=None, prefetch_select_related=False,
-                 collapse_by=None, instances=False, stopper=None):
+                 collapse_by=None, instances=False, stopper=None,
+                 facet_filters=None, facet_names=None):
         self._indexer = indexer
         self._query_str = query_str
         self._offset = offset
@@ -33,11 +41,15 @@ class ResultSet(object):
         self._flags = flags
         self._stemming_lang = stemming_lang
         self._stopper = stopper
+        self._facet_filters = facet_filters or {}
+        self._facet_names = facet_names or ()
 
         self._resultset_cache = None
+        self._spies = None
         self._mset = None
         self._query = None
         self._query_parser = None
+        self._generation = None
 
     # Public methods that produce another ResultSet
 
@@ -88,6 +100,24 @@ class ResultSet(object):
         clone._add_exclude_fields(fields, raw_fields)
         return clone
 
+    def facet_filter(self, **filters):
+        """Narrow the results by facet values; see djapian.facets"""
+        facet_filters = dict(self._facet_filters)
+        facet_filters.update(filters)
+        return self._clone(facet_filters=facet_filters)
+
+    def facets(self, *names):
+        """Request counts of the given facets, to be read with get_facet_counts()"""
+        return self._clone(facet_names=tuple(self._facet_names) + names)
+
+    def get_facet_counts(self):
+        """
+        Return a dict of facet name to (value, count) pairs over all matching
+        documents, for the facets requested with facets()
+        """
+        self._get_mset()
+        return facets.read_spies(self._spies)
+
     def best_match(self):
         return self._clone()[0]
 
@@ -162,6 +192,8 @@ class ResultSet(object):
             "flags": self._flags,
             "stemming_lang": self._stemming_lang,
             "stopper": self._stopper,
+            "facet_filters": dict(self._facet_filters),
+            "facet_names": self._facet_names,
             "filter": deepcopy(self._filter),
             "exclude": deepcopy(self._exclude),
         }
@@ -201,6 +233,7 @@ class ResultSet(object):
 
     def _get_mset(self):
         if self._mset is None:
+            self._spies = facets.create_spies(self._indexer, self._facet_names)
             self._mset, self._query, self._query_parser = self._indexer._do_search(
                 self._query_str,
                 self._offset,
@@ -212,14 +245,53 @@ class ResultSet(object):
                 self._exclude,
                 self._collapse_by,
                 self._stopper,
+                self._facet_filters,
+                self._spies.values(),
+                self._generation,
             )
 
+    def _get_cache_key(self):
+        if self._stopper is not None:
+            # stoppers have no stable representation to key on
+            return None
+
+        # looked up once, and reused when the database is opened for the search
+        self._generation = self._indexer._db.get_generation()
+        return make_key(
+            self._generation,
+            'resultset',
+            get_indexer_descriptors(self._indexer),
+            self._query_str,
+            self._offset,
+            self._limit,
+            self._order_by,
+            self._flags,
+            self._stemming_lang,
+            str(self._filter),
+            str(self._exclude),
+            self._collapse_by,
+            sorted(self._facet_filters.items()),
+        )
+
     def _fetch_results(self):
         if self._resultset_cache is None:
-            # self._parse_results() may raise DatabaseModifiedError exception,
-            # thus we have to repeat retrieving of the whole MSet again
-            retry_if_except(xapian.DatabaseModifiedError)(
-                lambda: (self._get_mset(), self._parse_results()))()
+            cache = get_result_cache()
+            key = cache and self._get_cache_key()
+            cached = key and cache.get(key)
+
+            if cached is not None:
+                self._resultset_cache = [Hit.from_tuple(data) for data in cached]
+            else:
+                # self._parse_results() may raise DatabaseModifiedError exception,
+                # thus we have to repeat retrieving of the whole MSet again
+                retry_if_except(xapian.DatabaseModifiedError)(
+                    lambda: (self._get_mset(), self._parse_results()))()
+
+                if key:
+                    cache.set(key, [hit.as_tuple() for hit in self._resultset_cache])
+
+            if self._prefetch:
+                self._do_prefetch()
 
         return self._resultset_cache
 
@@ -255,9 +327,6 @@ class ResultSet(object):
                 Hit(pk, model, percent, rank, weight, tags, collapse_count, collapse_key)
             )
 
-        if self._prefetch:
-            self._do_prefetch()
-
     def __iter__(self):
         self._fetch_results()
         if self._instances:
@@ -318,7 +387,280 @@ class Hit(object):
 
     instance = property(get_instance, set_instance)
 
+    def as_tuple(self):
+        """Return the hit's data (without the instance) in a form that can be cached"""
+        return (
+            self.pk, utils.model_name(self.model), self.percent, self.rank, self.weight,
+            self.tags, self.collapse_count, self.collapse_key
+        )
+
+    @classmethod
+    def from_tuple(cls, data):
+        pk, model, percent, rank, weight, tags, collapse_count, collapse_key = data
+        return cls(
+            pk, apps.get_model(*model.split('.')), percent, rank, weight,
+            dict(tags), collapse_count, collapse_key
+        )
+
     def __repr__(self):
         return "<Hit: model=%s pk=%s, percent=%s rank=%s weight=%s>" % (
             utils.model_name(self.model), self.pk, self.percent, self.rank, self.weight
         )
+
+class CombinedResultSet(object):
+    """
+    Runs one query against two indexers in a single Enquire over all of their
+    databases, and splits the matches into two groups: hits from the `primary`
+    indexer, and hits from the `secondary` indexer for objects that are not
+    already among the primary hits.
+
+    Model instances are fetched once per (model, pk) and only for the hits that
+    are actually accessed, so the secondary group can be paginated without
+    loading the whole result list.
+
+    Facet filters apply to both groups, so the primary indexer must index the
+    facets too (usually with count_facets = False; see djapian.facets).
+    """
+    def __init__(self, primary, secondary, query_str, flags=None,
+                 stemming_lang=None, prefetch=False, facet_filters=None,
+                 facet_names=None):
+        self._primary = primary
+        self._secondary = secondary
+        self._query_str = query_str
+
+        if flags is None:
+            flags = xapian.QueryParser.FLAG_PHRASE\
+                        | xapian.QueryParser.FLAG_BOOLEAN\
+                        | xapian.QueryParser.FLAG_LOVEHATE
+        self._flags = flags
+        self._stemming_lang = stemming_lang
+        self._prefetch = prefetch
+        self._facet_filters = facet_filters or {}
+        self._facet_names = facet_names or ()
+
+        self._primary_hits = None
+        self._secondary_hits = None
+        self._facet_counts = None
+        self._instances = {}
+        self._generation = None
+
+        # used (along with _stemming_lang) by highlight_snippet
+        self._indexer = secondary
+
+    def _clone(self, **kwargs):
+        data = {
+            "primary": self._primary,
+            "secondary": self._secondary,
+            "query_str": self._query_str,
+            "flags": self._flags,
+            "stemming_lang": self._stemming_lang,
+            "prefetch": self._prefetch,
+            "facet_filters": dict(self._facet_filters),
+            "facet_names": self._facet_names,
+        }
+        data.update(kwargs)
+
+        return CombinedResultSet(**data)
+
+    def prefetch(self):
+        return self._clone(prefetch=True)
+
+    def facet_filter(self, **filters):
+        """Narrow both groups of results by facet values; see djapian.facets"""
+        facet_filters = dict(self._facet_filters)
+        facet_filters.update(filters)
+        return self._clone(facet_filters=facet_filters)
+
+    def facets(self, *names):
+        """Request counts of the given facets, to be read with get_facet_counts()"""
+        return self._clone(facet_names=tuple(self._facet_names) + names)
+
+    def get_facet_counts(self):
+        """
+        Return a dict of facet name to (value, count) pairs for the facets
+        requested with facets(). They are tallied in the same pass as the hits,
+        and only documents with facet values are counted - normally those of
+        the secondary indexer, which also matches the objects found by name.
+        """
+        self._fetch_results()
+        return self._facet_counts
+
+    def get_parsed_query_terms(self):
+        query_parser = self._secondary._get_query_parser(self._stemming_lang)
+        query_parser.set_stemming_strategy(xapian.QueryParser.STEM_ALL)
+        return query_parser.parse_query(self._query_str)
+
+    def primary(self):
+        self._fetch_results()
+        return CombinedHitList(self, self._primary_hits)
+
+    def secondary(self):
+        self._fetch_results()
+        return CombinedHitList(self, self._secondary_hits)
+
+    # Private methods
+
+    def _get_indexers(self, indexer):
+        return list(getattr(indexer, '_indexers', [indexer]))
+
+    def _get_dbs(self, indexer):
+        return [component._db for component in self._get_indexers(indexer)]
+
+    def _get_database(self):
+        from djapian.database import CompositeDatabase
+
+        return CompositeDatabase(
+            self._get_dbs(self._primary) + self._get_dbs(self._secondary)
+        )
+
+    def _get_cache_key(self):
+        # looked up once, and reused when the database is opened for the search
+        self._generation = self._get_database().get_generation()
+        return make_key(
+            self._generation,
+            'combined',
+            get_indexer_descriptors(self._primary),
+            get_indexer_descriptors(self._secondary),
+            self._query_str,
+            self._flags,
+            self._stemming_lang,
+            sorted(self._facet_filters.items()),
+            self._facet_names,
+        )
+
+    def _fetch_results(self):
+        if self._primary_hits is None:
+            cache = get_result_cache()
+            key = cache and self._get_cache_key()
+            cached = key and cache.get(key)
+
+            if cached is not None:
+                primary, secondary, self._facet_counts = cached
+                self._primary_hits = [Hit.from_tuple(data) for data in primary]
+                self._secondary_hits = [Hit.from_tuple(data) for data in secondary]
+            else:
+                retry_if_except(xapian.DatabaseModifiedError)(self._parse_results)()
+
+                if key:
+                    cache.set(key, (
+                        [hit.as_tuple() for hit in self._primary_hits],
+                        [hit.as_tuple() for hit in self._secondary_hits],
+                        self._facet_counts,
+                    ))
+
+    def _parse_results(self):
+        database = self._get_database().open(generation=self._generation)
+
+        query, query_parser = self._primary._parse_query(
+            self._query_str, database, self._flags, self._stemming_lang
+        )
+        enquire = xapian.Enquire(database)
+        enquire.set_sort_by_relevance()
+        enquire.set_query(facets.apply_filters(self._secondary, query, self._facet_filters))
+
+        spies = facets.create_spies(self._secondary, self._facet_names)
+        for spy in spies.itervalues():
+            enquire.add_matchspy(spy)
+
+        doccount = database.get_doccount()
+        mset = enquire.get_mset(0, doccount, doccount)
+        self._facet_counts = facets.read_spies(spies)
+
+        primary_indexers = dict(
+            (indexer.get_descriptor(), indexer) for indexer in self._get_indexers(self._primary)
+        )
+        secondary_indexers = dict(
+            (indexer.get_descriptor(), indexer) for indexer in self._get_indexers(self._secondary)
+        )
+
+        primary_hits = []
+        candidate_hits = []
+        for match in mset:
+            doc = match.document
+            descriptor = doc.get_value(3)
+
+            if descriptor in primary_indexers:
+                indexer = primary_indexers[descriptor]
+                hits = primary_hits
+            elif descriptor in secondary_indexers:
+                indexer = secondary_indexers[descriptor]
+                hits = candidate_hits
+            else:
+                continue
+
+            model = apps.get_model(*doc.get_value(2).split('.'))
+            pk = model._meta.pk.to_python(doc.get_value(1))
+            tags = dict([(tag.prefix, tag.extract(doc)) for tag in indexer.tags])
+
+            hits.append(Hit(
+                pk, model, match.percent, match.rank, match.weight, tags,
+                match.collapse_count or None, match.collapse_key or None
+            ))
+
+        primary_keys = set((hit.model, hit.pk) for hit in primary_hits)
+
+        self._primary_hits = primary_hits
+        self._secondary_hits = [
+            hit for hit in candidate_hits if (hit.model, hit.pk) not in primary_keys
+        ]
+
+    def _do_prefetch(self, hits):
+        """
+        Attach model instances to the given hits, fetching only those that
+        have not already been fetched, and return the hits whose object still exists
+        """
+        model_map = {}
+
+        for hit in hits:
+            if (hit.model, hit.pk) not in self._instances:
+                model_map.setdefault(hit.model, []).append(hit.pk)
+
+        for model, pks in model_map.iteritems():
+            instances = model._default_manager.in_bulk(pks)
+            for pk in pks:
+                # record misses too, so that deleted objects are not looked up again
+                self._instances[(model, pk)] = instances.get(pk)
+
+        found_hits = []
+        for hit in hits:
+            instance = self._instances[(hit.model, hit.pk)]
+            if instance is not None:
+                hit.instance = instance
+                found_hits.append(hit)
+        return found_hits
+
+    def __unicode__(self):
+        return u"<CombinedResultSet: query=%s>" % force_unicode(self._query_str)
+
+class CombinedHitList(object):
+    """
+    A sequence of hits from a CombinedResultSet. Instances are prefetched (if
+    enabled) only for the hits retrieved by iteration or slicing.
+    """
+    def __init__(self, resultset, hits):
+        self._resultset = resultset
+        self._hits = hits
+
+    def _prepare(self, hits):
+        if self._resultset._prefetch:
+            return self._resultset._do_prefetch(hits)
+        return hits
+
+    def count(self):
+        return len(self._hits)
+
+    def __len__(self):
+        return len(self._hits)
+
+    def __iter__(self):
+        return iter(self._prepare(self._hits))
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return self._prepare(self._hits[k])
+        else:
+            hits = self._prepare([self._hits[k]])
+            if not hits:
+                # the object has been deleted since it was indexed
+                raise IndexError("object for hit %s no longer exists" % k)
+            return hits[0]
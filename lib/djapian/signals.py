@@ -1,12 +1,22 @@
 """
 Here are the post_save and the pre_delete signals
 """
+from django.dispatch import Signal
+
 from djapian.models import Change
+from djapian.notifier import notify_change
+
+# Sent by the index command once a batch of queued changes has been written to
+# the index. `sender` is the model class, `pks` the affected primary keys and
+# `action` either "update" or "delete".
+index_updated = Signal(providing_args=['pks', 'action'])
 
 def post_save(sender, instance, created, *args, **kwargs):
     '''Create the Change object to update the index'''
     Change.objects.create(object=instance, action= created and "add" or "edit")
+    notify_change()
 
 def pre_delete(sender, instance, *args, **kwargs):
     '''Create the Change object to update the index'''
     Change.objects.create(object=instance, action="delete")
+    notify_change()
@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import threading
+
+from django.test import SimpleTestCase
+
+import xapian
+
+from djapian.database import Database, CompositeDatabase, clear_pool, get_pool_stats
+
+class GenerationTest(SimpleTestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def test_generation_changes_on_commit(self):
+        db = Database(os.path.join(self.path, 'db'))
+        database = db.open(write=True)
+        generation = db.get_generation()
+        self.assertNotEqual(generation, None)
+
+        database.add_document(xapian.Document())
+        database.commit()
+        self.assertNotEqual(db.get_generation(), generation)
+
+    def test_unknown_layout_has_no_generation(self):
+        # no generation files, as with another backend
+        os.makedirs(os.path.join(self.path, 'other'))
+        db = Database(os.path.join(self.path, 'other'))
+        self.assertEqual(db.get_generation(), None)
+
+        known = Database(os.path.join(self.path, 'db'))
+        known.create_database()
+        self.assertEqual(CompositeDatabase([known, db]).get_generation(), None)
+
+class PoolStatsTest(SimpleTestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.db = Database(os.path.join(self.path, 'db'))
+        self.db.create_database()
+        clear_pool()
+
+    def tearDown(self):
+        clear_pool()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def stats_since(self, before):
+        after = get_pool_stats()
+        return dict((name, after[name] - before[name]) for name in ('opens', 'reopens', 'reuses'))
+
+    def test_open_reuse_and_reopen_are_counted(self):
+        before = get_pool_stats()
+        self.db.open()
+        self.db.open()
+
+        database = self.db.open(write=True)
+        database.add_document(xapian.Document())
+        database.commit()
+        self.db.open()
+
+        self.assertEqual(self.stats_since(before), {'opens': 1, 'reopens': 1, 'reuses': 1})
+        self.assertTrue(get_pool_stats()['open_time'] >= before['open_time'])
+
+    def test_counts_from_all_threads_are_kept(self):
+        before = get_pool_stats()
+
+        def search():
+            self.db.open()
+            self.db.open()
+            clear_pool()
+
+        threads = [threading.Thread(target=search) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.stats_since(before), {'opens': 8, 'reopens': 0, 'reuses': 8})
@@ -0,0 +1,157 @@
+"""
+Index worker that applies the Change queue to the index in batches.
+
+Changes are read in one query, grouped by model and action, indexed in batches
+of `batch_size` objects (one Xapian transaction per batch) and then deleted
+in bulk. Change rows that are touched again while a batch is being indexed
+are left in the queue for the next run, as are changes to models whose index
+is being rebuilt (see djapian.rebuild).
+
+Between runs the worker sleeps until it is notified of a new change (see
+djapian.notifier) or until the poll timeout expires.
+"""
+import logging
+import operator
+import sys
+import time
+from datetime import datetime
+
+from django.contrib.contenttypes.models import ContentType
+
+from djapian.models import Change
+from djapian.rebuild import is_rebuilding
+from djapian.signals import index_updated
+from djapian.space import IndexSpace
+
+logger = logging.getLogger('djapian')
+
+def get_indexers(model):
+    return reduce(
+        operator.add,
+        [space.get_indexers_for_model(model) for space in IndexSpace.instances]
+    )
+
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+class IndexWorker(object):
+    def __init__(self, batch_size=1000, verbose=False, app_models=None, notifier=None):
+        self.batch_size = batch_size
+        self.verbose = verbose
+        self.app_models = app_models
+        self.notifier = notifier
+
+        self.total_indexed = 0
+        self.total_deleted = 0
+
+    def log(self, message, *args):
+        logger.info(message, *args)
+
+    def get_pending_changes(self):
+        changes = Change.objects.all()
+        if self.app_models is not None:
+            changes = changes.filter(content_type__in=[
+                ContentType.objects.get_for_model(model) for model in self.app_models
+            ])
+        return changes.order_by('date').values_list('id', 'content_type_id', 'object_id', 'action', 'date')
+
+    def group_changes(self, changes):
+        """
+        Split change tuples into updates and deletions. Change is unique on
+        (content_type, object_id) and ChangeManager.create already folds repeated
+        edits into one row, so each row holds the latest action for its object.
+        Returns dicts of content_type_id => {object_id: change id}.
+        """
+        updates = {}
+        deletions = {}
+        for change_id, content_type_id, object_id, action, date in changes:
+            target = action == 'delete' and deletions or updates
+            target.setdefault(content_type_id, {})[object_id] = change_id
+        return updates, deletions
+
+    def is_paused(self, model, indexers):
+        for indexer in indexers:
+            if is_rebuilding(indexer):
+                self.log("Index for %s is being rebuilt; leaving its changes queued", model.__name__)
+                return True
+        return False
+
+    def run_once(self):
+        started_at = datetime.now()
+        start_time = time.time()
+
+        changes = list(self.get_pending_changes())
+        if not changes:
+            return 0
+
+        lag = started_at - changes[0][4]
+        self.log("%d changes queued; oldest is %.1fs old", len(changes), lag.total_seconds())
+
+        updates, deletions = self.group_changes(changes)
+        processed = 0
+
+        for content_type_id, objects in updates.iteritems():
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+            indexers = get_indexers(model)
+            if self.is_paused(model, indexers):
+                continue
+
+            for object_ids in chunked(sorted(objects.keys()), self.batch_size):
+                queryset = model._default_manager.filter(pk__in=object_ids).order_by('pk')
+                for indexer in indexers:
+                    # a single page, so each batch is one Xapian transaction
+                    indexer.update(queryset, per_page=self.batch_size, verbose=self.verbose)
+
+                self.delete_changes(objects, object_ids, started_at)
+                index_updated.send(sender=model, pks=object_ids, action='update')
+                processed += len(object_ids)
+                self.total_indexed += len(object_ids)
+
+        for content_type_id, objects in deletions.iteritems():
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+            indexers = get_indexers(model)
+            if self.is_paused(model, indexers):
+                continue
+
+            for object_ids in chunked(sorted(objects.keys()), self.batch_size):
+                for indexer in indexers:
+                    database = indexer._db.open(write=True)
+                    database.begin_transaction()
+                    try:
+                        for object_id in object_ids:
+                            indexer.delete(object_id, database)
+                    except:
+                        database.cancel_transaction()
+                        raise
+                    database.commit_transaction()
+
+                self.delete_changes(objects, object_ids, started_at)
+                index_updated.send(sender=model, pks=object_ids, action='delete')
+                processed += len(object_ids)
+                self.total_deleted += len(object_ids)
+
+        elapsed = time.time() - start_time
+        self.log(
+            "Processed %d objects from %d changes in %.2fs (%.1f objects/s)",
+            processed, len(changes), elapsed, processed / max(elapsed, 0.001)
+        )
+        return processed
+
+    def delete_changes(self, objects, object_ids, started_at):
+        change_ids = [objects[object_id] for object_id in object_ids]
+        # rows updated since we read the queue describe newer edits; leave them for the next run
+        Change.objects.filter(id__in=change_ids, date__lte=started_at).delete()
+
+    def run_forever(self, timeout):
+        while True:
+            try:
+                self.run_once()
+            finally:
+                if self.verbose:
+                    sys.stdout.flush()
+
+            if self.notifier:
+                self.notifier.wait(timeout)
+            else:
+                time.sleep(timeout)
@@ -30,6 +30,9 @@ LOCATION            = getattr(settings, 'AWS_LOCATION', '')
 IS_GZIPPED          = getattr(settings, 'AWS_IS_GZIPPED', False)
 CALLING_FORMAT      = getattr(settings, 'AWS_BOTO_CALLING_FORMAT', 'SubdomainCallingFormat')
 FORCE_HTTP          = getattr(settings, 'AWS_BOTO_FORCE_HTTP', False)
+# host and port of an S3-compatible server to use instead of Amazon (e.g. a local stand-in for testing)
+S3_HOST             = getattr(settings, 'AWS_S3_HOST', None)
+S3_PORT             = getattr(settings, 'AWS_S3_PORT', None)
 GZIP_CONTENT_TYPES  = getattr(settings, 'GZIP_CONTENT_TYPES', (
 	'text/css',
 	'application/javascript',
@@ -54,16 +57,23 @@ class S3BotoStorage(Storage):
 		if not access_key and not secret_key:
 			access_key, secret_key = self._get_access_keys()
 
-		# Ignore CALLING_FORMAT for uploads - only use it for constructing download URLs. LOL IDK
-		upload_klass = getattr(connection, 'SubdomainCallingFormat')
-		self.upload_connection = connection.S3Connection(access_key, secret_key, calling_format=upload_klass(), is_secure=False)
-
-		try:
-			klass = getattr(connection, CALLING_FORMAT)
-		except AttributeError:
-			raise ImproperlyConfigured("Invalid CallingFormat subclass: %s\
-			\nValid choices: SubdomainCallingFormat, VHostCallingFormat, OrdinaryCallingFormat")
-		self.connection = connection.S3Connection(access_key, secret_key, calling_format=klass())
+		if S3_HOST:
+			# a non-Amazon server won't have a DNS entry per bucket, so address buckets by path
+			server_args = {'host': S3_HOST, 'port': S3_PORT, 'is_secure': False}
+			upload_klass = klass = connection.OrdinaryCallingFormat
+		else:
+			server_args = {}
+			# Ignore CALLING_FORMAT for uploads - only use it for constructing download URLs. LOL IDK
+			upload_klass = getattr(connection, 'SubdomainCallingFormat')
+			try:
+				klass = getattr(connection, CALLING_FORMAT)
+			except AttributeError:
+				raise ImproperlyConfigured("Invalid CallingFormat subclass: %s\
+				\nValid choices: SubdomainCallingFormat, VHostCallingFormat, OrdinaryCallingFormat")
+
+		upload_args = dict(server_args, is_secure=False)
+		self.upload_connection = connection.S3Connection(access_key, secret_key, calling_format=upload_klass(), **upload_args)
+		self.connection = connection.S3Connection(access_key, secret_key, calling_format=klass(), **server_args)
 
 		self.upload_bucket = self.upload_connection.get_bucket(bucket, validate=False)
 		#self.bucket = self._get_or_create_bucket(bucket)
@@ -10,12 +10,14 @@ from boto.s3.key import Key
 
 from django.conf import settings
 from django.db.models import Count
-from mirror.models import ArchiveMember, Download, DownloadBlob
+from mirror.cache import get_download_cache
+from mirror.models import ArchiveMember, Download, DownloadBlob, FileTooBig
 from screenshots.models import USABLE_IMAGE_FILE_EXTENSIONS, USABLE_ANSI_FILE_EXTENSIONS
 from screenshots.processing import select_screenshot_file
-from productions.models import Production
+from productions.models import Production, ProductionLink
 
-max_size = 10485760
+# files are streamed to disk rather than held in memory, so this is a limit on disk usage per worker
+max_size = getattr(settings, 'MIRROR_MAX_FILE_SIZE', 10485760)
 mirror_bucket_name = 'mirror.demozoo.org'
 
 upload_dir = os.path.join(settings.FILEROOT, 'media', 'mirror')
@@ -28,31 +30,24 @@ except OSError as exc:
 		raise
 
 
-class FileTooBig(Exception):
-	pass
-
-
 def fetch_origin_url(url):
 	# fetch file from the given URL (any protocol supported by urllib2),
 	# throwing FileTooBig if it exceeds max_size
 	req = urllib2.Request(url, None, {'User-Agent': settings.HTTP_USER_AGENT})
 	f = urllib2.urlopen(req, None, 10)
 
-	content_length = f.info().get('Content-Length')
-	if content_length and int(content_length) > max_size:
-		f.close()
-		raise FileTooBig("File exceeded the size limit of %d bytes" % max_size)
-
-	resolved_url = f.geturl()
-
-	file_content = f.read(max_size + 1)
-	f.close()
-	if len(file_content) > max_size:
-		raise FileTooBig("File exceeded the size limit of %d bytes" % max_size)
+	try:
+		content_length = f.info().get('Content-Length')
+		if content_length and int(content_length) > max_size:
+			raise FileTooBig("File exceeded the size limit of %d bytes" % max_size)
 
-	remote_filename = urlparse.urlparse(resolved_url).path.split('/')[-1]
+		resolved_url = f.geturl()
+		remote_filename = urlparse.urlparse(resolved_url).path.split('/')[-1]
 
-	return DownloadBlob(remote_filename, buffer(file_content))
+		# stream to a temporary file, so that large files aren't held in memory
+		return DownloadBlob.from_stream(remote_filename, f, max_size=max_size)
+	finally:
+		f.close()
 
 
 def clean_filename(filename):
@@ -109,11 +104,16 @@ def fetch_link(link):
 			bucket = open_bucket()
 			k = Key(bucket)
 			k.key = key_name
-			k.set_contents_from_string(blob.file_content)
+			k.set_contents_from_file(blob.as_io_buffer())
 			download.mirror_s3_key = key_name
 
 		download.save()
 
+		# it's likely to be needed again shortly (e.g. to retry a screenshot), so keep a local copy
+		cache = get_download_cache()
+		if cache:
+			cache.put(blob.sha1, blob.file)
+
 		if link.is_zip_file():
 			# catalogue the zipfile contents if we don't have them already
 			if not ArchiveMember.objects.filter(archive_sha1=blob.sha1).exists():
@@ -132,49 +132,100 @@ def fetch_link(link):
 		return blob
 
 
-def find_screenshottable_graphics():
-	# Graphic productions with downloads but no screenshots
-	from django.db.models import Count
-	prods = Production.objects.annotate(screenshot_count=Count('screenshots')).filter(
-		supertype='graphics', screenshot_count=0, links__is_download_link=True).prefetch_related('links')
+# number of productions to examine per batch of queries in the find_* functions
+CANDIDATE_BATCH_SIZE = 500
 
-	prod_links = []
-	for prod in prods:
-		for link in prod.links.all():
-			if (
-				link.is_download_link and not link.has_bad_image
-				and link.download_file_extension() in USABLE_IMAGE_FILE_EXTENSIONS and link.is_believed_downloadable()
-			):
-				prod_links.append(link)
-				break  # ignore any remaining links for this prod
 
-	return prod_links
+def downloads_by_link(links):
+	"""
+	Fetch the Download records for all of the given links in one query, returning a dict of
+	(link_class, parameter) => list of downloads
+	"""
+	downloads = {}
+	if not links:
+		return downloads
 
+	candidates = Download.objects.filter(
+		parameter__in=set(link.parameter for link in links),
+		link_class__in=set(link.link_class for link in links),
+	).only('link_class', 'parameter', 'sha1', 'mirror_s3_key', 'error_type', 'downloaded_at')
+	for download in candidates:
+		downloads.setdefault((download.link_class, download.parameter), []).append(download)
+	return downloads
 
-def find_zipped_screenshottable_graphics():
-	# Return a set of ProductionLink objects that link to archive files,
-	# that we can plausibly expect to extract screenshots from, for productions that don't
-	# have screenshots already.
 
-	# prods of supertype=graphics that have download links but no screenshots
-	prods = Production.objects.annotate(screenshot_count=Count('screenshots')).filter(
-		supertype='graphics', screenshot_count=0, links__is_download_link=True).prefetch_related('links', 'types')
+def candidate_links(production_ids):
+	"""
+	For batches of the given production IDs, yield (production_id, links, downloads) where links
+	is the list of that production's usable download links and downloads is a dict as returned by
+	downloads_by_link. Each batch costs two queries.
+	"""
+	production_ids = list(production_ids)
+	for i in range(0, len(production_ids), CANDIDATE_BATCH_SIZE):
+		links = list(ProductionLink.objects.filter(
+			production_id__in=production_ids[i:i + CANDIDATE_BATCH_SIZE],
+			is_download_link=True, has_bad_image=False
+		).order_by('production_id', 'link_class', 'id'))
+		downloads = downloads_by_link(links)
 
-	prod_links = []
-	for prod in prods:
+		links_by_production_id = {}
+		for link in links:
+			links_by_production_id.setdefault(link.production_id, []).append(link)
 
-		# skip ASCII/ANSI prods
-		if prod.types.filter(internal_name__in=['ascii', 'ascii-collection', 'ansi']):
-			continue
+		for production_id in production_ids[i:i + CANDIDATE_BATCH_SIZE]:
+			if production_id in links_by_production_id:
+				yield production_id, links_by_production_id[production_id], downloads
 
-		for link in prod.links.all():
 
-			if not (link.is_download_link and link.is_zip_file()):
-				continue
+def productions_without_screenshots():
+	# graphics productions with download links but no screenshots
+	return Production.objects.filter(
+		supertype='graphics', screenshots__isnull=True, links__is_download_link=True
+	).distinct().order_by('id').values_list('id', flat=True)
 
-			if link.has_bad_image or not link.is_believed_downloadable():
-				continue
 
+def find_screenshottable_graphics():
+	# Graphic productions with downloads but no screenshots.
+	# Yields a ProductionLink for each one that we can try to take a screenshot from
+	for production_id, links, downloads in candidate_links(productions_without_screenshots()):
+		for link in links:
+			if (
+				link.download_file_extension() in USABLE_IMAGE_FILE_EXTENSIONS
+				and link.is_believed_downloadable(downloads.get((link.link_class, link.parameter), []))
+			):
+				yield link
+				break  # ignore any remaining links for this prod
+
+
+def find_zipped_screenshottable_graphics():
+	# Yield ProductionLink objects that link to archive files,
+	# that we can plausibly expect to extract screenshots from, for productions that don't
+	# have screenshots already.
+
+	# skip ASCII/ANSI prods
+	production_ids = productions_without_screenshots().exclude(
+		types__internal_name__in=['ascii', 'ascii-collection', 'ansi']
+	)
+
+	for production_id, links, downloads in candidate_links(production_ids):
+		links = [
+			link for link in links
+			if link.is_zip_file() and link.is_believed_downloadable(downloads.get((link.link_class, link.parameter), []))
+		]
+
+		# fetch directory listings for all links that don't have a candidate archive member yet, in one query
+		archive_sha1s = {}
+		for link in links:
+			if not link.file_for_screenshot:
+				download = link.last_successful_download(downloads.get((link.link_class, link.parameter), []))
+				if download:
+					archive_sha1s[link.id] = download.sha1
+		archive_members = {}
+		if archive_sha1s:
+			for member in ArchiveMember.objects.filter(archive_sha1__in=set(archive_sha1s.values())):
+				archive_members.setdefault(member.archive_sha1, []).append(member)
+
+		for link in links:
 			file_for_screenshot = None
 			# see if we've already got a best candidate archive member to take the image from
 			if link.file_for_screenshot:
@@ -182,20 +233,23 @@ def find_zipped_screenshottable_graphics():
 			else:
 				# failing that, see if we already have a directory listing for this download
 				# and can derive a candidate from that
-				archive_members = link.archive_members()
-				if archive_members:
-					file_for_screenshot = select_screenshot_file(archive_members)
+				members = archive_members.get(archive_sha1s.get(link.id), [])
+				if members:
+					file_for_screenshot = select_screenshot_file(members)
 					if file_for_screenshot:
 						# we've found a candidate (which probably means we've improved select_screenshot_file
 						# since it was last run on this archive) - might as well store it against the
 						# ProductionLink, so it doesn't show up as something to be manually resolved
 						link.file_for_screenshot = file_for_screenshot
 						link.is_unresolved_for_screenshotting = False
-						link.save()
+						ProductionLink.objects.filter(id=link.id).update(
+							file_for_screenshot=file_for_screenshot, is_unresolved_for_screenshotting=False
+						)
 					else:
 						# we have a directory listing but no clear candidate, so give up on this link
-						link.is_unresolved_for_screenshotting = True
-						link.save()
+						if not link.is_unresolved_for_screenshotting:
+							link.is_unresolved_for_screenshotting = True
+							ProductionLink.objects.filter(id=link.id).update(is_unresolved_for_screenshotting=True)
 						continue
 
 			if file_for_screenshot:
@@ -205,11 +259,9 @@ def find_zipped_screenshottable_graphics():
 				if extension not in USABLE_IMAGE_FILE_EXTENSIONS:
 					continue
 
-			prod_links.append(link)
+			yield link
 			break  # success, so ignore any remaining links for this prod
 
-	return prod_links
-
 
 def find_ansis():
 	"""Find ANSI/ASCII productions that do not yet have an Ansi record, but have a non-zipped
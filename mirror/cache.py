@@ -0,0 +1,221 @@
+"""
+On-disk cache of mirrored downloads, keyed by SHA1, so that repeated requests for the same file
+(e.g. inspecting an archive in the maintenance UI, or retrying a screenshot) don't fetch it from
+the mirror bucket each time.
+
+The cache directory is shared by all processes on the host: entries are written to a temporary
+file and renamed into place, and eviction and the counters file are protected by a lock file.
+The counters file keeps a running total of the size of the cache, so that adding a file doesn't
+need to scan the cache. When the total exceeds the limit, entries are evicted least recently used
+first (as recorded by their modification time, which is updated on every hit) until the cache is
+back down to EVICT_TO_FRACTION of the limit, and the total is recounted from the files that remain.
+
+Hits and misses are tallied in memory and added to the shared counters file every
+COUNTER_FLUSH_INTERVAL seconds (or when stats are read), rather than taking the lock on every
+lookup. The counters can be shown with the mirror_cache_stats management command.
+
+Configured with the settings:
+ * MIRROR_CACHE_DIR: directory to keep cached files in
+ * MIRROR_CACHE_MAX_SIZE: maximum total size of cached files in bytes. 0 disables the cache.
+"""
+import atexit
+import fcntl
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+SHA1_PATTERN = re.compile(r'^[0-9a-f]{40}$')
+
+# seconds between writes of this process's hit/miss tallies to the counters file
+COUNTER_FLUSH_INTERVAL = 60
+
+# fraction of the size limit to evict down to, so that the cache isn't scanned again
+# for every file added once it is full
+EVICT_TO_FRACTION = 0.9
+
+
+class DownloadCache(object):
+	def __init__(self, directory, max_size):
+		self.directory = directory
+		self.max_size = max_size
+
+		self.pending_counts = {}
+		self.last_flush_time = time.time()
+		self.counts_lock = threading.Lock()
+
+	def path_for(self, sha1):
+		return os.path.join(self.directory, sha1[0:2], sha1[2:4], sha1)
+
+	@contextmanager
+	def lock(self):
+		with open(os.path.join(self.directory, 'lock'), 'a') as f:
+			fcntl.flock(f, fcntl.LOCK_EX)
+			try:
+				yield
+			finally:
+				fcntl.flock(f, fcntl.LOCK_UN)
+
+	def open(self, sha1):
+		"""Return an open file for the cached file with the given SHA1, or None if it isn't cached"""
+		try:
+			f = open(self.path_for(sha1), 'rb')
+		except IOError:
+			self.count('misses')
+			return None
+
+		# mark as recently used
+		try:
+			os.utime(f.name, None)
+		except OSError:
+			pass
+		self.count('hits')
+		return f
+
+	def put(self, sha1, fileobj):
+		"""Add the contents of fileobj to the cache under the given SHA1"""
+		path = self.path_for(sha1)
+		directory = os.path.dirname(path)
+		if not os.path.isdir(directory):
+			try:
+				os.makedirs(directory)
+			except OSError:
+				# created by another process in the meantime
+				pass
+
+		fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+		try:
+			with os.fdopen(fd, 'wb') as f:
+				fileobj.seek(0)
+				shutil.copyfileobj(fileobj, f, 64 * 1024)
+				size = f.tell()
+
+			with self.lock():
+				try:
+					replaced_size = os.path.getsize(path)
+				except OSError:
+					replaced_size = 0
+				os.rename(temp_path, path)
+
+				counters = self.read_counters()
+				if 'size' in counters:
+					total_size = counters['size'] + size - replaced_size
+				else:
+					# no running total yet, so count up the files already here
+					total_size = sum(entry_size for mtime, entry_size, entry_path in self.entries())
+				if total_size > self.max_size:
+					total_size = self.evict()
+				counters['size'] = total_size
+				self.write_counters(counters)
+		except Exception:
+			if os.path.exists(temp_path):
+				os.remove(temp_path)
+			raise
+
+	def entries(self):
+		"""Return a list of (mtime, size, path) for all cached files"""
+		entries = []
+		for dirpath, dirnames, filenames in os.walk(self.directory):
+			for filename in filenames:
+				if SHA1_PATTERN.match(filename):
+					path = os.path.join(dirpath, filename)
+					try:
+						stat = os.stat(path)
+					except OSError:
+						continue
+					entries.append((stat.st_mtime, stat.st_size, path))
+		return entries
+
+	def evict(self):
+		"""
+		Delete least recently used files until the cache is down to EVICT_TO_FRACTION of its
+		size limit, and return the total size of the files that remain. Must be called with
+		the lock held
+		"""
+		entries = self.entries()
+		total_size = sum(size for mtime, size, path in entries)
+		target_size = self.max_size * EVICT_TO_FRACTION
+		for mtime, size, path in sorted(entries):
+			if total_size <= target_size:
+				break
+			try:
+				os.remove(path)
+			except OSError:
+				pass
+			total_size -= size
+		return total_size
+
+	def count(self, counter):
+		with self.counts_lock:
+			self.pending_counts[counter] = self.pending_counts.get(counter, 0) + 1
+			if time.time() - self.last_flush_time < COUNTER_FLUSH_INTERVAL:
+				return
+		self.flush_counts()
+
+	def flush_counts(self):
+		"""Add the hits and misses tallied by this process to the counters file"""
+		with self.counts_lock:
+			pending_counts, self.pending_counts = self.pending_counts, {}
+			self.last_flush_time = time.time()
+		if not pending_counts:
+			return
+
+		with self.lock():
+			counters = self.read_counters()
+			for counter, count in pending_counts.iteritems():
+				counters[counter] = counters.get(counter, 0) + count
+			self.write_counters(counters)
+
+	def read_counters(self):
+		try:
+			with open(os.path.join(self.directory, 'counters.json')) as f:
+				return json.load(f)
+		except (IOError, ValueError):
+			return {}
+
+	def write_counters(self, counters):
+		with open(os.path.join(self.directory, 'counters.json'), 'w') as f:
+			json.dump(counters, f)
+
+	def stats(self):
+		self.flush_counts()
+		counters = self.read_counters()
+		entries = self.entries()
+		return {
+			'hits': counters.get('hits', 0),
+			'misses': counters.get('misses', 0),
+			'files': len(entries),
+			'size': sum(size for mtime, size, path in entries),
+			'max_size': self.max_size,
+		}
+
+
+_cache = None
+
+
+def get_download_cache():
+	"""Return the configured DownloadCache, or None if caching is disabled"""
+	global _cache
+
+	if _cache is None:
+		max_size = getattr(settings, 'MIRROR_CACHE_MAX_SIZE', 0)
+		if max_size:
+			directory = getattr(settings, 'MIRROR_CACHE_DIR', os.path.join(settings.FILEROOT, 'media', 'mirror_cache'))
+			if not os.path.isdir(directory):
+				try:
+					os.makedirs(directory)
+				except OSError:
+					pass
+			_cache = DownloadCache(directory, max_size)
+			# don't lose the tallies since the last flush when the process exits
+			atexit.register(_cache.flush_counts)
+		else:
+			_cache = False
+
+	return _cache or None
@@ -0,0 +1,22 @@
+# Report the usage of the on-disk cache of mirrored downloads (see mirror/cache.py).
+# Hits and misses are as recorded by all processes on this host, up to their last flush
+from django.core.management.base import NoArgsCommand
+
+from mirror.cache import get_download_cache
+
+
+class Command(NoArgsCommand):
+	def handle_noargs(self, **options):
+		cache = get_download_cache()
+		if cache is None:
+			print "The download cache is disabled (MIRROR_CACHE_MAX_SIZE is 0)"
+			return
+
+		stats = cache.stats()
+		lookups = stats['hits'] + stats['misses']
+		print "Directory: %s" % cache.directory
+		print "Files: %d" % stats['files']
+		print "Size: %.1f MB of %.1f MB" % (stats['size'] / 1048576.0, stats['max_size'] / 1048576.0)
+		print "Hits: %d, misses: %d (hit rate %.1f%%)" % (
+			stats['hits'], stats['misses'], 100.0 * stats['hits'] / lookups if lookups else 0
+		)
@@ -1,9 +1,11 @@
 import hashlib
+import mmap
+import os
+import tempfile
 import zipfile
 import cStringIO
 
 from django.db import models
-from django.utils.functional import cached_property
 
 from demoscene.models import ExternalLink
 from demoscene.utils.groklinks import PRODUCTION_LINK_TYPES
@@ -25,14 +27,28 @@ class Download(ExternalLink):
 
 	def fetch_from_s3(self):
 		from mirror.actions import open_bucket
+		from mirror.cache import get_download_cache
 		from boto.s3.key import Key
 
+		filename = self.mirror_s3_key.split('/')[-1]
+
+		cache = get_download_cache()
+		if cache and self.sha1:
+			f = cache.open(self.sha1)
+			if f:
+				return DownloadBlob(filename, f, self.sha1, self.md5, os.fstat(f.fileno()).st_size)
+
 		bucket = open_bucket()
 		k = Key(bucket)
 		k.key = self.mirror_s3_key
-		file_content = buffer(k.get_contents_as_string())
-		filename = self.mirror_s3_key.split('/')[-1]
-		return DownloadBlob(filename, file_content)
+		try:
+			blob = DownloadBlob.from_stream(filename, k)
+		finally:
+			k.close()
+
+		if cache and blob.sha1 == self.sha1:
+			cache.put(blob.sha1, blob.file)
+		return blob
 
 
 class ArchiveMember(models.Model):
@@ -72,25 +88,102 @@ class ArchiveMember(models.Model):
 		]
 
 
-class DownloadBlob(object):
-	def __init__(self, filename, file_content):
-		self.filename = filename
-		self.file_content = file_content
+class FileTooBig(Exception):
+	pass
+
+
+class MappedFile(object):
+	"""
+	A read-only, seekable file-like object over a memory-mapped file. (Python 2's mmap objects
+	can almost be used as files directly, but their read() requires a size argument.)
+	"""
+	def __init__(self, fileobj):
+		self._mmap = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+
+	def read(self, size=-1):
+		if size is None or size < 0:
+			size = len(self._mmap) - self._mmap.tell()
+		return self._mmap.read(size)
+
+	def seek(self, offset, whence=0):
+		# unlike files, mmaps don't allow seeking past the end
+		if whence == 0:
+			position = offset
+		elif whence == 1:
+			position = self._mmap.tell() + offset
+		else:
+			position = len(self._mmap) + offset
+		self._mmap.seek(min(position, len(self._mmap)))
+
+	def tell(self):
+		return self._mmap.tell()
+
+	def getvalue(self):
+		return self._mmap[:]
+
+	def close(self):
+		self._mmap.close()
 
-	@cached_property
-	def md5(self):
-		return hashlib.md5(self.file_content).hexdigest()
 
-	@cached_property
-	def sha1(self):
-		return hashlib.sha1(self.file_content).hexdigest()
+class DownloadBlob(object):
+	"""
+	The content of a downloaded file, held in an anonymous temporary file rather than in memory.
+	Use DownloadBlob.from_stream to create one.
+	"""
+	CHUNK_SIZE = 64 * 1024
 
-	@cached_property
-	def file_size(self):
-		return len(self.file_content)
+	def __init__(self, filename, fileobj, sha1, md5, file_size):
+		self.filename = filename
+		self.file = fileobj
+		self.sha1 = sha1
+		self.md5 = md5
+		self.file_size = file_size
+
+	@classmethod
+	def from_stream(cls, filename, stream, max_size=None):
+		"""
+		Read the file-like object 'stream' to the end, a chunk at a time, into a temporary file,
+		computing its hashes and size as we go. Raise FileTooBig if it exceeds max_size bytes.
+		"""
+		fileobj = tempfile.TemporaryFile()
+		sha1 = hashlib.sha1()
+		md5 = hashlib.md5()
+		file_size = 0
+
+		try:
+			while True:
+				chunk = stream.read(cls.CHUNK_SIZE)
+				if not chunk:
+					break
+				file_size += len(chunk)
+				if max_size is not None and file_size > max_size:
+					raise FileTooBig("File exceeded the size limit of %d bytes" % max_size)
+				sha1.update(chunk)
+				md5.update(chunk)
+				fileobj.write(chunk)
+		except:
+			fileobj.close()
+			raise
+
+		fileobj.flush()
+		return cls(filename, fileobj, sha1.hexdigest(), md5.hexdigest(), file_size)
+
+	@property
+	def file_content(self):
+		return self.as_io_buffer().getvalue()
 
 	def as_io_buffer(self):
-		return cStringIO.StringIO(self.file_content)
+		"""
+		Return a new seekable, read-only view of the file content. This is memory-mapped, so
+		the content is paged in from the temporary file as needed instead of being copied.
+		"""
+		if not self.file_size:
+			# zero-length files can't be mapped
+			return cStringIO.StringIO('')
+		return MappedFile(self.file)
 
 	def as_zipfile(self):
 		return zipfile.ZipFile(self.as_io_buffer(), 'r')
+
+	def close(self):
+		self.file.close()
@@ -2,7 +2,9 @@ import datetime
 import hashlib
 import re
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.core.files.base import ContentFile
 from django.core.files.storage import FileSystemStorage
 
@@ -11,7 +13,7 @@ from lib.strip_markup import strip_markup
 from unidecode import unidecode
 
 from demoscene.models import DATE_PRECISION_CHOICES, ExternalLink
-from demoscene.utils import groklinks
+from demoscene.utils import fragment_cache, groklinks
 from comments.models import Commentable
 from productions.models import Production, Screenshot
 
@@ -136,6 +138,10 @@ class Party(Commentable):
 		self.start_date_precision = fuzzy_date.precision
 	start_date = property(_get_start_date, _set_start_date)
 
+	@property
+	def start_year(self):
+		return self.start_date_date.year
+
 	def _get_end_date(self):
 		return FuzzyDate(self.end_date_date, self.end_date_precision)
 
@@ -323,6 +329,34 @@ class CompetitionPlacing(models.Model):
 			return "(CompetitionPlacing)"
 
 
+def get_competition_results(competitions):
+	"""
+	Return a list of (competition, placings) pairs for the given competitions, with placings
+	ordered by position. Placings for all of the competitions are fetched in one query, with
+	authors, platforms and types prefetched across all of them.
+	"""
+	competitions = list(competitions)
+	placings_by_competition_id = dict((competition.id, []) for competition in competitions)
+
+	if competitions:
+		placings = CompetitionPlacing.objects.filter(
+			competition_id__in=placings_by_competition_id.keys()
+		).order_by('competition_id', 'position', 'production__id').select_related(
+			'production__default_screenshot'
+		).prefetch_related(
+			'production__platforms', 'production__types'
+		).defer(
+			'production__notes'
+		)
+		for placing in placings:
+			placings_by_competition_id[placing.competition_id].append(placing)
+
+	return [
+		(competition, placings_by_competition_id[competition.id])
+		for competition in competitions
+	]
+
+
 class ResultsFile(models.Model):
 	party = models.ForeignKey(Party, related_name='results_files')
 	filename = models.CharField(max_length=255, blank=True)
@@ -376,3 +410,25 @@ class ResultsFile(models.Model):
 		else:
 			encoding, output = self.guess_encoding(self.data, fuzzy=True)
 			return output
+
+
+@receiver(post_save, sender=PartyExternalLink)
+def find_results_file_for_sceneorg_folder_link(sender, **kwargs):
+	# The scene.org sync tasks only look for results files that they have just seen for the first
+	# time, so check the directory here in case it already has one
+	link = kwargs['instance']
+	if link.link_class == 'SceneOrgFolder' and not kwargs.get('raw'):
+		from demoscene.tasks import find_sceneorg_results_files
+		party_id = link.party_id
+		transaction.on_commit(lambda: find_sceneorg_results_files(party_ids=[party_id]))
+
+
+fragment_cache.register(Party, lambda parties: [
+	(Party, [party.id for party in parties]),
+])
+fragment_cache.register(Competition, lambda competitions: [
+	(Party, [competition.party_id for competition in competitions]),
+])
+fragment_cache.register(CompetitionPlacing, lambda placings: [
+	(Party, Competition.objects.filter(id__in=[placing.competition_id for placing in placings]).values_list('party_id', flat=True)),
+])
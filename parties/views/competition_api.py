@@ -44,14 +44,14 @@ def handle_production(prod_data, competition):
 				production.types = []
 		if 'byline' in prod_data:
 			try:
-				production.author_nicks = [
-					NickSelection(author['id'], author['name']).commit()
+				production.author_nicks = NickSelection.commit_all([
+					NickSelection(author['id'], author['name'])
 					for author in prod_data['byline']['authors']
-				]
-				production.author_affiliation_nicks = [
-					NickSelection(affillation['id'], affillation['name']).commit()
+				])
+				production.author_affiliation_nicks = NickSelection.commit_all([
+					NickSelection(affillation['id'], affillation['name'])
 					for affillation in prod_data['byline']['affiliations']
-				]
+				])
 				production.unparsed_byline = None
 			except NickSelection.FailedToResolve:
 				# failed to match up the passed nick IDs to valid nick records.
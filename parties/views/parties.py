@@ -7,11 +7,12 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponse, HttpResponseRedirect
+from django.utils.functional import SimpleLazyObject
 
 from demoscene.shortcuts import simple_ajax_form
 from demoscene.models import Edit
 from productions.models import Production
-from parties.models import Party, PartySeries, Competition, PartyExternalLink, ResultsFile
+from parties.models import Party, PartySeries, Competition, PartyExternalLink, ResultsFile, get_competition_results
 from parties.forms import PartyForm, EditPartyForm, PartyEditNotesForm, PartyExternalLinkFormSet, PartySeriesEditNotesForm, EditPartySeriesForm, CompetitionForm, PartyInvitationFormset, PartyReleaseFormset
 from read_only_mode import writeable_site_required
 from comments.models import Comment
@@ -35,21 +36,12 @@ def by_date(request):
 def show(request, party_id):
 	party = get_object_or_404(Party, id=party_id)
 
-	# trying to retrieve all competition results in one massive prefetch_related clause:
-	#    competitions = party.competitions.prefetch_related('placings__production__author_nicks__releaser', 'placings__production__author_affiliation_nicks__releaser').defer('placings__production__notes', 'placings__production__author_nicks__releaser__notes', 'placings__production__author_affiliation_nicks__releaser__notes').order_by('name', 'id', 'placings__position', 'placings__production__id')
-	# - fails with 'RelatedObject' object has no attribute 'rel', where the RelatedObject is <RelatedObject: demoscene:competitionplacing related to competition>. Shame, that...
-	# for now, we'll do it one compo at a time (which allows us to use the slightly more sane select_related approach to pull in production records)
-	competitions_with_placings = [
-		(
-			competition,
-			competition.placings.order_by('position', 'production__id').select_related('production__default_screenshot').prefetch_related('production__author_nicks__releaser', 'production__author_affiliation_nicks__releaser', 'production__platforms', 'production__types').defer('production__notes', 'production__author_nicks__releaser__notes', 'production__author_affiliation_nicks__releaser__notes')
-		)
-		for competition in party.competitions.order_by('name', 'id')
-	]
+	# evaluated lazily, so that nothing is fetched if the results are served from the fragment cache
+	competitions_with_placings = SimpleLazyObject(lambda: get_competition_results(party.competitions.order_by('name', 'id')))
 
-	invitations = party.invitations.select_related('default_screenshot').prefetch_related('author_nicks__releaser', 'author_affiliation_nicks__releaser', 'platforms', 'types')
+	invitations = party.invitations.select_related('default_screenshot').prefetch_related('platforms', 'types')
 
-	releases = party.releases.select_related('default_screenshot').prefetch_related('author_nicks__releaser', 'author_affiliation_nicks__releaser', 'platforms', 'types')
+	releases = party.releases.select_related('default_screenshot').prefetch_related('platforms', 'types')
 
 	external_links = sorted(party.external_links.select_related('party'), key=lambda obj: obj.sort_key)
 
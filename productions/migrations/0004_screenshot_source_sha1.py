@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productions', '0003_increase_link_length'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='screenshot',
+            name='source_sha1',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=40),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# as ReleaserTimelineEntry.REFRESH_SQL, for all releasers
+POPULATE_TIMELINE_ENTRIES_SQL = '''
+    INSERT INTO productions_releasertimelineentry (releaser_id, production_id, nick_id, role_summary, release_date_date, sortable_title)
+    SELECT
+        demoscene_nick.releaser_id, productions_production.id, demoscene_nick.id,
+        LEFT(string_agg(
+            CASE WHEN productions_credit.role <> '' THEN productions_credit.category || ' (' || productions_credit.role || ')' ELSE productions_credit.category END,
+            ', ' ORDER BY productions_credit.id
+        ), 255),
+        productions_production.release_date_date, COALESCE(productions_production.sortable_title, '')
+    FROM productions_credit
+    INNER JOIN demoscene_nick ON (demoscene_nick.id = productions_credit.nick_id)
+    INNER JOIN productions_production ON (productions_production.id = productions_credit.production_id)
+    GROUP BY demoscene_nick.releaser_id, productions_production.id, demoscene_nick.id
+    UNION ALL
+    SELECT DISTINCT
+        demoscene_nick.releaser_id, productions_production.id, NULL,
+        '',
+        productions_production.release_date_date, COALESCE(productions_production.sortable_title, '')
+    FROM productions_production_author_nicks
+    INNER JOIN demoscene_nick ON (demoscene_nick.id = productions_production_author_nicks.nick_id)
+    INNER JOIN productions_production ON (productions_production.id = productions_production_author_nicks.production_id)
+    WHERE NOT EXISTS (
+        SELECT 1 FROM productions_credit
+        INNER JOIN demoscene_nick AS credited_nick ON (credited_nick.id = productions_credit.nick_id)
+        WHERE productions_credit.production_id = productions_production.id
+        AND credited_nick.releaser_id = demoscene_nick.releaser_id
+    )
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('demoscene', '0005_nickvariant_matching_indexes'),
+        ('productions', '0004_screenshot_source_sha1'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReleaserTimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role_summary', models.CharField(blank=True, max_length=255)),
+                ('release_date_date', models.DateField(null=True)),
+                ('sortable_title', models.CharField(max_length=255)),
+                ('nick', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='demoscene.Nick')),
+                ('production', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='productions.Production')),
+                ('releaser', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='demoscene.Releaser')),
+            ],
+        ),
+        # covers the listing order used by the combined_releases tag, so that a page of it
+        # can be read straight off the index
+        migrations.RunSQL(
+            "CREATE INDEX productions_releasertimelineentry_listing ON productions_releasertimelineentry (releaser_id, release_date_date DESC, sortable_title, production_id, nick_id)",
+            "DROP INDEX productions_releasertimelineentry_listing",
+        ),
+        migrations.RunSQL(POPULATE_TIMELINE_ENTRIES_SQL, migrations.RunSQL.noop),
+    ]
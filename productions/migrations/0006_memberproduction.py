@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# as MemberProduction.REFRESH_SQL, for all groups and productions
+POPULATE_MEMBER_PRODUCTIONS_SQL = '''
+    WITH RECURSIVE subgroups(group_id, subgroup_id) AS (
+        SELECT demoscene_releaser.id, demoscene_releaser.id
+        FROM demoscene_releaser
+        WHERE demoscene_releaser.is_group
+        UNION
+        SELECT subgroups.group_id, demoscene_membership.member_id
+        FROM subgroups
+        INNER JOIN demoscene_membership ON (demoscene_membership.group_id = subgroups.subgroup_id)
+        INNER JOIN demoscene_releaser ON (demoscene_releaser.id = demoscene_membership.member_id)
+        WHERE demoscene_releaser.is_group
+    )
+    INSERT INTO productions_memberproduction (group_id, production_id)
+    SELECT subgroups.group_id, production_nicks.production_id
+    FROM subgroups
+    INNER JOIN demoscene_nick ON (demoscene_nick.releaser_id = subgroups.subgroup_id)
+    INNER JOIN productions_production_author_affiliation_nicks AS production_nicks ON (production_nicks.nick_id = demoscene_nick.id)
+    UNION
+    SELECT subgroups.group_id, production_nicks.production_id
+    FROM subgroups
+    INNER JOIN demoscene_nick ON (demoscene_nick.releaser_id = subgroups.subgroup_id)
+    INNER JOIN productions_production_author_nicks AS production_nicks ON (production_nicks.nick_id = demoscene_nick.id)
+    WHERE subgroups.subgroup_id <> subgroups.group_id
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('demoscene', '0005_nickvariant_matching_indexes'),
+        ('productions', '0005_releasertimelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemberProduction',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='demoscene.Releaser')),
+                ('production', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='member_production_entries', to='productions.Production')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='memberproduction',
+            unique_together=set([('group', 'production')]),
+        ),
+        migrations.RunSQL(POPULATE_MEMBER_PRODUCTIONS_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+
+from django.db import migrations, models
+
+
+def nick_to_byline_cache(nick):
+    # as productions.models.nick_to_byline_cache
+    return {
+        'id': nick.id, 'name': nick.name, 'abbreviation': nick.abbreviation,
+        'releaser_id': nick.releaser_id, 'releaser_name': nick.releaser.name, 'is_group': nick.releaser.is_group,
+    }
+
+
+def populate_byline_caches(apps, schema_editor):
+    # builds the same JSON as productions.models.refresh_byline_caches
+    Production = apps.get_model('productions', 'Production')
+
+    bylines = dict(
+        (production_id, ([], []))
+        for production_id in Production.objects.values_list('id', flat=True)
+    )
+    # ordered to match Nick's default ordering, as used by author_nicks.all()
+    for link in Production.author_nicks.through.objects.select_related('nick__releaser').order_by('nick__name'):
+        bylines[link.production_id][0].append(link.nick)
+    for link in Production.author_affiliation_nicks.through.objects.select_related('nick__releaser').order_by('nick__name'):
+        bylines[link.production_id][1].append(link.nick)
+
+    for production_id, (author_nicks, affiliation_nicks) in bylines.iteritems():
+        text = ' + '.join([nick.name for nick in author_nicks])
+        if affiliation_nicks:
+            text = "%s / %s" % (text, ' ^ '.join([nick.name for nick in affiliation_nicks]))
+
+        Production.objects.filter(id=production_id).update(byline_cache=json.dumps({
+            'text': text,
+            'authors': [nick_to_byline_cache(nick) for nick in author_nicks],
+            'affiliations': [nick_to_byline_cache(nick) for nick in affiliation_nicks],
+        }, separators=(',', ':')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productions', '0006_memberproduction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='production',
+            name='byline_cache',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(populate_byline_caches, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,11 @@
-from django.db import models
-from django.db.models.signals import post_delete
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
 from django.dispatch import receiver
 # from django.utils.encoding import StrAndUnicode
 from django.utils.translation import ugettext_lazy as _
 
 import datetime
+import json
 import random
 
 from taggit.managers import TaggableManager
@@ -15,8 +16,8 @@ from lib.prefetch_snooping import ModelWithPrefetchSnooping
 from lib.strip_markup import strip_markup
 
 from comments.models import Commentable
-from demoscene.models import DATE_PRECISION_CHOICES, Releaser, Nick, ReleaserExternalLink, ExternalLink
-from demoscene.utils import groklinks
+from demoscene.models import DATE_PRECISION_CHOICES, Releaser, Nick, ReleaserExternalLink, ExternalLink, Membership, Edit, with_supergroup_ids
+from demoscene.utils import fragment_cache, groklinks
 from demoscene.utils.text import generate_sort_key
 from mirror.models import Download, ArchiveMember
 
@@ -100,6 +101,9 @@ class Production(ModelWithPrefetchSnooping, Commentable):
 		help_text="Whether the notes field for this production will be indexed. (Untick this to avoid false matches in search results e.g. 'this demo was not by Magic / Nah-Kolor')")
 
 	sortable_title = models.CharField(max_length=255, blank=True, null=True, db_index=True)
+	# JSON rendering of the byline (see refresh_byline_caches), so that listings can show it
+	# without fetching author_nicks and author_affiliation_nicks. Empty if not yet populated
+	byline_cache = models.TextField(blank=True, default='', editable=False)
 
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField()
@@ -110,18 +114,47 @@ class Production(ModelWithPrefetchSnooping, Commentable):
 
 	# do the equivalent of self.author_nicks.select_related('releaser'), unless that would be
 	# less efficient because we've already got the author_nicks relation cached from a prefetch_related
+	# or stored in byline_cache. Nicks from byline_cache are unsaved instances, for display only
 	def author_nicks_with_authors(self):
 		if self.has_prefetched('author_nicks'):
 			return self.author_nicks.all()
+
+		cached_byline = self.cached_byline()
+		if cached_byline is not None:
+			return cached_byline.author_nicks
 		else:
 			return self.author_nicks.select_related('releaser')
 
 	def author_affiliation_nicks_with_groups(self):
 		if self.has_prefetched('author_affiliation_nicks'):
 			return self.author_affiliation_nicks.all()
+
+		cached_byline = self.cached_byline()
+		if cached_byline is not None:
+			return cached_byline.affiliation_nicks
 		else:
 			return self.author_affiliation_nicks.select_related('releaser')
 
+	def _get_byline_cache_data(self):
+		# parse byline_cache once per instance, unless it has been refreshed since
+		if getattr(self, '_byline_cache_data', (None, None))[0] != self.byline_cache:
+			self._byline_cache_data = (self.byline_cache, json.loads(self.byline_cache))
+		return self._byline_cache_data[1]
+
+	def cached_byline(self):
+		"""
+		Return the byline as stored in byline_cache, as a Byline of unsaved Nick instances
+		with their releasers attached, or None if the cache is not populated
+		"""
+		if not self.byline_cache:
+			return None
+
+		data = self._get_byline_cache_data()
+		return Byline(
+			[nick_from_byline_cache(nick) for nick in data['authors']],
+			[nick_from_byline_cache(nick) for nick in data['affiliations']]
+		)
+
 	def save(self, *args, **kwargs):
 		if self.id and not self.supertype:
 			self.supertype = self.inferred_supertype
@@ -136,6 +169,15 @@ class Production(ModelWithPrefetchSnooping, Commentable):
 		if self.updated_at is None:
 			self.updated_at = datetime.datetime.now()
 
+		# byline_cache is only ever written by UPDATEs from the handlers that refresh it, so
+		# don't write back the copy this instance was loaded with, which may be stale by now
+		if not (args or self._state.adding or kwargs.get('force_insert') or kwargs.get('update_fields') is not None):
+			deferred_fields = self.get_deferred_fields()
+			kwargs['update_fields'] = [
+				field.name for field in self._meta.concrete_fields
+				if not field.primary_key and field.name != 'byline_cache' and field.attname not in deferred_fields
+			]
+
 		return super(Production, self).save(*args, **kwargs)
 
 	def __unicode__(self):
@@ -152,7 +194,12 @@ class Production(ModelWithPrefetchSnooping, Commentable):
 			return BylineSearch.from_byline(self.byline())
 
 	def _get_byline_string(self):
-		return self.unparsed_byline or unicode(self.byline())
+		if self.unparsed_byline:
+			return self.unparsed_byline
+		elif self.byline_cache:
+			return self._get_byline_cache_data()['text']
+		else:
+			return unicode(self.byline())
 
 	def _set_byline_string(self, byline_string):
 		from demoscene.utils.nick_search import BylineSearch
@@ -290,6 +337,17 @@ class Production(ModelWithPrefetchSnooping, Commentable):
 	def tags_string(self):
 		return ', '.join([tag.name for tag in self.tags.all()])
 
+	@property
+	def platform_ids(self):
+		if self.has_prefetched('platforms'):
+			return [platform.id for platform in self.platforms.all()]
+		else:
+			return list(self.platforms.values_list('id', flat=True))
+
+	@property
+	def release_year(self):
+		return self.release_date_date and self.release_date_date.year
+
 	def search_result_json(self):
 		if self.default_screenshot:
 			width, height = self.default_screenshot.thumb_dimensions_to_fit(48, 36)
@@ -402,6 +460,46 @@ class Byline(object):
 		return Byline()
 
 
+def nick_to_byline_cache(nick):
+	return {
+		'id': nick.id, 'name': nick.name, 'abbreviation': nick.abbreviation,
+		'releaser_id': nick.releaser_id, 'releaser_name': nick.releaser.name, 'is_group': nick.releaser.is_group,
+	}
+
+
+def nick_from_byline_cache(data):
+	releaser = Releaser(id=data['releaser_id'], name=data['releaser_name'], is_group=data['is_group'])
+	return Nick(id=data['id'], name=data['name'], abbreviation=data['abbreviation'], releaser=releaser)
+
+
+def refresh_byline_caches(production_ids):
+	"""
+	Rebuild Production.byline_cache for the given productions from their author and affiliation nicks.
+	Returns a dict of production id => new byline_cache value
+	"""
+	production_ids = set(production_ids)
+	if not production_ids:
+		return {}
+
+	bylines = dict((production_id, Byline([], [])) for production_id in production_ids)
+	# ordered to match Nick's default ordering, as used by author_nicks.all()
+	for link in Production.author_nicks.through.objects.filter(production_id__in=production_ids).select_related('nick__releaser').order_by('nick__name'):
+		bylines[link.production_id].author_nicks.append(link.nick)
+	for link in Production.author_affiliation_nicks.through.objects.filter(production_id__in=production_ids).select_related('nick__releaser').order_by('nick__name'):
+		bylines[link.production_id].affiliation_nicks.append(link.nick)
+
+	byline_caches = {}
+	for production_id, byline in bylines.iteritems():
+		byline_caches[production_id] = json.dumps({
+			'text': unicode(byline),
+			'authors': [nick_to_byline_cache(nick) for nick in byline.author_nicks],
+			'affiliations': [nick_to_byline_cache(nick) for nick in byline.affiliation_nicks],
+		}, separators=(',', ':'))
+		Production.objects.filter(id=production_id).update(byline_cache=byline_caches[production_id])
+
+	return byline_caches
+
+
 class ProductionDemozoo0Platform(models.Model):
 	production = models.ForeignKey(Production, related_name='demozoo0_platforms')
 	platform = models.CharField(max_length=64)
@@ -466,6 +564,8 @@ class Screenshot(models.Model):
 
 	# for diagnostics: ID of the mirror.models.Download instance that this screen was generated from
 	source_download_id = models.IntegerField(editable=False, null=True, blank=True)
+	# SHA1 hash of the source image file, so that renditions can be reused when the same image is seen again
+	source_sha1 = models.CharField(max_length=40, editable=False, blank=True, db_index=True)
 
 	def thumb_dimensions_to_fit(self, width, height):
 		# return the width and height to render the thumbnail image at in order to fit within the given
@@ -493,6 +593,19 @@ class Screenshot(models.Model):
 		# reset that flag since we no longer need a screenshot
 		self.production.links.filter(is_unresolved_for_screenshotting=True).update(is_unresolved_for_screenshotting=False)
 
+	@staticmethod
+	def find_by_source_sha1(sha1):
+		"""Return an existing screenshot with all renditions in place for the source file with the given SHA1, if any"""
+		return Screenshot.objects.filter(source_sha1=sha1).exclude(original_url='').exclude(
+			standard_url=''
+		).exclude(thumbnail_url='').order_by('id').first()
+
+	def copy_renditions_from(self, other):
+		for field in ('original', 'standard', 'thumbnail'):
+			for suffix in ('url', 'width', 'height'):
+				attname = '%s_%s' % (field, suffix)
+				setattr(self, attname, getattr(other, attname))
+
 	def __unicode__(self):
 		return "%s - %s" % (self.production.title, self.original_url)
 
@@ -633,32 +746,39 @@ class ProductionLink(ExternalLink):
 			self.embed_data_last_fetch_time = datetime.datetime.now()
 			self.save()
 
-	def last_successful_download(self):
-		return Download.objects.filter(
-			link_class=self.link_class, parameter=self.parameter
-		).exclude(sha1='').order_by('-downloaded_at').first()
+	def downloads(self):
+		return Download.objects.filter(link_class=self.link_class, parameter=self.parameter)
+
+	# The following methods accept the list of this link's Download records, if it has already
+	# been fetched (see mirror.actions.find_screenshottable_graphics)
+
+	def last_successful_download(self, downloads=None):
+		if downloads is None:
+			return self.downloads().exclude(sha1='').order_by('-downloaded_at').first()
 
-	def archive_members(self):
-		download = self.last_successful_download()
+		successful_downloads = [download for download in downloads if download.sha1]
+		if successful_downloads:
+			return max(successful_downloads, key=lambda download: download.downloaded_at)
+
+	def archive_members(self, downloads=None):
+		download = self.last_successful_download(downloads)
 		if download:
 			return ArchiveMember.objects.filter(archive_sha1=download.sha1)
 		else:
 			return ArchiveMember.objects.none()
 
-	def is_believed_downloadable(self):
+	def is_believed_downloadable(self, downloads=None):
+		if downloads is None:
+			downloads = list(self.downloads())
+
 		# mirrored files are always downloadable
-		mirrored_downloads = Download.objects.filter(
-			link_class=self.link_class, parameter=self.parameter
-		).exclude(mirror_s3_key='')
-		if mirrored_downloads.exists():
+		if any(download.mirror_s3_key for download in downloads):
 			return True
 
-		last_download = Download.objects.filter(
-			link_class=self.link_class, parameter=self.parameter
-		).order_by('-downloaded_at').first()
-		if last_download is None:
+		if not downloads:
 			# no previous downloads, so assume good
 			return True
+		last_download = max(downloads, key=lambda download: download.downloaded_at)
 
 		# if we got a FileTooBig response last time, assume it'll never be downloadable
 		if last_download.error_type == 'FileTooBig':
@@ -684,3 +804,355 @@ class ProductionLink(ExternalLink):
 class Ansi(models.Model):
 	production = models.ForeignKey(Production, related_name='ansis', on_delete=models.CASCADE)
 	url = models.URLField(max_length=255)
+
+
+class ReleaserTimelineEntry(models.Model):
+	"""
+	Denormalised listing of the productions each releaser has worked on, as shown on their
+	page by the combined_releases tag: one row per production for each nick that is credited on
+	it (with a summary of the credits), plus one row for each production that the releaser is
+	an author of but not credited on. Kept up to date by the signal handlers below.
+	"""
+	releaser = models.ForeignKey(Releaser, related_name='timeline_entries')
+	production = models.ForeignKey(Production, related_name='+')
+	nick = models.ForeignKey(Nick, null=True, related_name='+')
+	role_summary = models.CharField(max_length=255, blank=True)
+	release_date_date = models.DateField(null=True)
+	sortable_title = models.CharField(max_length=255)
+
+	REFRESH_SQL = '''
+		INSERT INTO productions_releasertimelineentry (releaser_id, production_id, nick_id, role_summary, release_date_date, sortable_title)
+		SELECT
+			demoscene_nick.releaser_id, productions_production.id, demoscene_nick.id,
+			LEFT(string_agg(
+				CASE WHEN productions_credit.role <> '' THEN productions_credit.category || ' (' || productions_credit.role || ')' ELSE productions_credit.category END,
+				', ' ORDER BY productions_credit.id
+			), 255),
+			productions_production.release_date_date, COALESCE(productions_production.sortable_title, '')
+		FROM productions_credit
+		INNER JOIN demoscene_nick ON (demoscene_nick.id = productions_credit.nick_id)
+		INNER JOIN productions_production ON (productions_production.id = productions_credit.production_id)
+		WHERE %(condition)s
+		GROUP BY demoscene_nick.releaser_id, productions_production.id, demoscene_nick.id
+		UNION ALL
+		SELECT DISTINCT
+			demoscene_nick.releaser_id, productions_production.id, NULL,
+			'',
+			productions_production.release_date_date, COALESCE(productions_production.sortable_title, '')
+		FROM productions_production_author_nicks
+		INNER JOIN demoscene_nick ON (demoscene_nick.id = productions_production_author_nicks.nick_id)
+		INNER JOIN productions_production ON (productions_production.id = productions_production_author_nicks.production_id)
+		WHERE (%(condition)s) AND NOT EXISTS (
+			SELECT 1 FROM productions_credit
+			INNER JOIN demoscene_nick AS credited_nick ON (credited_nick.id = productions_credit.nick_id)
+			WHERE productions_credit.production_id = productions_production.id
+			AND credited_nick.releaser_id = demoscene_nick.releaser_id
+		)
+	'''
+
+	@staticmethod
+	def refresh(releaser_ids=None, production_ids=None):
+		"""
+		Rebuild the rows for any of releaser_ids and any of production_ids
+		(or all rows, if neither is given)
+		"""
+		from django.db import connection
+
+		if releaser_ids is None and production_ids is None:
+			filters, condition, params = None, 'TRUE', []
+		else:
+			filters, conditions, params = models.Q(), [], []
+			if releaser_ids:
+				releaser_ids = tuple(set(releaser_ids))
+				filters |= models.Q(releaser_id__in=releaser_ids)
+				conditions.append('demoscene_nick.releaser_id IN %s')
+				params.append(releaser_ids)
+			if production_ids:
+				production_ids = tuple(set(production_ids))
+				filters |= models.Q(production_id__in=production_ids)
+				conditions.append('productions_production.id IN %s')
+				params.append(production_ids)
+			if not conditions:
+				return
+			condition = ' OR '.join(conditions)
+
+		# readers should never see the listing with the old rows deleted and the new ones not yet in
+		with transaction.atomic():
+			if filters is None:
+				ReleaserTimelineEntry.objects.all().delete()
+			else:
+				ReleaserTimelineEntry.objects.filter(filters).delete()
+			cursor = connection.cursor()
+			cursor.execute(ReleaserTimelineEntry.REFRESH_SQL % {'condition': condition}, params + params)
+
+
+class MemberProduction(models.Model):
+	"""
+	Denormalised closure of the productions listed as a group's member productions: one row for
+	each production whose byline names the group, or any of its subgroups at any depth, as an
+	affiliation, or is authored by any of its subgroups. Kept up to date by the signal handlers below.
+	"""
+	group = models.ForeignKey(Releaser, related_name='+')
+	production = models.ForeignKey(Production, related_name='member_production_entries')
+
+	REFRESH_SQL = '''
+		WITH RECURSIVE subgroups(group_id, subgroup_id) AS (
+			SELECT demoscene_releaser.id, demoscene_releaser.id
+			FROM demoscene_releaser
+			WHERE demoscene_releaser.is_group AND (%(group_condition)s)
+			UNION
+			SELECT subgroups.group_id, demoscene_membership.member_id
+			FROM subgroups
+			INNER JOIN demoscene_membership ON (demoscene_membership.group_id = subgroups.subgroup_id)
+			INNER JOIN demoscene_releaser ON (demoscene_releaser.id = demoscene_membership.member_id)
+			WHERE demoscene_releaser.is_group
+		)
+		INSERT INTO productions_memberproduction (group_id, production_id)
+		SELECT subgroups.group_id, production_nicks.production_id
+		FROM subgroups
+		INNER JOIN demoscene_nick ON (demoscene_nick.releaser_id = subgroups.subgroup_id)
+		INNER JOIN productions_production_author_affiliation_nicks AS production_nicks ON (production_nicks.nick_id = demoscene_nick.id)
+		WHERE %(production_condition)s
+		UNION
+		SELECT subgroups.group_id, production_nicks.production_id
+		FROM subgroups
+		INNER JOIN demoscene_nick ON (demoscene_nick.releaser_id = subgroups.subgroup_id)
+		INNER JOIN productions_production_author_nicks AS production_nicks ON (production_nicks.nick_id = demoscene_nick.id)
+		WHERE subgroups.subgroup_id <> subgroups.group_id AND (%(production_condition)s)
+		RETURNING group_id
+	'''
+
+	@staticmethod
+	def refresh(group_ids=None, production_ids=None):
+		"""
+		Rebuild the rows for the given groups and/or productions (or all rows, if neither is given).
+		Returns the ids of the groups whose rows were rebuilt.
+		"""
+		from django.db import connection
+
+		filters = models.Q()
+		group_condition, group_params = 'TRUE', []
+		production_condition, production_params = 'TRUE', []
+		if group_ids is not None:
+			group_ids = tuple(set(group_ids))
+			if not group_ids:
+				return set()
+			filters &= models.Q(group_id__in=group_ids)
+			group_condition, group_params = 'demoscene_releaser.id IN %s', [group_ids]
+		if production_ids is not None:
+			production_ids = tuple(set(production_ids))
+			if not production_ids:
+				return set()
+			filters &= models.Q(production_id__in=production_ids)
+			production_condition, production_params = 'production_nicks.production_id IN %s', [production_ids]
+
+		with transaction.atomic():
+			rows = MemberProduction.objects.filter(filters)
+			affected_group_ids = set(rows.values_list('group_id', flat=True))
+			rows.delete()
+			cursor = connection.cursor()
+			cursor.execute(
+				MemberProduction.REFRESH_SQL % {'group_condition': group_condition, 'production_condition': production_condition},
+				group_params + production_params + production_params
+			)
+			affected_group_ids.update(group_id for (group_id,) in cursor.fetchall())
+
+		return affected_group_ids
+
+	class Meta:
+		unique_together = [
+			['group', 'production'],
+		]
+
+
+# Refreshes are deferred until the transaction commits, so that they see the final state of the
+# database. These handlers are connected before the fragment_cache registrations below, so that
+# cached releaser pages are invalidated only after their timelines have been rebuilt; groups
+# whose member productions change are invalidated once the closure has been rebuilt.
+
+def refresh_timeline_entries_on_commit(releaser_ids=None, production_ids=None):
+	transaction.on_commit(lambda: ReleaserTimelineEntry.refresh(releaser_ids=releaser_ids, production_ids=production_ids))
+
+
+def refresh_member_productions(group_ids=None, production_ids=None):
+	group_ids = MemberProduction.refresh(group_ids=group_ids, production_ids=production_ids)
+	fragment_cache.invalidate_objects(Releaser, group_ids)
+
+
+def refresh_member_productions_on_commit(group_ids=None, production_ids=None):
+	transaction.on_commit(lambda: refresh_member_productions(group_ids=group_ids, production_ids=production_ids))
+
+
+@receiver([post_save, post_delete], sender=Credit)
+def refresh_timeline_entries_for_credit(sender, **kwargs):
+	if not kwargs.get('raw'):
+		refresh_timeline_entries_on_commit(production_ids=[kwargs['instance'].production_id])
+
+
+# also catches bulk updates to credits, which are always followed by saving the production
+@receiver(post_save, sender=Production)
+def refresh_timeline_entries_for_production(sender, **kwargs):
+	if not kwargs.get('raw'):
+		refresh_timeline_entries_on_commit(production_ids=[kwargs['instance'].id])
+
+
+@receiver(m2m_changed, sender=Production.author_nicks.through)
+@receiver(m2m_changed, sender=Production.author_affiliation_nicks.through)
+def refresh_listings_for_byline(sender, **kwargs):
+	action, instance = kwargs['action'], kwargs['instance']
+	if action == 'pre_clear' and kwargs['reverse']:
+		# a clear() from the nick's side doesn't tell us afterwards which productions were affected
+		production_ids = list(sender.objects.filter(nick_id=instance.id).values_list('production_id', flat=True))
+		transaction.on_commit(lambda: refresh_byline_caches(production_ids))
+	if not action.startswith('post_'):
+		return
+	is_authors = (sender == Production.author_nicks.through)
+
+	# byline caches are refreshed immediately, so that the byline is up to date
+	# when the production is rendered later in the same request
+	if not kwargs['reverse']:
+		production_ids = [instance.id]
+		instance.byline_cache = refresh_byline_caches(production_ids)[instance.id]
+	elif kwargs['pk_set'] is not None:
+		production_ids = kwargs['pk_set']
+		refresh_byline_caches(production_ids)
+	else:
+		if is_authors:
+			refresh_timeline_entries_on_commit(releaser_ids=[instance.releaser_id])
+		refresh_member_productions_on_commit(group_ids=with_supergroup_ids([instance.releaser_id]))
+		return
+
+	if is_authors:
+		refresh_timeline_entries_on_commit(production_ids=production_ids)
+	refresh_member_productions_on_commit(production_ids=production_ids)
+
+
+@receiver([post_save, post_delete], sender=Membership)
+def refresh_member_productions_for_membership(sender, **kwargs):
+	if not kwargs.get('raw'):
+		group_id = kwargs['instance'].group_id
+		transaction.on_commit(lambda: refresh_member_productions(group_ids=with_supergroup_ids([group_id])))
+
+
+# converting between scener and group adds or removes a subgroup
+@receiver(post_save, sender=Edit)
+def refresh_member_productions_for_conversion(sender, **kwargs):
+	edit = kwargs['instance']
+	if not kwargs.get('raw') and edit.action_type in ('convert_to_group', 'convert_to_scener'):
+		releaser_id = edit.focus_object_id
+		transaction.on_commit(lambda: refresh_member_productions(group_ids=with_supergroup_ids([releaser_id])))
+
+
+def nick_byline_production_ids(nick_ids):
+	production_ids = set(
+		Production.author_nicks.through.objects.filter(nick_id__in=nick_ids).values_list('production_id', flat=True)
+	)
+	production_ids.update(
+		Production.author_affiliation_nicks.through.objects.filter(nick_id__in=nick_ids).values_list('production_id', flat=True)
+	)
+	return production_ids
+
+
+def nick_production_ids(nick_id):
+	production_ids = set(Credit.objects.filter(nick_id=nick_id).values_list('production_id', flat=True))
+	production_ids.update(nick_byline_production_ids([nick_id]))
+	return production_ids
+
+
+# a nick may have been renamed or moved to a different releaser
+@receiver(post_save, sender=Nick)
+def refresh_listings_for_nick(sender, **kwargs):
+	if not kwargs.get('raw'):
+		nick_id = kwargs['instance'].id
+		if not kwargs.get('created'):
+			refresh_byline_caches(nick_byline_production_ids([nick_id]))
+
+		def refresh():
+			production_ids = nick_production_ids(nick_id)
+			ReleaserTimelineEntry.refresh(production_ids=production_ids)
+			refresh_member_productions(production_ids=production_ids)
+
+		transaction.on_commit(refresh)
+
+
+@receiver(pre_delete, sender=Nick)
+def refresh_listings_for_deleted_nick(sender, **kwargs):
+	# bylines are deleted along with the nick without sending m2m_changed,
+	# so find the affected productions while they still point to it
+	production_ids = nick_production_ids(kwargs['instance'].id)
+	refresh_timeline_entries_on_commit(production_ids=production_ids)
+	refresh_member_productions_on_commit(production_ids=production_ids)
+	transaction.on_commit(lambda: refresh_byline_caches(production_ids))
+
+
+# byline caches include the releaser's name and whether it's a group (which determines its URL);
+# releasers are saved on most edits to them, so only refresh bylines when these have changed
+# (compared against the values the instance was loaded with, to avoid an extra query on every save)
+@receiver(post_init, sender=Releaser)
+def remember_releaser_byline_fields(sender, **kwargs):
+	releaser = kwargs['instance']
+	if releaser.id:
+		releaser._byline_fields_at_load = (releaser.name, releaser.is_group)
+
+
+@receiver(post_save, sender=Releaser)
+def refresh_byline_caches_for_releaser(sender, **kwargs):
+	releaser = kwargs['instance']
+	byline_fields = (releaser.name, releaser.is_group)
+	# new releasers aren't in any bylines yet; instances loaded with deferred fields
+	# don't pass through the post_init handler above, so refresh those regardless
+	if not (kwargs.get('raw') or kwargs.get('created')) and getattr(releaser, '_byline_fields_at_load', None) != byline_fields:
+		refresh_byline_caches(nick_byline_production_ids(releaser.nicks.values_list('id', flat=True)))
+	releaser._byline_fields_at_load = byline_fields
+
+
+def production_fragment_dependencies(production_ids):
+	"""
+	Return a list of (model, ids) pairs for the objects whose cached page fragments
+	(see demoscene.utils.fragment_cache) display any of the given productions
+	"""
+	from parties.models import Party, CompetitionPlacing
+
+	production_ids = set(production_ids)
+	if not production_ids:
+		return []
+
+	related_production_ids = set(production_ids)
+	related_production_ids.update(PackMember.objects.filter(member_id__in=production_ids).values_list('pack_id', flat=True))
+	related_production_ids.update(PackMember.objects.filter(pack_id__in=production_ids).values_list('member_id', flat=True))
+	related_production_ids.update(SoundtrackLink.objects.filter(soundtrack_id__in=production_ids).values_list('production_id', flat=True))
+
+	party_ids = set(CompetitionPlacing.objects.filter(production_id__in=production_ids).values_list('competition__party_id', flat=True))
+	party_ids.update(Party.invitations.through.objects.filter(production_id__in=production_ids).values_list('party_id', flat=True))
+	party_ids.update(Party.releases.through.objects.filter(production_id__in=production_ids).values_list('party_id', flat=True))
+
+	releaser_ids = set(Production.author_nicks.through.objects.filter(production_id__in=production_ids).values_list('nick__releaser_id', flat=True))
+	releaser_ids.update(Production.author_affiliation_nicks.through.objects.filter(production_id__in=production_ids).values_list('nick__releaser_id', flat=True))
+	releaser_ids.update(Credit.objects.filter(production_id__in=production_ids).values_list('nick__releaser_id', flat=True))
+	# groups list their members' productions
+	releaser_ids.update(Membership.objects.filter(member_id__in=releaser_ids).values_list('group_id', flat=True))
+	releaser_ids.update(MemberProduction.objects.filter(production_id__in=production_ids).values_list('group_id', flat=True))
+
+	return [(Production, related_production_ids), (Party, party_ids), (Releaser, releaser_ids)]
+
+
+fragment_cache.register(Production, lambda productions: production_fragment_dependencies(
+	[production.id for production in productions]
+))
+fragment_cache.register(Screenshot, lambda screenshots: production_fragment_dependencies(
+	[screenshot.production_id for screenshot in screenshots]
+))
+fragment_cache.register(Credit, lambda credits: [
+	(Production, [credit.production_id for credit in credits]),
+	(Releaser, Nick.objects.filter(id__in=[credit.nick_id for credit in credits]).values_list('releaser_id', flat=True)),
+])
+# the carousel shows video and audio links
+fragment_cache.register(ProductionLink, lambda links: [
+	(Production, [link.production_id for link in links]),
+])
+fragment_cache.register(PackMember, lambda pack_members: [
+	(Production, [pack_member.pack_id for pack_member in pack_members] + [pack_member.member_id for pack_member in pack_members]),
+])
+fragment_cache.register(SoundtrackLink, lambda soundtrack_links: [
+	(Production, [link.production_id for link in soundtrack_links] + [link.soundtrack_id for link in soundtrack_links]),
+])
@@ -0,0 +1,54 @@
+from __future__ import unicode_literals
+
+from django.test import TestCase
+
+from demoscene.models import Releaser
+from productions.models import Production
+
+
+class BylineCacheTests(TestCase):
+	def setUp(self):
+		self.gasman = Releaser.objects.create(name='Gasman', is_group=False)
+		self.hooy_program = Releaser.objects.create(name='Hooy-Program', is_group=True)
+		self.production = Production.objects.create(title='Mooncheese')
+		self.production.author_nicks = [self.gasman.primary_nick]
+		self.production.author_affiliation_nicks = [self.hooy_program.primary_nick]
+
+	def test_byline_cache_is_populated(self):
+		self.assertEqual(self.production.byline_string, 'Gasman / Hooy-Program')
+
+		production = Production.objects.get(id=self.production.id)
+		with self.assertNumQueries(0):
+			authors = production.author_nicks_with_authors()
+			groups = production.author_affiliation_nicks_with_groups()
+		self.assertEqual([(nick.name, nick.releaser.name) for nick in authors], [('Gasman', 'Gasman')])
+		self.assertTrue(groups[0].releaser.is_group)
+
+	def test_byline_cache_follows_nick_renames(self):
+		nick = self.gasman.primary_nick
+		nick.name = 'Shingebis'
+		nick.save()
+
+		production = Production.objects.get(id=self.production.id)
+		self.assertEqual(production.byline_string, 'Shingebis / Hooy-Program')
+		self.assertEqual(production.author_nicks_with_authors()[0].releaser.name, 'Shingebis')
+
+	def test_byline_cache_follows_releaser_renames(self):
+		self.hooy_program.name = 'Hooy Program'
+		self.hooy_program.save()
+
+		production = Production.objects.get(id=self.production.id)
+		self.assertEqual(production.author_affiliation_nicks_with_groups()[0].releaser.name, 'Hooy Program')
+
+	def test_saving_stale_instance_keeps_byline_cache(self):
+		production = Production.objects.get(id=self.production.id)
+		nick = self.gasman.primary_nick
+		nick.name = 'Shingebis'
+		nick.save()
+
+		production.title = 'Mooncheese 2'
+		production.save()
+
+		production = Production.objects.get(id=self.production.id)
+		self.assertEqual(production.title, 'Mooncheese 2')
+		self.assertEqual(production.byline_string, 'Shingebis / Hooy-Program')
@@ -5,6 +5,7 @@ import datetime
 from django.shortcuts import get_object_or_404, render
 from django.http import HttpResponseRedirect
 from django.contrib.auth.decorators import login_required
+from django.utils.functional import SimpleLazyObject
 
 from demoscene.shortcuts import get_page
 from demoscene.models import Edit
@@ -36,7 +37,7 @@ def index(request):
 			prod_types = ProductionType.get_tree(form.cleaned_data['production_type'])
 			queryset = queryset.filter(types__in=prod_types)
 
-	queryset = queryset.select_related('default_screenshot').prefetch_related('author_nicks__releaser', 'author_affiliation_nicks__releaser', 'platforms', 'types')
+	queryset = queryset.select_related('default_screenshot').prefetch_related('platforms', 'types')
 
 	production_page = get_page(
 		queryset,
@@ -67,16 +68,16 @@ def show(request, production_id, edit_mode=False):
 	return render(request, 'productions/show.html', {
 		'production': production,
 		'credits': production.credits_for_listing(),
-		'carousel': Carousel(production, request.user),
+		'carousel': SimpleLazyObject(lambda: Carousel(production, request.user)),
 		'download_links': production.download_links,
 		'external_links': production.external_links,
 		'competition_placings': production.competition_placings.order_by('competition__party__start_date_date'),
 		'invitation_parties': production.invitation_parties.order_by('start_date_date'),
 		'release_parties': production.release_parties.order_by('start_date_date'),
-		'packed_in_productions': [
+		'packed_in_productions': SimpleLazyObject(lambda: [
 			pack_member.pack for pack_member in
 			production.packed_in.select_related('pack', 'pack__default_screenshot').order_by('pack__release_date_date')
-		],
+		]),
 		'tags': production.tags.order_by('name'),
 		'blurbs': production.blurbs.all() if request.user.is_staff else None,
 		'comment_form': comment_form,
@@ -2,6 +2,7 @@ from __future__ import absolute_import  # ensure that 'from productions.* import
 
 from django.shortcuts import get_object_or_404, render
 from django.http import HttpResponseRedirect
+from django.utils.functional import SimpleLazyObject
 
 from demoscene.shortcuts import get_page
 from demoscene.models import Edit
@@ -37,7 +38,7 @@ def index(request):
 			prod_types = ProductionType.get_tree(form.cleaned_data['production_type'])
 			queryset = queryset.filter(types__in=prod_types)
 
-	queryset = queryset.select_related('default_screenshot').prefetch_related('author_nicks__releaser', 'author_affiliation_nicks__releaser', 'platforms', 'types')
+	queryset = queryset.select_related('default_screenshot').prefetch_related('platforms', 'types')
 
 	production_page = get_page(
 		queryset,
@@ -70,15 +71,15 @@ def show(request, production_id, edit_mode=False):
 		'download_links': production.download_links,
 		'external_links': production.external_links,
 		'credits': production.credits_for_listing(),
-		'carousel': Carousel(production, request.user),
-		'featured_in_productions': [
+		'carousel': SimpleLazyObject(lambda: Carousel(production, request.user)),
+		'featured_in_productions': SimpleLazyObject(lambda: [
 			appearance.production for appearance in
 			production.appearances_as_soundtrack.select_related('production', 'production__default_screenshot').order_by('production__release_date_date')
-		],
-		'packed_in_productions': [
+		]),
+		'packed_in_productions': SimpleLazyObject(lambda: [
 			pack_member.pack for pack_member in
 			production.packed_in.select_related('pack', 'pack__default_screenshot').order_by('pack__release_date_date')
-		],
+		]),
 		'competition_placings': production.competition_placings.order_by('competition__party__start_date_date'),
 		'invitation_parties': production.invitation_parties.order_by('start_date_date'),
 		'release_parties': production.release_parties.order_by('start_date_date'),
@@ -11,6 +11,7 @@ from django.template.loader import render_to_string
 from django.template import RequestContext
 from django.shortcuts import get_object_or_404, redirect, render
 from django.core.urlresolvers import reverse
+from django.utils.functional import SimpleLazyObject
 from django.views.decorators.http import require_POST
 
 from taggit.models import Tag
@@ -47,7 +48,7 @@ def index(request):
 			prod_types = ProductionType.get_tree(form.cleaned_data['production_type'])
 			queryset = queryset.filter(types__in=prod_types)
 
-	queryset = queryset.select_related('default_screenshot').prefetch_related('author_nicks__releaser', 'author_affiliation_nicks__releaser', 'platforms', 'types')
+	queryset = queryset.select_related('default_screenshot').prefetch_related('platforms', 'types')
 
 	production_page = get_page(
 		queryset,
@@ -67,7 +68,7 @@ def tagged(request, tag_name):
 		tag = Tag.objects.get(name=tag_name)
 	except Tag.DoesNotExist:
 		tag = Tag(name=tag_name)
-	queryset = Production.objects.filter(tags__name=tag_name).prefetch_related('author_nicks__releaser', 'author_affiliation_nicks__releaser', 'platforms', 'types')
+	queryset = Production.objects.filter(tags__name=tag_name).prefetch_related('platforms', 'types')
 
 	order = request.GET.get('order', 'date')
 	asc = request.GET.get('dir', 'desc') == 'asc'
@@ -112,11 +113,13 @@ def show(request, production_id, edit_mode=False):
 		comment_form = None
 		tags_form = None
 
+	# the carousel and secondary panels are evaluated lazily, so that nothing is fetched for them
+	# if they are served from the fragment cache
 	if production.can_have_pack_members():
-		pack_members = [
+		pack_members = SimpleLazyObject(lambda: [
 			link.member for link in
 			production.pack_members.select_related('member').prefetch_related('member__author_nicks__releaser', 'member__author_affiliation_nicks__releaser')
-		]
+		])
 	else:
 		pack_members = None
 
@@ -124,24 +127,24 @@ def show(request, production_id, edit_mode=False):
 		'production': production,
 		'editing_credits': (request.GET.get('editing') == 'credits'),
 		'credits': production.credits_for_listing(),
-		'carousel': Carousel(production, request.user),
+		'carousel': SimpleLazyObject(lambda: Carousel(production, request.user)),
 
 		'download_links': production.download_links,
 		'external_links': production.external_links,
-		'soundtracks': [
+		'soundtracks': SimpleLazyObject(lambda: [
 			link.soundtrack for link in
 			production.soundtrack_links.order_by('position').select_related('soundtrack').prefetch_related('soundtrack__author_nicks__releaser', 'soundtrack__author_affiliation_nicks__releaser')
-		],
+		]),
 		'competition_placings': production.competition_placings.select_related('competition__party').order_by('competition__party__start_date_date'),
 		'invitation_parties': production.invitation_parties.order_by('start_date_date'),
 		'release_parties': production.release_parties.order_by('start_date_date'),
 		'tags': production.tags.order_by('name'),
 		'blurbs': production.blurbs.all() if request.user.is_staff else None,
 		'pack_members': pack_members,
-		'packed_in_productions': [
+		'packed_in_productions': SimpleLazyObject(lambda: [
 			pack_member.pack for pack_member in
 			production.packed_in.select_related('pack', 'pack__default_screenshot').order_by('pack__release_date_date')
-		],
+		]),
 		'comment_form': comment_form,
 		'tags_form': tags_form,
 	})
@@ -1,24 +1,54 @@
-import gzip
+import hashlib
 import re
+import zlib
 from ftplib import FTP
-import StringIO
+
+CHUNK_SIZE = 64 * 1024
+
 
 def parse_all_dirs():
 	ftp = FTP('ftp.scene.org')
 	ftp.login('anonymous', 'gasman@raww.org')
-	gzipped_file = StringIO.StringIO()
-	ftp.retrbinary('RETR ls-lR.gz', gzipped_file.write)
-	ftp.quit()
+	ftp.voidcmd('TYPE I')
+
+	# decompress and parse the listing as it arrives, rather than downloading it in full first
+	conn = ftp.transfercmd('RETR ls-lR.gz')
+	try:
+		chunks = iter(lambda: conn.recv(CHUNK_SIZE), '')
+		for dir_name, entries in parse_listing(gunzip_lines(chunks)):
+			yield (dir_name, entries)
+	finally:
+		conn.close()
+		ftp.close()
+
 
-	gzipped_file.seek(0)
-	f = gzip.GzipFile(fileobj=gzipped_file)
+def gunzip_lines(chunks):
+	"""Decompress a gzip stream, given as an iterable of byte strings, and yield it line by line"""
+	decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+	remainder = ''
+	for chunk in chunks:
+		lines = (remainder + decompressor.decompress(chunk)).split('\n')
+		remainder = lines.pop()
+		for line in lines:
+			yield line + '\n'
 
+	remainder += decompressor.flush()
+	lines = remainder.split('\n')
+	remainder = lines.pop()
+	for line in lines:
+		yield line + '\n'
+	if remainder:
+		yield remainder
+
+
+def parse_listing(lines):
+	lines = iter(lines)
 	while True:
 		# read the ls-lR file as iso-8859-1 - not because it actually IS iso-8859-1
 		# (it's actually utf-8), but because we want to preserve the filenames in
 		# bytestring form (and iso-8859-1 is the hack we use to store bytestrings in
 		# a unicode database field).
-		line = f.readline().decode('iso-8859-1')
+		line = next(lines, '').decode('iso-8859-1')
 		if not line:
 			break
 
@@ -29,20 +59,20 @@ def parse_all_dirs():
 		else:
 			raise Exception("Expected dir name line, got %r" % line)
 
-		line = f.readline()
+		line = next(lines, '')
 		if not re.match(r'total \d+$', line):
 			raise Exception("Expected 'total' line, got %r" % line)
 
-		entries = get_dir_listing(f)
+		entries = get_dir_listing(lines)
 		if not dir_name.startswith('/incoming/'):
 			yield (dir_name, entries)
 
 
-def get_dir_listing(f):
+def get_dir_listing(lines):
 	entries = []
 
 	while True:
-		line = f.readline().decode('iso-8859-1')
+		line = next(lines, '').decode('iso-8859-1')
 		if not line or line == "\n":
 			break
 
@@ -59,3 +89,11 @@ def get_dir_listing(f):
 			raise Exception("Expected dir entry, got %r" % line)
 
 	return entries
+
+
+def listing_hash(entries):
+	"""
+	Return a hash of a directory listing as returned by parse_all_dirs, to compare against
+	the listing seen on the previous scan
+	"""
+	return hashlib.sha1(repr(sorted(entries)).encode('utf-8')).hexdigest()
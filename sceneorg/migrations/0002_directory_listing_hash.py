@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sceneorg', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='directory',
+            name='listing_hash',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+    ]
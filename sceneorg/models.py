@@ -11,12 +11,17 @@ class Directory(models.Model):
 	last_spidered_at = models.DateTimeField(null=True, blank=True)
 	parent = models.ForeignKey('Directory', related_name='subdirectories', null=True, blank=True)
 	competitions = models.ManyToManyField('parties.Competition', related_name="sceneorg_directories")
+	# hash of this directory's entry in the ls-lR listing on the last scan, so that the next scan
+	# can skip it if unchanged (see sceneorg.dirparser.listing_hash)
+	listing_hash = models.CharField(max_length=40, blank=True, editable=False)
 
 	def mark_deleted(self):
 		for dir in self.subdirectories.all():
 			dir.mark_deleted()
 		self.files.all().update(is_deleted=True)
 		self.is_deleted = True
+		# if the directory reappears, its listing must be processed again
+		self.listing_hash = ''
 		self.save()
 
 	def __unicode__(self):
@@ -49,7 +54,8 @@ class FileTooBig(Exception):
 class File(models.Model):
 	path = models.CharField(max_length=255, db_index=True)
 	is_deleted = models.BooleanField(default=False)
-	first_seen_at = models.DateTimeField(null=True, auto_now_add=True)
+	# indexed to find newly-added files (see demoscene.tasks.find_sceneorg_results_file_matches)
+	first_seen_at = models.DateTimeField(null=True, auto_now_add=True, db_index=True)
 	last_seen_at = models.DateTimeField()
 	directory = models.ForeignKey(Directory, related_name='files')
 	size = models.BigIntegerField(null=True)
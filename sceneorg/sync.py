@@ -0,0 +1,157 @@
+import datetime
+import itertools
+import logging
+
+from sceneorg.models import Directory, File
+
+logger = logging.getLogger(__name__)
+
+# maximum number of paths to look up in one query
+BATCH_SIZE = 1000
+
+
+def chunked(items, size):
+	for i in range(0, len(items), size):
+		yield items[i:i + size]
+
+
+def parent_path(path):
+	# '/parties/2000/' => '/parties/'; '/' => None
+	return path[:path.rstrip('/').rfind('/') + 1] or None
+
+
+class DirectorySync(object):
+	"""
+	Records entries from scene.org directory listings in the Directory and File tables
+	in bulk: existing rows are looked up with one query per batch of paths, new rows are
+	created with bulk_create, and rows that are seen again are updated with a single UPDATE.
+
+	All rows touched through one DirectorySync instance are given the same last_seen_at
+	timestamp; that lets deletions within a directory be found as the rows that were not
+	touched, rather than by comparing against the list of entries.
+
+	A directory's listing_hash stands for the rows recorded in it, so whenever rows are added
+	or changed other than from its full listing (e.g. from the latest-files API), the hash is
+	cleared, and the next scan processes the directory again.
+	"""
+
+	def __init__(self, now=None):
+		self.now = now or datetime.datetime.now()
+		self.new_file_count = 0
+		# path => id of directories that have been marked as seen (or created) so far
+		self.directory_ids = {}
+
+	def update_directories(self, paths):
+		"""
+		Mark the directories with the given paths, and their ancestors, as seen,
+		creating any that don't exist yet. Returns a dict of path => directory id.
+		"""
+		wanted = set()
+		for path in paths:
+			while path and path not in self.directory_ids and path not in wanted:
+				wanted.add(path)
+				path = parent_path(path)
+
+		if wanted:
+			existing = {}
+			# directories that are new or reappearing, and so change their parent's listing
+			changed_paths = set()
+			for batch in chunked(sorted(wanted), BATCH_SIZE):
+				for path, directory_id, is_deleted in Directory.objects.filter(path__in=batch).values_list('path', 'id', 'is_deleted'):
+					existing[path] = directory_id
+					if is_deleted:
+						changed_paths.add(path)
+			for batch in chunked(existing.values(), BATCH_SIZE):
+				Directory.objects.filter(id__in=batch).update(last_seen_at=self.now, is_deleted=False)
+			self.directory_ids.update(existing)
+
+			# create new directories a level at a time, so that their parents' ids are known
+			new_paths = sorted(wanted.difference(existing), key=lambda path: path.count('/'))
+			changed_paths.update(new_paths)
+			for depth, group in itertools.groupby(new_paths, key=lambda path: path.count('/')):
+				group = list(group)
+				Directory.objects.bulk_create([
+					Directory(path=path, parent_id=self.directory_ids.get(parent_path(path)), last_seen_at=self.now)
+					for path in group
+				], batch_size=BATCH_SIZE)
+				for batch in chunked(group, BATCH_SIZE):
+					self.directory_ids.update(Directory.objects.filter(path__in=batch).values_list('path', 'id'))
+
+			self.clear_listing_hashes([
+				self.directory_ids[parent_path(path)] for path in changed_paths if parent_path(path)
+			])
+
+		return dict((path, self.directory_ids[path]) for path in paths)
+
+	def update_files(self, files):
+		"""
+		Mark the files in the given list of (path, size, directory id) tuples as seen,
+		creating any that don't exist yet. A size of None leaves the recorded size unchanged.
+		"""
+		existing = {}
+		for batch in chunked(sorted(path for path, size, directory_id in files), BATCH_SIZE):
+			for file_id, path, size, is_deleted in File.objects.filter(path__in=batch).values_list('id', 'path', 'size', 'is_deleted'):
+				existing[path] = (file_id, size, is_deleted)
+
+		for batch in chunked([file_id for file_id, size, is_deleted in existing.values()], BATCH_SIZE):
+			File.objects.filter(id__in=batch).update(last_seen_at=self.now, is_deleted=False)
+
+		new_files = []
+		changed_directory_ids = set()
+		for path, size, directory_id in files:
+			size = None if size is None else int(size)
+			if path in existing:
+				file_id, old_size, is_deleted = existing[path]
+				if is_deleted:
+					changed_directory_ids.add(directory_id)
+				if size is not None and size != old_size:
+					File.objects.filter(id=file_id).update(size=size)
+					changed_directory_ids.add(directory_id)
+			else:
+				logger.info("New file found: %s" % path)
+				new_files.append(File(path=path, size=size, directory_id=directory_id, last_seen_at=self.now))
+				changed_directory_ids.add(directory_id)
+				# guard against the same path appearing twice in the list
+				existing[path] = (None, size, False)
+
+		File.objects.bulk_create(new_files, batch_size=BATCH_SIZE)
+		self.new_file_count += len(new_files)
+		self.clear_listing_hashes(changed_directory_ids)
+
+	def clear_listing_hashes(self, directory_ids):
+		"""
+		Forget the listing hashes of the given directories, so that the next scan processes
+		them in full. (update_listing stores a new hash after this, when it has one)
+		"""
+		for batch in chunked(sorted(set(directory_ids)), BATCH_SIZE):
+			Directory.objects.filter(id__in=batch).exclude(listing_hash='').update(listing_hash='')
+
+	def update_listing(self, path, entries, mark_deletions=True, listing_hash=None):
+		"""
+		Record the full listing of the directory at `path`, as a list of
+		(filename, is_dir, file_size) tuples. With mark_deletions, anything previously recorded
+		in this directory that is absent from the listing is marked as deleted.
+		If listing_hash is given, it is stored against the directory.
+		"""
+		directory_id = self.update_directories([path])[path]
+
+		self.update_directories([
+			path + filename + '/' for (filename, is_dir, file_size) in entries if is_dir
+		])
+		self.update_files([
+			(path + filename, file_size, directory_id) for (filename, is_dir, file_size) in entries if not is_dir
+		])
+
+		fields = {}
+		if mark_deletions:
+			for subdir in Directory.objects.filter(parent_id=directory_id, is_deleted=False, last_seen_at__lt=self.now):
+				subdir.mark_deleted()
+			File.objects.filter(
+				directory_id=directory_id, is_deleted=False, last_seen_at__lt=self.now
+			).update(is_deleted=True)
+			fields['last_spidered_at'] = self.now
+
+		if listing_hash is not None:
+			fields['listing_hash'] = listing_hash
+		if fields:
+			Directory.objects.filter(id=directory_id).update(**fields)
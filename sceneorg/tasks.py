@@ -1,7 +1,8 @@
 from celery.task import task
-from sceneorg.models import Directory, File
+from sceneorg.models import Directory
 from sceneorg.scraper import scrape_dir
-from sceneorg.dirparser import parse_all_dirs
+from sceneorg.sync import DirectorySync, parent_path
+from sceneorg.dirparser import listing_hash, parse_all_dirs
 from demoscene.tasks import find_sceneorg_results_files
 import datetime
 import logging
@@ -20,7 +21,7 @@ logger = logging.getLogger(__name__)
 def fetch_new_sceneorg_files(days=1):
 	url = "https://files.scene.org/api/adhoc/latest-files/?days=%d" % days
 
-	new_file_count = 0
+	sync = DirectorySync()
 
 	while True:
 		req = urllib2.Request(url, None, {'User-Agent': settings.HTTP_USER_AGENT})
@@ -34,6 +35,7 @@ def fetch_new_sceneorg_files(days=1):
 
 		logger.info("API request to %s succeeded - %d files returned" % (url, len(response['files'])))
 
+		files = []
 		for item in response['files']:
 			# the fullPath field in the API consists of a byte string (de facto utf-8) interpreted
 			# as windows-1252 and served to us as a Unicode string.
@@ -41,39 +43,12 @@ def fetch_new_sceneorg_files(days=1):
 			# possible), then decode the bytestream as iso-8859-1 to embed that bytestream into
 			# a unicode string that we can process and ultimately insert into the db.
 			full_path = item['fullPath'].encode('Windows-1252', 'ignore').decode('iso-8859-1')
-			path_components = full_path.split('/')[1:]
-			dirs = path_components[:-1]
-
-			path = '/'
-			current_dir = Directory.objects.get_or_create(
-				path='/', defaults={'last_seen_at': datetime.datetime.now()})
-
-			for d in dirs:
-				last_dir = current_dir
-				path += d + '/'
-
-				try:
-					current_dir = Directory.objects.get(path=path)
-					current_dir.last_seen_at = datetime.datetime.now()
-					current_dir.is_deleted = False
-					current_dir.save()
-				except Directory.DoesNotExist:
-					current_dir = Directory.objects.create(path=path, last_seen_at=datetime.datetime.now(), parent=last_dir)
-
-			path += path_components[-1]
-
-			try:
-				f = File.objects.get(path=path)
-				f.last_seen_at = datetime.datetime.now()
-				f.is_deleted = False
-				f.size = item['size']
-				f.save()
-			except File.DoesNotExist:
-				logger.info("New file found: %s" % path)
-				File.objects.create(
-					path=path, last_seen_at=datetime.datetime.now(), directory=current_dir,
-					size=item['size'])
-				new_file_count += 1
+			files.append((full_path, item['size']))
+
+		directory_ids = sync.update_directories([parent_path(path) for path, size in files])
+		sync.update_files([
+			(path, size, directory_ids[parent_path(path)]) for path, size in files
+		])
 
 		url = response.get('nextPageURL')
 		if url:
@@ -81,8 +56,8 @@ def fetch_new_sceneorg_files(days=1):
 		else:
 			break
 
-	if new_file_count > 0:
-		find_sceneorg_results_files()
+	if sync.new_file_count > 0:
+		find_sceneorg_results_files(since=sync.now)
 
 
 # files.scene.org frontend scraper - no longer used
@@ -111,68 +86,37 @@ def fetch_sceneorg_dir(path, async=True):
 	return new_file_count
 
 @task(time_limit=7200, ignore_result=True)
-def scan_dir_listing():
-	new_file_count = 0
+def scan_dir_listing(full=False):
+	# Only directories whose listing has changed since the last scan are processed, unless full=True
+	sync = DirectorySync()
+	previous_hashes = {}
+	if not full:
+		previous_hashes = dict(
+			Directory.objects.filter(is_deleted=False).exclude(listing_hash='').values_list('path', 'listing_hash')
+		)
+
+	dir_count = 0
+	changed_dir_count = 0
 	for path, entries in parse_all_dirs():
+		dir_count += 1
+		dir_hash = listing_hash(entries)
+		if previous_hashes.get(path) == dir_hash:
+			continue
+
 		# print path
-		try:
-			dir = Directory.objects.get(path=path)
-		except Directory.DoesNotExist:
-			dir = Directory.objects.create(path=path, last_seen_at=datetime.datetime.now())
+		changed_dir_count += 1
+		sync.update_listing(path, entries, listing_hash=dir_hash)
 
-		new_file_count += update_dir_records(dir, entries)
+	logger.info(
+		"Scanned %d directories, of which %d had changed; %d new files found"
+		% (dir_count, changed_dir_count, sync.new_file_count)
+	)
 
-	if new_file_count > 0:
-		find_sceneorg_results_files()
+	if sync.new_file_count > 0:
+		find_sceneorg_results_files(since=sync.now)
 
 
 def update_dir_records(dir, files, mark_deletions=True):
-	seen_dirs = []
-	seen_files = []
-
-	new_file_count = 0
-
-	for (filename, is_dir, file_size) in files:
-		if is_dir:
-			subpath = dir.path + filename + '/'
-			try:
-				subdir = Directory.objects.get(path=subpath)
-				subdir.last_seen_at = datetime.datetime.now()
-				subdir.is_deleted = False
-				subdir.save()
-			except Directory.DoesNotExist:
-				subdir = Directory.objects.create(
-					path=subpath, last_seen_at=datetime.datetime.now(), parent=dir)
-			seen_dirs.append(subdir)
-		else:
-			subpath = dir.path + filename
-			try:
-				file = File.objects.get(path=subpath)
-				file.last_seen_at = datetime.datetime.now()
-				file.is_deleted = False
-				if file_size is not None:
-					file.size = file_size
-				file.save()
-			except File.DoesNotExist:
-				file = File.objects.create(
-					path=subpath, last_seen_at=datetime.datetime.now(), directory=dir,
-					size=file_size)
-				new_file_count += 1
-			seen_files.append(file)
-
-	# Mark previously-seen-but-now-absent files as deleted
-	if mark_deletions:
-		for subdir in dir.subdirectories.filter(is_deleted=False):
-			if subdir not in seen_dirs:
-				subdir.mark_deleted()
-		for file in dir.files.filter(is_deleted=False):
-			if file not in seen_files:
-				file.is_deleted = True
-				file.save()
-		dir.last_spidered_at = datetime.datetime.now()
-
-	dir.last_seen_at = datetime.datetime.now()
-	dir.is_deleted = False
-	dir.save()
-
-	return new_file_count
+	sync = DirectorySync()
+	sync.update_listing(dir.path, files, mark_deletions=mark_deletions)
+	return sync.new_file_count
@@ -0,0 +1,89 @@
+from __future__ import unicode_literals
+
+from django.test import TestCase
+
+from sceneorg import tasks
+from sceneorg.dirparser import listing_hash
+from sceneorg.models import Directory, File
+from sceneorg.sync import DirectorySync
+
+
+PARTY_LISTING = [
+	("results.txt", False, 1234),
+	("demo", True, None),
+]
+
+
+class TestDirectorySync(TestCase):
+	def test_update_listing(self):
+		sync = DirectorySync()
+		sync.update_listing('/parties/2000/', PARTY_LISTING, listing_hash=listing_hash(PARTY_LISTING))
+
+		party_dir = Directory.objects.get(path='/parties/2000/')
+		self.assertEqual(party_dir.parent.path, '/parties/')
+		self.assertEqual(party_dir.parent.parent.path, '/')
+		self.assertEqual(party_dir.listing_hash, listing_hash(PARTY_LISTING))
+		self.assertTrue(Directory.objects.filter(path='/parties/2000/demo/', parent=party_dir).exists())
+		self.assertEqual(File.objects.get(path='/parties/2000/results.txt').size, 1234)
+		self.assertEqual(sync.new_file_count, 1)
+
+	def test_absent_entries_are_marked_deleted(self):
+		DirectorySync().update_listing('/parties/2000/', PARTY_LISTING)
+		DirectorySync().update_listing('/parties/2000/', [("results.txt", False, 2345)])
+
+		results_file = File.objects.get(path='/parties/2000/results.txt')
+		self.assertFalse(results_file.is_deleted)
+		self.assertEqual(results_file.size, 2345)
+		self.assertTrue(Directory.objects.get(path='/parties/2000/demo/').is_deleted)
+
+	def test_files_added_outside_listing_clear_its_hash(self):
+		DirectorySync().update_listing('/parties/2000/', PARTY_LISTING, listing_hash=listing_hash(PARTY_LISTING))
+
+		sync = DirectorySync()
+		directory_ids = sync.update_directories(['/parties/2000/', '/parties/2000/new/'])
+		sync.update_files([('/parties/2000/nfo.txt', 100, directory_ids['/parties/2000/'])])
+
+		self.assertEqual(Directory.objects.get(path='/parties/2000/').listing_hash, '')
+		self.assertEqual(sync.new_file_count, 1)
+
+	def test_unchanged_files_keep_hash(self):
+		DirectorySync().update_listing('/parties/2000/', PARTY_LISTING, listing_hash=listing_hash(PARTY_LISTING))
+
+		sync = DirectorySync()
+		directory_ids = sync.update_directories(['/parties/2000/'])
+		sync.update_files([('/parties/2000/results.txt', 1234, directory_ids['/parties/2000/'])])
+
+		self.assertEqual(Directory.objects.get(path='/parties/2000/').listing_hash, listing_hash(PARTY_LISTING))
+
+
+class TestScanDirListing(TestCase):
+	def setUp(self):
+		self.listing = [('/parties/2000/', PARTY_LISTING)]
+		self.original_parse_all_dirs = tasks.parse_all_dirs
+		tasks.parse_all_dirs = lambda: iter(self.listing)
+
+		DirectorySync().update_listing('/parties/2000/', PARTY_LISTING, listing_hash=listing_hash(PARTY_LISTING))
+
+	def tearDown(self):
+		tasks.parse_all_dirs = self.original_parse_all_dirs
+
+	def test_unchanged_directory_is_skipped(self):
+		File.objects.filter(path='/parties/2000/results.txt').update(size=1)
+		tasks.scan_dir_listing()
+		self.assertEqual(File.objects.get(path='/parties/2000/results.txt').size, 1)
+
+		tasks.scan_dir_listing(full=True)
+		self.assertEqual(File.objects.get(path='/parties/2000/results.txt').size, 1234)
+
+	def test_file_added_and_removed_between_scans_is_marked_deleted(self):
+		# a file appears through the latest-files API, and is gone again by the next scan,
+		# which therefore sees the same listing as the previous one
+		sync = DirectorySync()
+		directory_ids = sync.update_directories(['/parties/2000/'])
+		sync.update_files([('/parties/2000/oops.zip', 100, directory_ids['/parties/2000/'])])
+
+		tasks.scan_dir_listing()
+
+		self.assertTrue(File.objects.get(path='/parties/2000/oops.zip').is_deleted)
+		self.assertFalse(File.objects.get(path='/parties/2000/results.txt').is_deleted)
+		self.assertEqual(Directory.objects.get(path='/parties/2000/').listing_hash, listing_hash(PARTY_LISTING))
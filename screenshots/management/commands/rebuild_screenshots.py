@@ -1,14 +1,168 @@
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from optparse import make_option
+
 from django.core.management.base import NoArgsCommand
+from django.db import connections
+
 from productions.models import Screenshot
-from screenshots.tasks import rebuild_screenshot
+from screenshots.tasks import rebuild_screenshot, rebuild_screenshot_files
 
 # Recreate and re-upload files for screenshots that are still in the original format/location,
 # as indicated by having URLs under media.demozoo.org/screenshots/ (not /screens/)
+#
+# By default, this queues a rebuild_screenshot task for each one. With --local, screenshots are
+# rebuilt here on a pool of processes instead, outside of the task queues; progress and failures are
+# recorded in a checkpoint file, so that running the same command again resumes an interrupted run
+# and retries the screenshots that failed.
+
+
+def init_worker():
+	# connections inherited from the parent process must not be shared
+	connections.close_all()
+	# run at a lower priority than the web and celery processes, so that
+	# processing of new uploads isn't held up
+	os.nice(10)
+
+
+def rebuild_one(screenshot_id):
+	try:
+		screenshot = Screenshot.objects.get(id=screenshot_id)
+	except Screenshot.DoesNotExist:
+		# guess it was deleted in the meantime, then.
+		return (screenshot_id, None)
+
+	try:
+		rebuild_screenshot_files(screenshot)
+	except Exception:
+		return (screenshot_id, traceback.format_exc())
+	return (screenshot_id, None)
 
 
 class Command(NoArgsCommand):
+	option_list = NoArgsCommand.option_list + (
+		make_option('--all', action='store_true', dest='all', default=False,
+			help='Rebuild all screenshots, not just those in the original location'),
+		make_option('--supertype', dest='supertype', default=None,
+			help='Only rebuild screenshots of productions with this supertype (production, graphics or music)'),
+		make_option('--min-id', dest='min_id', default=None, type='int',
+			help='Only rebuild screenshots with an ID of at least this'),
+		make_option('--max-id', dest='max_id', default=None, type='int',
+			help='Only rebuild screenshots with an ID of at most this'),
+		make_option('--local', action='store_true', dest='local', default=False,
+			help='Rebuild screenshots on a local process pool rather than queueing tasks'),
+		make_option('--processes', dest='processes', default=max(1, multiprocessing.cpu_count() - 1),
+			action='store', type='int',
+			help='Number of processes to rebuild screenshots with in --local mode (default: %default)'),
+		make_option('--checkpoint', dest='checkpoint', default='rebuild_screenshots.checkpoint',
+			help='File to record progress in for --local mode, to resume from if interrupted (default: %default)'),
+	)
+
+	def get_screenshots(self, options):
+		screens = Screenshot.objects.all()
+		if not options['all']:
+			screens = screens.filter(original_url__contains='/screenshots/')
+		if options['supertype']:
+			screens = screens.filter(production__supertype=options['supertype'])
+		if options['min_id'] is not None:
+			screens = screens.filter(id__gte=options['min_id'])
+		if options['max_id'] is not None:
+			screens = screens.filter(id__lte=options['max_id'])
+		return screens.order_by('id')
+
 	def handle_noargs(self, **options):
-		screens = Screenshot.objects.filter(original_url__contains='/screenshots/')
-		for screen in screens:
-			print "rebuilding %s" % screen
-			rebuild_screenshot.delay(screen.id)
+		screens = self.get_screenshots(options)
+
+		if options['local']:
+			self.rebuild_locally(screens, options)
+		else:
+			for screen in screens:
+				print "rebuilding %s" % screen
+				rebuild_screenshot.delay(screen.id)
+
+	def read_checkpoint(self, path, options):
+		"""Return the last screenshot ID processed and the list of IDs that failed, or (None, [])"""
+		try:
+			with open(path) as f:
+				checkpoint = json.load(f)
+		except (IOError, ValueError):
+			return None, []
+
+		# only resume a run with the same filters
+		if checkpoint.get('filters') != self.filters(options):
+			print "Ignoring checkpoint file %s, which was written for different options" % path
+			return None, []
+		return checkpoint['last_id'], checkpoint.get('failed_ids', [])
+
+	def write_checkpoint(self, path, options, last_id, failed_ids):
+		temp_path = path + '.tmp'
+		with open(temp_path, 'w') as f:
+			json.dump({'filters': self.filters(options), 'last_id': last_id, 'failed_ids': sorted(failed_ids)}, f)
+		os.rename(temp_path, path)
+
+	def filters(self, options):
+		return dict((key, options[key]) for key in ('all', 'supertype', 'min_id', 'max_id'))
+
+	def rebuild_locally(self, screens, options):
+		checkpoint_path = options['checkpoint']
+		last_id, failed_ids = self.read_checkpoint(checkpoint_path, options)
+		failed_ids = set(failed_ids)
+		if last_id is not None:
+			print "Resuming after screenshot %d, retrying %d that failed" % (last_id, len(failed_ids))
+			screens = screens.filter(id__gt=last_id)
+
+		# retried screenshots have lower IDs, so they come first and the checkpoint order still holds
+		screenshot_ids = sorted(failed_ids) + list(screens.values_list('id', flat=True))
+		total = len(screenshot_ids)
+		print "Rebuilding %d screenshots with %d processes" % (total, options['processes'])
+
+		# forked workers must open their own database connections
+		connections.close_all()
+		pool = multiprocessing.Pool(options['processes'], init_worker)
+
+		start_time = time.time()
+		last_report_time = start_time
+		done = 0
+		failures = 0
+
+		try:
+			# imap returns results in order, so every screenshot up to the one just returned has
+			# been processed, and that one can be recorded as the checkpoint
+			for screenshot_id, error in pool.imap(rebuild_one, screenshot_ids):
+				done += 1
+				if error:
+					failures += 1
+					failed_ids.add(screenshot_id)
+					print >>sys.stderr, "Failed to rebuild screenshot %d:\n%s" % (screenshot_id, error)
+				else:
+					failed_ids.discard(screenshot_id)
+				last_id = max(last_id, screenshot_id)
+
+				now = time.time()
+				if now - last_report_time >= 10 or done == total:
+					self.write_checkpoint(checkpoint_path, options, last_id, failed_ids)
+					elapsed = now - start_time
+					rate = done / max(elapsed, 0.001)
+					print "%d/%d screenshots rebuilt (%d failed), %.2f/s, about %d minutes remaining" % (
+						done, total, failures, rate, (total - done) / rate / 60
+					)
+					sys.stdout.flush()
+					last_report_time = now
+		finally:
+			pool.terminate()
+			pool.join()
+
+		if done == total:
+			if failed_ids:
+				# keep the checkpoint, so that the next run retries just these
+				print "Failed to rebuild %d screenshots: %s" % (
+					len(failed_ids), ', '.join(str(screenshot_id) for screenshot_id in sorted(failed_ids))
+				)
+				print "Run the same command again to retry them"
+			elif os.path.exists(checkpoint_path):
+				# completed, so the next run should start from scratch
+				os.remove(checkpoint_path)
@@ -3,6 +3,7 @@ import os.path
 import StringIO
 import subprocess
 import tempfile
+import time
 
 from PIL import Image
 from recoil import RecoilImage
@@ -34,6 +35,9 @@ PIL_READABLE_FORMATS = ['BMP', 'GIF', 'ICO', 'JPEG', 'PCD', 'PCX', 'PNG', 'PPM',
 WEB_USABLE_FORMATS = ['PNG', 'JPEG', 'GIF']
 EXTENSIONS_BY_FORMAT = {'PNG': 'png', 'JPEG': 'jpg', 'GIF': 'gif'}
 
+# (name, target size) of the thumbnail renditions created for each screenshot
+RENDITION_SIZES = [('standard', (400, 300)), ('thumbnail', (200, 150))]
+
 
 ANSILOVE_C_PATH = getattr(settings, 'ANSILOVE_C_PATH', None)
 if ANSILOVE_C_PATH:
@@ -140,6 +144,67 @@ class PILConvertibleImage(object):
 				img = img.convert('RGB')
 			img = img.resize(resize_params, Image.ANTIALIAS)
 
+		return self._encode_thumbnail(img, has_limited_palette)
+
+	def create_renditions(self, sizes=RENDITION_SIZES):
+		"""
+			Create the original rendition and a thumbnail for each (name, target_size) in sizes,
+			decoding the source image only once. Each thumbnail is derived from the next larger
+			one before it is encoded, rather than from the full-size image.
+			Return a dict of name => (file object, dimensions, file extension), including 'original',
+			and a dict of the time taken by each stage in seconds.
+		"""
+		timings = {}
+
+		start_time = time.time()
+		self.image.load()
+		timings['decode'] = time.time() - start_time
+
+		start_time = time.time()
+		renditions = {'original': self.create_original()}
+		timings['original'] = time.time() - start_time
+
+		# whether the whole source image has <=256 distinct colours (in which case any part of it does)
+		source_has_limited_palette = None
+		# the most recent resized rendition, before encoding
+		intermediate = None
+
+		for name, target_size in sorted(sizes, key=lambda (name, (width, height)): width * height, reverse=True):
+			start_time = time.time()
+
+			# as in create_thumbnail, the choice between png and jpg depends on the source image's
+			# colours, not those of the (antialiased) intermediate
+			crop_params, resize_params = get_thumbnail_sizing_params(self.image.size, target_size)
+			if source_has_limited_palette is None:
+				source_has_limited_palette = bool(self.image.getcolors(256))
+			if source_has_limited_palette:
+				has_limited_palette = True
+			elif crop_params:
+				has_limited_palette = bool(self.image.crop(crop_params).getcolors(256))
+			else:
+				has_limited_palette = False
+
+			if not resize_params:
+				img = self.image.crop(crop_params) if crop_params else self.image
+			else:
+				if intermediate is None:
+					# must ensure image is non-paletted for a high-quality resize
+					intermediate = self.image
+					if intermediate.mode in ['1', 'P']:
+						intermediate = intermediate.convert('RGB')
+
+				crop_params, resize_params = get_thumbnail_sizing_params(intermediate.size, target_size)
+				img = intermediate.crop(crop_params) if crop_params else intermediate
+				if resize_params:
+					img = img.resize(resize_params, Image.ANTIALIAS)
+				intermediate = img
+
+			renditions[name] = self._encode_thumbnail(img, has_limited_palette)
+			timings[name] = time.time() - start_time
+
+		return renditions, timings
+
+	def _encode_thumbnail(self, img, has_limited_palette):
 		output = StringIO.StringIO()
 		if has_limited_palette:
 			if img.mode not in ['1', 'P']:
@@ -1,6 +1,10 @@
+from multiprocessing.pool import ThreadPool
+import os
 import re
+import threading
 
 from boto.s3.key import Key
+from django.conf import settings
 
 from s3boto import S3BotoStorage
 
@@ -86,25 +90,67 @@ def get_thumbnail_sizing_params(original_size, target_size):
 		return (crop_params, resize_params)
 
 
+# per-thread S3BotoStorage objects, so that each worker (and each thread of the upload pool)
+# keeps its connection open between uploads, rather than reconnecting for every file
+_local = threading.local()
+
+
+def get_storage():
+	try:
+		return _local.storage
+	except AttributeError:
+		_local.storage = S3BotoStorage()
+		return _local.storage
+
+
 def upload_to_s3(fp, key_name, extension, reduced_redundancy=False):
 	"""
 		Upload the contents of file handle 'fp' to the S3 bucket specified by AWS_STORAGE_BUCKET_NAME,
 		under the given filename. Return the public URL.
 	"""
 
-	# connect to S3 and send the file contents
-	storage = S3BotoStorage()
+	# send the file contents over this thread's S3 connection
+	storage = get_storage()
 	bucket = storage.upload_bucket
 	k = Key(bucket)
 	k.key = key_name
 	k.content_type = MIME_TYPE_BY_EXTENSION.get(extension, 'application/octet-stream')
 	# print "uploading: %s" % key_name
-	k.set_contents_from_file(fp, reduced_redundancy=reduced_redundancy, rewind=True)
-	k.set_acl('public-read')
+	# set the ACL in the PUT request's headers rather than with a separate request
+	k.set_contents_from_file(fp, reduced_redundancy=reduced_redundancy, rewind=True, policy='public-read')
 
 	return storage.url(key_name)
 
 
+_upload_pool = None
+_upload_pool_pid = None
+
+
+def get_upload_pool():
+	global _upload_pool, _upload_pool_pid
+
+	# a pool inherited across a fork (e.g. by a celery worker process) has no running threads,
+	# so create a new one for each process
+	if _upload_pool is None or _upload_pool_pid != os.getpid():
+		_upload_pool = ThreadPool(getattr(settings, 'S3_UPLOAD_THREADS', 3))
+		_upload_pool_pid = os.getpid()
+	return _upload_pool
+
+
+def _upload_to_s3_args(args):
+	return upload_to_s3(*args)
+
+
+def upload_many_to_s3(uploads):
+	"""
+		Upload several files concurrently. uploads is a list of (fp, key_name, extension, reduced_redundancy)
+		tuples, as the arguments to upload_to_s3; return the list of their public URLs.
+	"""
+	if len(uploads) < 2:
+		return [upload_to_s3(*args) for args in uploads]
+	return get_upload_pool().map(_upload_to_s3_args, uploads)
+
+
 # successively more aggressive rules for what files we should ignore in an archive
 # when looking for screenshots - break out as soon as we have exactly one file remaining
 IGNORED_ARCHIVE_MEMBER_RULES = [
@@ -1,6 +1,11 @@
 from celery.task import task
+import hashlib
+import logging
 import os
 import re
+import shutil
+import tempfile
+import time
 import uuid
 import urllib2
 import cStringIO
@@ -8,7 +13,7 @@ import zipfile
 
 from productions.models import Screenshot, ProductionLink, Ansi
 from screenshots.models import PILConvertibleImage, USABLE_IMAGE_FILE_EXTENSIONS
-from screenshots.processing import upload_to_s3, select_screenshot_file
+from screenshots.processing import upload_to_s3, upload_many_to_s3, select_screenshot_file
 from mirror.actions import fetch_link, find_screenshottable_graphics, find_zipped_screenshottable_graphics
 from mirror.models import ArchiveMember
 from django.conf import settings
@@ -16,44 +21,75 @@ from django.conf import settings
 
 upload_dir = os.path.join(settings.FILEROOT, 'media', 'screenshot_uploads')
 
+logger = logging.getLogger(__name__)
+
 
 def create_basename(screenshot_id):
 		u = uuid.uuid4().hex
 		return u[0:2] + '/' + u[2:4] + '/' + u[4:8] + '.' + str(screenshot_id) + '.'
 
 
-def upload_original(img, screenshot, basename, reduced_redundancy=False):
-	orig, orig_size, orig_format = img.create_original()
-	screenshot.original_url = upload_to_s3(orig, 'screens/o/' + basename + orig_format, orig_format, reduced_redundancy=reduced_redundancy)
-	screenshot.original_width, screenshot.original_height = orig_size
-
+def upload_renditions(img, screenshot, basename, reduced_redundancy=False):
+	"""
+	Create the original, standard and thumbnail renditions of img in a single pass, and upload
+	them concurrently under the given basename. The standard and thumbnail renditions are always
+	reduced redundancy; reduced_redundancy applies to the original.
+	"""
+	renditions, timings = img.create_renditions()
+
+	orig, orig_size, orig_format = renditions['original']
+	standard, standard_size, standard_format = renditions['standard']
+	thumb, thumb_size, thumb_format = renditions['thumbnail']
+
+	start_time = time.time()
+	(
+		screenshot.original_url, screenshot.standard_url, screenshot.thumbnail_url
+	) = upload_many_to_s3([
+		(orig, 'screens/o/' + basename + orig_format, orig_format, reduced_redundancy),
+		(standard, 'screens/s/' + basename + standard_format, standard_format, True),
+		(thumb, 'screens/t/' + basename + thumb_format, thumb_format, True),
+	])
+	timings['upload'] = time.time() - start_time
 
-def upload_standard(img, screenshot, basename):  # always reduced redundancy
-	standard, standard_size, standard_format = img.create_thumbnail((400, 300))
-	screenshot.standard_url = upload_to_s3(standard, 'screens/s/' + basename + standard_format, standard_format, reduced_redundancy=True)
+	screenshot.original_width, screenshot.original_height = orig_size
 	screenshot.standard_width, screenshot.standard_height = standard_size
+	screenshot.thumbnail_width, screenshot.thumbnail_height = thumb_size
 
+	logger.info(
+		"Rendered %s: decode %.3fs, original %.3fs, standard %.3fs, thumbnail %.3fs, upload %.3fs" % (
+			basename, timings['decode'], timings['original'], timings['standard'], timings['thumbnail'], timings['upload']
+		)
+	)
+	return timings
 
-def upload_thumb(img, screenshot, basename):  # always reduced redundancy
-	thumb, thumb_size, thumb_format = img.create_thumbnail((200, 150))
-	screenshot.thumbnail_url = upload_to_s3(thumb, 'screens/t/' + basename + thumb_format, thumb_format, reduced_redundancy=True)
-	screenshot.thumbnail_width, screenshot.thumbnail_height = thumb_size
+
+def file_sha1(filename):
+	sha1 = hashlib.sha1()
+	with open(filename, 'rb') as f:
+		for block in iter(lambda: f.read(64 * 1024), ''):
+			sha1.update(block)
+	return sha1.hexdigest()
 
 
 @task(ignore_result=True)
 def create_screenshot_versions_from_local_file(screenshot_id, filename):
 	try:
 		screenshot = Screenshot.objects.get(id=screenshot_id)
-		f = open(filename, 'rb')
-		img = PILConvertibleImage(f, name_hint=filename)
+		screenshot.source_sha1 = file_sha1(filename)
 
-		basename = create_basename(screenshot_id)
-		upload_original(img, screenshot, basename)
-		upload_standard(img, screenshot, basename)
-		upload_thumb(img, screenshot, basename)
-		screenshot.save()
+		# if this image has been uploaded before, reuse its renditions
+		existing_screenshot = Screenshot.find_by_source_sha1(screenshot.source_sha1)
+		if existing_screenshot:
+			screenshot.copy_renditions_from(existing_screenshot)
+		else:
+			f = open(filename, 'rb')
+			img = PILConvertibleImage(f, name_hint=filename)
 
-		f.close()
+			basename = create_basename(screenshot_id)
+			upload_renditions(img, screenshot, basename)
+			f.close()
+
+		screenshot.save()
 
 	except Screenshot.DoesNotExist:
 		# guess it was deleted in the meantime, then.
@@ -62,28 +98,49 @@ def create_screenshot_versions_from_local_file(screenshot_id, filename):
 	os.remove(filename)
 
 
-# token rate limit so that new uploads from local files get priority
-@task(rate_limit='1/s', ignore_result=True)
-def rebuild_screenshot(screenshot_id):
+def fetch_original(url):
+	"""
+	Download the file at url into a temporary file, a block at a time, and return it open
+	and rewound. PIL needs to seek on its input, which isn't possible for urllib2 responses -
+	see http://mail.python.org/pipermail/image-sig/2004-April/002729.html
+	"""
+	f = urllib2.urlopen(url, None, 10)
+	# small files stay in memory; larger ones are spooled to disk rather than held in full
+	buf = tempfile.SpooledTemporaryFile(max_size=4 * 1024 * 1024)
+	try:
+		shutil.copyfileobj(f, buf, 64 * 1024)
+	except:
+		buf.close()
+		raise
+	finally:
+		f.close()
+	buf.seek(0)
+	return buf
+
+
+def rebuild_screenshot_files(screenshot):
+	"""Recreate and re-upload all renditions of a screenshot from its original_url"""
+	buf = fetch_original(screenshot.original_url)
 	try:
-		screenshot = Screenshot.objects.get(id=screenshot_id)
-		f = urllib2.urlopen(screenshot.original_url, None, 10)
-		# read into a cStringIO buffer so that PIL can seek on it (which isn't possible for urllib2 responses) -
-		# see http://mail.python.org/pipermail/image-sig/2004-April/002729.html
-		buf = cStringIO.StringIO(f.read())
 		img = PILConvertibleImage(buf, screenshot.original_url.split('/')[-1])
 
-		basename = create_basename(screenshot_id)
-		upload_original(img, screenshot, basename)
-		upload_standard(img, screenshot, basename)
-		upload_thumb(img, screenshot, basename)
+		basename = create_basename(screenshot.id)
+		upload_renditions(img, screenshot, basename)
 		screenshot.save()
+	finally:
+		buf.close()
 
-		f.close()
 
+# token rate limit so that new uploads from local files get priority
+@task(rate_limit='1/s', ignore_result=True)
+def rebuild_screenshot(screenshot_id):
+	try:
+		screenshot = Screenshot.objects.get(id=screenshot_id)
 	except Screenshot.DoesNotExist:
 		# guess it was deleted in the meantime, then.
-		pass
+		return
+
+	rebuild_screenshot_files(screenshot)
 
 
 @task(rate_limit='6/m', ignore_result=True)
@@ -129,9 +186,7 @@ def create_screenshot_from_production_link(production_link_id):
 			# decoded it that way on insertion into the database to ensure that it had
 			# a valid unicode string representation - see mirror/models.py
 			try:
-				member_buf = cStringIO.StringIO(
-					z.read(prod_link.file_for_screenshot.encode('iso-8859-1'))
-				)
+				member_data = z.read(prod_link.file_for_screenshot.encode('iso-8859-1'))
 			except zipfile.BadZipfile:
 				prod_link.has_bad_image = True
 				prod_link.save()
@@ -139,28 +194,35 @@ def create_screenshot_from_production_link(production_link_id):
 				return
 
 			z.close()
-			try:
-				img = PILConvertibleImage(member_buf, name_hint=prod_link.file_for_screenshot)
-			except IOError:
-				prod_link.has_bad_image = True
-				prod_link.save()
-				return
+			source_sha1 = hashlib.sha1(member_data).hexdigest()
+			source_buf = cStringIO.StringIO(member_data)
+			name_hint = prod_link.file_for_screenshot
 		else:  # image is not a usable format
 			return
 	else:
-		try:
-			img = PILConvertibleImage(blob.as_io_buffer(), name_hint=url.split('/')[-1])
-		except IOError:
-			prod_link.has_bad_image = True
-			prod_link.save()
-			return
+		source_sha1 = sha1
+		source_buf = blob.as_io_buffer()
+		name_hint = url.split('/')[-1]
+
+	screenshot = Screenshot(production_id=production_id, source_sha1=source_sha1)
+
+	# if we've seen this image before (e.g. the same file in several packs), reuse its renditions
+	existing_screenshot = Screenshot.find_by_source_sha1(source_sha1)
+	if existing_screenshot:
+		screenshot.copy_renditions_from(existing_screenshot)
+		screenshot.save()
+		return
+
+	try:
+		img = PILConvertibleImage(source_buf, name_hint=name_hint)
+	except IOError:
+		prod_link.has_bad_image = True
+		prod_link.save()
+		return
 
-	screenshot = Screenshot(production_id=production_id)
 	basename = sha1[0:2] + '/' + sha1[2:4] + '/' + sha1[4:8] + '.pl' + str(production_link_id) + '.'
 	try:
-		upload_original(img, screenshot, basename, reduced_redundancy=True)
-		upload_standard(img, screenshot, basename)
-		upload_thumb(img, screenshot, basename)
+		upload_renditions(img, screenshot, basename, reduced_redundancy=True)
 	except IOError:
 		prod_link.has_bad_image = True
 		prod_link.save()
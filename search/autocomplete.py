@@ -0,0 +1,452 @@
+"""
+In-memory prefix index for the live search (as-you-type) endpoint.
+
+Every production title, releaser name (including nick variants and real names)
+and party name is broken into word-suffix keys ("andromeda software development",
+"software development", "development") and stored in a sorted array alongside
+the pre-rendered search_result_json output of the object it belongs to, so that a
+lookup is a binary search with no SQL and no Xapian involved.
+
+The entries are maintained by the djapian index daemon, which applies each batch
+of changes from the Change queue and writes the index out already sorted and ranked.
+Web processes map that file into memory and switch to it whenever it is rewritten,
+without having to parse or sort anything themselves.
+"""
+
+from array import array
+from bisect import bisect_left
+import cPickle as pickle
+import heapq
+import json
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Prefetch
+from unidecode import unidecode
+
+from djapian.utils import model_name
+
+SNAPSHOT_VERSION = 2
+
+# the index file starts with the length of its pickled header
+INDEX_HEADER = struct.Struct('<I')
+
+# keys are truncated to this many characters to keep the index compact;
+# queries are compared on the same number of characters
+KEY_LENGTH = 32
+
+# prefixes matching more keys than this are ranked once and memoised
+SCAN_LIMIT = 2000
+# number of ranked candidates to keep for memoised prefixes
+CANDIDATE_LIMIT = 200
+
+# how often (in seconds) web processes check whether the snapshot has changed
+RECHECK_INTERVAL = 5
+
+NON_WORD_CHARS = re.compile(r'[^a-z0-9]+')
+
+
+def normalise(text):
+	"""Reduce a name or query to lowercase ASCII words separated by single spaces"""
+	if isinstance(text, unicode):
+		text = unidecode(text)
+	return ' '.join(word for word in NON_WORD_CHARS.split(text.lower()) if word)
+
+
+def get_snapshot_dir():
+	return getattr(settings, 'SEARCH_AUTOCOMPLETE_PATH', os.path.join(settings.DJAPIAN_DATABASE_PATH, 'autocomplete'))
+
+
+def get_entries_path():
+	"""The entries themselves, kept for the index daemon to apply changes to"""
+	return os.path.join(get_snapshot_dir(), 'entries.pickle')
+
+
+def get_index_path():
+	"""The sorted index built from the entries, as loaded by web processes"""
+	return os.path.join(get_snapshot_dir(), 'index.bin')
+
+
+class PackedStrings(object):
+	"""
+	A read-only sequence of byte strings held in a single buffer, with an array of offsets.
+	Supports len() and integer indexing, which is all that bisect needs.
+	"""
+	def __init__(self, offsets, data):
+		self._offsets = offsets
+		self._data = data
+
+	@classmethod
+	def from_strings(cls, strings):
+		offsets = array('I', [0])
+		position = 0
+		for s in strings:
+			position += len(s)
+			offsets.append(position)
+		return cls(offsets, ''.join(strings))
+
+	def tostrings(self):
+		return self._offsets.tostring(), str(self._data)
+
+	def __len__(self):
+		return len(self._offsets) - 1
+
+	def __getitem__(self, i):
+		return self._data[self._offsets[i]:self._offsets[i + 1]]
+
+
+class PrefixIndex(object):
+	def __init__(self, keys, ranks, entry_ids, restricted, results, popular=None):
+		"""
+		keys is the sorted sequence of name keys, and ranks, entry_ids and restricted are
+		arrays parallel to it; results holds the result JSON of each entry. popular maps
+		prefixes to their ranked rows, as memoised by _ranked_rows.
+		"""
+		self._keys = keys
+		self._ranks = ranks
+		self._entry_ids = entry_ids
+		self._restricted = restricted
+		self._results = results
+		self._popular = popular or {}
+
+	@classmethod
+	def build(cls, entries):
+		"""
+		Build the index from a dict of entries, as stored in the snapshot:
+		(model_name, pk) => (list of (name, is_restricted), result_json)
+		"""
+		rows = []
+		results = []
+
+		for names, result_json in entries.itervalues():
+			entry_id = len(results)
+			results.append(result_json)
+
+			for name, is_restricted in names:
+				words = normalise(name).split(' ')
+				if not words[0]:
+					continue
+				name_length = min(sum(len(word) + 1 for word in words), 0xffff)
+
+				for i in range(len(words)):
+					key = ' '.join(words[i:])[:KEY_LENGTH]
+					# rank full-name matches above matches partway through a name, then shortest name first
+					rank = ((1 if i else 0) << 16) | name_length
+					rows.append((key, rank, entry_id, 1 if is_restricted else 0))
+
+		rows.sort()
+
+		index = cls(
+			PackedStrings.from_strings([row[0] for row in rows]),
+			array('I', [row[1] for row in rows]),
+			array('I', [row[2] for row in rows]),
+			array('B', [row[3] for row in rows]),
+			PackedStrings.from_strings(results),
+		)
+		index.warm()
+		return index
+
+	def write(self, f):
+		"""
+		Write the index to a file, in the form that load() maps into memory. Arrays are
+		written in native byte order, as the file is only read on the machine that wrote it
+		"""
+		key_offsets, key_data = self._keys.tostrings()
+		result_offsets, result_data = self._results.tostrings()
+		sections = [
+			key_offsets, key_data, self._ranks.tostring(), self._entry_ids.tostring(),
+			self._restricted.tostring(), result_offsets, result_data,
+		]
+		header = pickle.dumps({
+			'version': SNAPSHOT_VERSION,
+			'lengths': [len(section) for section in sections],
+			'popular': dict((prefix, array('I', rows).tostring()) for prefix, rows in self._popular.iteritems()),
+		}, pickle.HIGHEST_PROTOCOL)
+
+		f.write(INDEX_HEADER.pack(len(header)))
+		f.write(header)
+		for section in sections:
+			f.write(section)
+
+	@classmethod
+	def load(cls, path):
+		"""
+		Map an index file written by write() into memory, or return None if there is no
+		usable one. Key and result strings are read from the mapping as they are needed;
+		only the offsets, ranks and entry ids are copied out.
+		"""
+		try:
+			with open(path, 'rb') as f:
+				mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			(header_length,) = INDEX_HEADER.unpack_from(mapping, 0)
+			position = INDEX_HEADER.size
+			header = pickle.loads(mapping[position:position + header_length])
+		except (IOError, ValueError, EOFError, struct.error, pickle.UnpicklingError):
+			return None
+		if header.get('version') != SNAPSHOT_VERSION:
+			return None
+
+		position += header_length
+		sections = []
+		for length in header['lengths']:
+			sections.append(buffer(mapping, position, length))
+			position += length
+		key_offsets, key_data, ranks, entry_ids, restricted, result_offsets, result_data = sections
+
+		def to_array(typecode, data):
+			a = array(typecode)
+			a.fromstring(data)
+			return a
+
+		popular = dict((prefix, to_array('I', rows)) for prefix, rows in header['popular'].iteritems())
+		return cls(
+			PackedStrings(to_array('I', key_offsets), key_data),
+			to_array('I', ranks), to_array('I', entry_ids), to_array('B', restricted),
+			PackedStrings(to_array('I', result_offsets), result_data),
+			popular=popular,
+		)
+
+	def __len__(self):
+		return len(self._results)
+
+	def _find_range(self, prefix):
+		lo = bisect_left(self._keys, prefix)
+		hi = bisect_left(self._keys, prefix + '\xff', lo)
+		return lo, hi
+
+	def _ranked_rows(self, prefix):
+		lo, hi = self._find_range(prefix)
+		if hi - lo <= SCAN_LIMIT:
+			return sorted(xrange(lo, hi), key=self._ranks.__getitem__)
+
+		try:
+			return self._popular[prefix]
+		except KeyError:
+			rows = heapq.nsmallest(CANDIDATE_LIMIT, xrange(lo, hi), key=self._ranks.__getitem__)
+			self._popular[prefix] = rows
+			return rows
+
+	def warm(self):
+		"""Rank and memoise the one- and two-character prefixes that match many keys"""
+		for prefix in set(self._keys[i][:2] for i in xrange(0, len(self._keys), SCAN_LIMIT)):
+			self._ranked_rows(prefix[:1])
+			self._ranked_rows(prefix)
+
+	def search(self, query, limit=10, include_restricted=False):
+		"""Return the result JSON strings of the best `limit` matches for `query`"""
+		prefix = normalise(query)[:KEY_LENGTH]
+		if not prefix:
+			return []
+
+		seen_entry_ids = set()
+		results = []
+		for row in self._ranked_rows(prefix):
+			if self._restricted[row] and not include_restricted:
+				continue
+			entry_id = self._entry_ids[row]
+			if entry_id in seen_entry_ids:
+				continue
+			seen_entry_ids.add(entry_id)
+			results.append(self._results[entry_id])
+			if len(results) >= limit:
+				break
+
+		return results
+
+	def search_json(self, query, limit=10, include_restricted=False):
+		return '[%s]' % ','.join(self.search(query, limit=limit, include_restricted=include_restricted))
+
+
+class SnapshotLoader(object):
+	"""
+	Keeps the current PrefixIndex for this process, reloading it in a background
+	thread when the index file on disk changes.
+	"""
+	def __init__(self):
+		self.index = None
+		self._mtime = None
+		self._checked_at = 0
+		self._loading = False
+		self._lock = threading.Lock()
+
+	def get_index(self):
+		"""
+		Return the most recently loaded PrefixIndex, or None if no snapshot has
+		been loaded yet (in which case callers should fall back on Xapian)
+		"""
+		now = time.time()
+		if now - self._checked_at >= RECHECK_INTERVAL:
+			self._checked_at = now
+			try:
+				mtime = os.path.getmtime(get_index_path())
+			except OSError:
+				mtime = None
+
+			if mtime is not None and mtime != self._mtime:
+				with self._lock:
+					if not self._loading:
+						self._loading = True
+						thread = threading.Thread(target=self._load, args=(mtime,))
+						thread.daemon = True
+						thread.start()
+
+		return self.index
+
+	def _load(self, mtime):
+		try:
+			index = PrefixIndex.load(get_index_path())
+			if index is not None:
+				self.index = index
+			self._mtime = mtime
+		finally:
+			self._loading = False
+
+
+loader = SnapshotLoader()
+get_index = loader.get_index
+
+
+# Building entries
+
+def production_entries(queryset):
+	queryset = queryset.select_related('default_screenshot').prefetch_related(
+		'author_nicks', 'author_affiliation_nicks'
+	)
+	for production in queryset:
+		yield production, [(production.asciified_title, False)]
+
+
+def releaser_entries(queryset):
+	from demoscene.models import Membership
+	queryset = queryset.prefetch_related(
+		'nicks__variants',
+		Prefetch('group_memberships', queryset=Membership.objects.select_related('group').order_by('group__name')),
+	)
+	for releaser in queryset:
+		names = [
+			(unidecode(variant.name), False)
+			for nick in releaser.nicks.all()
+			for variant in nick.variants.all()
+		]
+		public_real_name = releaser.asciified_public_real_name
+		if public_real_name:
+			names.append((public_real_name, False))
+		real_name = releaser.asciified_real_name
+		if real_name and real_name != public_real_name:
+			names.append((real_name, True))
+		yield releaser, names
+
+
+def party_entries(queryset):
+	for party in queryset:
+		yield party, [(party.asciified_name, False)]
+
+
+def get_entry_builders():
+	from demoscene.models import Releaser
+	from parties.models import Party
+	from productions.models import Production
+	return {
+		Production: production_entries,
+		Releaser: releaser_entries,
+		Party: party_entries,
+	}
+
+
+def build_entries(model, queryset):
+	builder = get_entry_builders()[model]
+	return dict(
+		((model_name(model), obj.pk), (names, json.dumps(obj.search_result_json())))
+		for obj, names in builder(queryset)
+	)
+
+
+# Reading and writing the snapshot
+
+def read_snapshot():
+	try:
+		with open(get_entries_path(), 'rb') as f:
+			snapshot = pickle.load(f)
+	except (IOError, EOFError, pickle.UnpicklingError):
+		return None
+
+	if snapshot.get('version') != SNAPSHOT_VERSION:
+		return None
+	return snapshot['entries']
+
+
+def write_atomically(path, write):
+	# write to a temporary file and rename it into place, so that readers never see a partial file
+	fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+	try:
+		with os.fdopen(fd, 'wb') as f:
+			write(f)
+		os.rename(temp_path, path)
+	except Exception:
+		os.remove(temp_path)
+		raise
+
+
+def write_snapshot(entries):
+	directory = get_snapshot_dir()
+	if not os.path.exists(directory):
+		os.makedirs(directory)
+
+	write_atomically(get_entries_path(), lambda f: pickle.dump(
+		{'version': SNAPSHOT_VERSION, 'entries': entries}, f, pickle.HIGHEST_PROTOCOL
+	))
+	# sorting and ranking happens once here, rather than in every web process that loads the index
+	write_atomically(get_index_path(), PrefixIndex.build(entries).write)
+
+
+def rebuild_snapshot():
+	entries = {}
+	for model in get_entry_builders():
+		entries.update(build_entries(model, model.objects.all()))
+	write_snapshot(entries)
+	return len(entries)
+
+
+class SnapshotWriter(object):
+	"""
+	Applies index updates to the snapshot from within the index daemon, keeping
+	the entries in memory between batches rather than reading the file back each time.
+	"""
+	def __init__(self):
+		self._entries = None
+		self._mtime = None
+
+	def apply_changes(self, model, pks, action):
+		if model not in get_entry_builders():
+			return
+
+		try:
+			mtime = os.path.getmtime(get_entries_path())
+		except OSError:
+			# no snapshot has been built yet; leave it to rebuild_snapshot
+			return
+
+		if self._entries is None or mtime != self._mtime:
+			self._entries = read_snapshot()
+			if self._entries is None:
+				return
+
+		label = model_name(model)
+		pks = [model._meta.pk.to_python(pk) for pk in pks]
+		for pk in pks:
+			self._entries.pop((label, pk), None)
+
+		if action != 'delete':
+			self._entries.update(build_entries(model, model.objects.filter(pk__in=pks)))
+
+		write_snapshot(self._entries)
+		self._mtime = os.path.getmtime(get_entries_path())
+
+
+writer = SnapshotWriter()
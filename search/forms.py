@@ -3,19 +3,53 @@ from unidecode import unidecode
 
 from demoscene.index import name_indexer, complete_indexer, name_indexer_with_real_names, complete_indexer_with_real_names
 
+TYPE_CHOICES = (
+	('', 'Anything'),
+	('production', 'Productions'),
+	('graphics', 'Graphics'),
+	('music', 'Music'),
+	('group', 'Groups'),
+	('scener', 'Sceners'),
+)
+
 class SearchForm(forms.Form):
 	q = forms.CharField(required=True, label='Search')
-	
+	type = forms.ChoiceField(required=False, choices=TYPE_CHOICES)
+	platform = forms.IntegerField(required=False)
+
+	def facet_filters(self):
+		"""Translate the narrowing options into djapian facet filters"""
+		filters = {}
+
+		search_type = self.cleaned_data.get('type')
+		if search_type in ('production', 'graphics', 'music'):
+			filters['supertype'] = search_type
+		elif search_type == 'group':
+			filters['is_group'] = True
+		elif search_type == 'scener':
+			filters['is_group'] = False
+
+		if self.cleaned_data.get('platform'):
+			filters['platform'] = self.cleaned_data['platform']
+
+		return filters
+
 	def search(self, with_real_names=False):
 		query = unidecode(self.cleaned_data['q'])
-		name_results = (name_indexer_with_real_names if with_real_names else name_indexer).search(query).prefetch()
-		name_result_ids = set([hit.pk for hit in name_results])
-		complete_results = (complete_indexer_with_real_names if with_real_names else complete_indexer).search(query).prefetch()
-		# need to filter name_result_ids out from other_results manually,
-		# because CompositeIndexer doesn't support filtering:
-		# http://code.google.com/p/djapian/issues/detail?id=66
-		other_results = []
-		for r in complete_results:
-			if r.pk not in name_result_ids:
-				other_results.append(r)
-		return (name_results, other_results, complete_results)
+		if with_real_names:
+			primary_indexer, secondary_indexer = name_indexer_with_real_names, complete_indexer_with_real_names
+		else:
+			primary_indexer, secondary_indexer = name_indexer, complete_indexer
+
+		# Search the name and full-text indexes in a single pass. Name matches are excluded
+		# from other_results, and instances are only fetched for the page of other_results
+		# that is actually rendered. Counts for the 'narrow by' options are taken from Xapian
+		# match spies in the same pass, without loading anything from the database
+		results = primary_indexer.combined_search(secondary_indexer, query).facet_filter(**self.facet_filters())\
+			.facets('supertype', 'is_group', 'platform').prefetch()
+		name_results = results.primary()
+		other_results = results.secondary()
+		facet_counts = results.get_facet_counts()
+
+		# the combined resultset also provides the parsed query terms for highlighting snippets
+		return (name_results, other_results, results, facet_counts)
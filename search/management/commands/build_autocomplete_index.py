@@ -0,0 +1,11 @@
+from django.core.management.base import NoArgsCommand
+
+from search.autocomplete import rebuild_snapshot
+
+
+class Command(NoArgsCommand):
+	help = "Rebuild the prefix index snapshot used by live search"
+
+	def handle_noargs(self, **options):
+		count = rebuild_snapshot()
+		self.stdout.write("Wrote %d autocomplete entries" % count)
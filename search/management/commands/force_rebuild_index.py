@@ -1,12 +1,19 @@
+import multiprocessing
+from optparse import make_option
+
 from django.core.management.base import NoArgsCommand
 from django.core.management import call_command
 
-from django.db import connection, transaction
-
 
 class Command(NoArgsCommand):
+	option_list = NoArgsCommand.option_list + (
+		make_option('--processes', dest='processes', default=multiprocessing.cpu_count(),
+			action='store', type='int',
+			help='Number of processes to rebuild the index with (default: %default)'),
+	)
+
 	def handle_noargs(self, **options):
-		with transaction.atomic():
-			cursor = connection.cursor()
-			cursor.execute("DELETE FROM djapian_change")
-		call_command('index', rebuild_index=True)
+		# queued changes are left alone: the index worker holds them back while
+		# the rebuild runs, and applies them to the new index afterwards
+		call_command('index', rebuild_index=True, processes=options['processes'])
+		call_command('build_autocomplete_index')
@@ -1,3 +1,93 @@
-from django.db import models
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils.encoding import smart_str
 
-# Create your models here.
+from demoscene.models import Releaser, Nick, NickVariant, Membership
+from djapian.models import Change
+from djapian.notifier import notify_change
+from djapian.signals import index_updated
+from productions.models import Production
+
+from search import autocomplete
+
+
+@receiver(index_updated)
+def update_autocomplete_index(sender, pks, action, **kwargs):
+	autocomplete.writer.apply_changes(sender, pks, action)
+
+
+# Autocomplete entries hold the pre-rendered search_result_json of each object, which includes
+# names from related objects: productions show their byline, and releasers show their current
+# groups (abbreviated where available). Saving those related objects doesn't queue a Change for
+# the objects that display them, so queue them here.
+
+def queue_index_changes(model, pks):
+	"""
+	Queue 'edit' Changes for the given objects, in bulk. Objects that no longer exist, or
+	that have a pending 'add' or 'delete', are left alone: in particular, the memberships
+	and nick variants deleted along with a releaser must not turn its pending 'delete'
+	into an 'edit', which the worker would drop on finding the releaser gone.
+	"""
+	object_ids = [smart_str(pk) for pk in model.objects.filter(pk__in=set(pks)).values_list('pk', flat=True)]
+	if not object_ids:
+		return
+
+	content_type = ContentType.objects.get_for_model(model)
+	with transaction.atomic():
+		pending_changes = Change.objects.filter(content_type=content_type, object_id__in=object_ids)
+		held_object_ids = set(pending_changes.exclude(action="edit").values_list('object_id', flat=True))
+		# as in ChangeManager.create, pending edits are replaced rather than kept, so that
+		# a worker run that has already read them still leaves this edit to be processed
+		pending_changes.filter(action="edit").delete()
+		Change.objects.bulk_create([
+			Change(content_type=content_type, object_id=object_id, action="edit")
+			for object_id in object_ids if object_id not in held_object_ids
+		])
+	notify_change()
+
+
+def group_member_ids(group_ids):
+	return Membership.objects.filter(group_id__in=group_ids).values_list('member_id', flat=True)
+
+
+def queue_changes_for_nick(nick_id, releaser_id):
+	production_ids = set(Production.author_nicks.through.objects.filter(nick_id=nick_id).values_list('production_id', flat=True))
+	production_ids.update(Production.author_affiliation_nicks.through.objects.filter(nick_id=nick_id).values_list('production_id', flat=True))
+	queue_index_changes(Production, production_ids)
+	# a group's abbreviation is held on its primary nick, and shown against its members
+	queue_index_changes(Releaser, list(group_member_ids([releaser_id])) + [releaser_id])
+
+
+@receiver(post_save, sender=Nick)
+def queue_changes_for_saved_nick(sender, **kwargs):
+	if not kwargs.get('raw') and not kwargs.get('created'):
+		nick = kwargs['instance']
+		queue_changes_for_nick(nick.id, nick.releaser_id)
+
+
+@receiver(pre_delete, sender=Nick)
+def queue_changes_for_deleted_nick(sender, **kwargs):
+	# bylines are deleted along with the nick, so find the productions while they still point to it
+	nick = kwargs['instance']
+	queue_changes_for_nick(nick.id, nick.releaser_id)
+
+
+@receiver([post_save, post_delete], sender=NickVariant)
+def queue_changes_for_nick_variant(sender, **kwargs):
+	if not kwargs.get('raw'):
+		queue_index_changes(Releaser, Nick.objects.filter(id=kwargs['instance'].nick_id).values_list('releaser_id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Membership)
+def queue_changes_for_membership(sender, **kwargs):
+	if not kwargs.get('raw'):
+		queue_index_changes(Releaser, [kwargs['instance'].member_id])
+
+
+@receiver(post_save, sender=Releaser)
+def queue_changes_for_group_members(sender, **kwargs):
+	releaser = kwargs['instance']
+	if not kwargs.get('raw') and not kwargs.get('created') and releaser.is_group:
+		queue_index_changes(Releaser, group_member_ids([releaser.id]))
@@ -0,0 +1,77 @@
+from __future__ import unicode_literals
+
+import os
+import tempfile
+
+from django.contrib.contenttypes.models import ContentType
+from django.test import SimpleTestCase, TestCase
+
+import djapian
+from demoscene.models import Releaser, Membership
+from djapian.models import Change
+from productions.models import Production
+from search.autocomplete import PrefixIndex
+
+
+class TestIndexChangeQueueing(TestCase):
+	def setUp(self):
+		# connect djapian's own signal handlers, as demozoo.urls does
+		djapian.load_indexes()
+
+		self.gasman = Releaser.objects.create(name="Gasman", is_group=False)
+		self.hooy_program = Releaser.objects.create(name="Hooy-Program", is_group=True)
+		Membership.objects.create(member=self.gasman, group=self.hooy_program)
+		self.gasman.nicks.first().variants.create(name="Gasmano")
+		Change.objects.all().delete()
+
+	def changes_for(self, model):
+		return Change.objects.filter(content_type=ContentType.objects.get_for_model(model))
+
+	def test_deleted_releaser_stays_queued_for_deletion(self):
+		gasman_id = self.gasman.id
+		self.gasman.delete()
+
+		change = self.changes_for(Releaser).get(object_id=str(gasman_id))
+		self.assertEqual(change.action, "delete")
+
+	def test_nick_rename_queues_productions(self):
+		nick = self.gasman.nicks.first()
+		for title in ["Madrielle", "Mooncheese", "Starstruck"]:
+			Production.objects.create(title=title).author_nicks.add(nick)
+		Change.objects.all().delete()
+
+		nick.name = "Shingebis"
+		nick.save()
+
+		self.assertEqual(self.changes_for(Production).filter(action="edit").count(), 3)
+		self.assertEqual(self.changes_for(Releaser).get(object_id=str(self.gasman.id)).action, "edit")
+
+
+class TestPrefixIndexFile(SimpleTestCase):
+	def setUp(self):
+		entries = {
+			('demoscene.Releaser', 1): ([("Gasman", False), ("Matt Westcott", True)], '{"id": 1}'),
+			('demoscene.Releaser', 2): ([("Hooy-Program", False)], '{"id": 2}'),
+		}
+		for i in range(3000):
+			entries[('productions.Production', i)] = ([("Mooncheese %d" % i, False)], '{"id": "p%d"}' % i)
+		self.index = PrefixIndex.build(entries)
+
+		fd, self.path = tempfile.mkstemp()
+		with os.fdopen(fd, 'wb') as f:
+			self.index.write(f)
+
+	def tearDown(self):
+		os.remove(self.path)
+
+	def test_loaded_index_matches_built_index(self):
+		loaded = PrefixIndex.load(self.path)
+		self.assertEqual(len(loaded), len(self.index))
+		for query in ["gas", "hooy program", "program", "m", "mooncheese 12"]:
+			self.assertEqual(loaded.search(query), self.index.search(query))
+		self.assertEqual(loaded.search("westcott"), [])
+		self.assertEqual(loaded.search("westcott", include_restricted=True), ['{"id": 1}'])
+
+	def test_unreadable_index_is_ignored(self):
+		open(self.path, 'wb').close()
+		self.assertIsNone(PrefixIndex.load(self.path))
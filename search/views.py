@@ -1,12 +1,48 @@
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.contrib import messages
 from django.shortcuts import render, redirect
 
 from unidecode import unidecode
 
-from search.forms import SearchForm
+from search import autocomplete
+from search.forms import SearchForm, TYPE_CHOICES
 from demoscene.shortcuts import get_page
 from demoscene.index import name_indexer, name_indexer_with_real_names
+from platforms.models import Platform
+
+TYPE_LABELS = dict(TYPE_CHOICES)
+GROUP_TYPES = {'t': 'group', 'f': 'scener'}
+
+
+def narrowing_url(request, **params):
+	query_params = request.GET.copy()
+	query_params.pop('page', None)
+	for key, value in params.items():
+		query_params[key] = value
+	return '?' + query_params.urlencode()
+
+
+def narrowing_options(request, facet_counts):
+	"""Build (label, count, url) lists of the type and platform options for narrowing the search"""
+	types = [
+		(TYPE_LABELS[supertype], count, narrowing_url(request, type=supertype))
+		for supertype, count in facet_counts['supertype']
+		if supertype in TYPE_LABELS
+	] + [
+		(TYPE_LABELS[GROUP_TYPES[is_group]], count, narrowing_url(request, type=GROUP_TYPES[is_group]))
+		for is_group, count in facet_counts['is_group']
+		if is_group in GROUP_TYPES
+	]
+
+	platform_counts = facet_counts['platform'][:10]
+	platforms_by_id = Platform.objects.in_bulk([int(platform_id) for platform_id, count in platform_counts])
+	platforms = [
+		(platforms_by_id[int(platform_id)].name, count, narrowing_url(request, platform=int(platform_id)))
+		for platform_id, count in platform_counts
+		if int(platform_id) in platforms_by_id
+	]
+
+	return {'types': types, 'platforms': platforms}
 
 
 def search(request):
@@ -15,17 +51,24 @@ def search(request):
 		query = form.cleaned_data['q']
 
 		has_real_name_access = request.user.has_perm('demoscene.view_releaser_real_names')
-		(name_results, results, resultset) = form.search(with_real_names=has_real_name_access)
+		(name_results, results, resultset, facet_counts) = form.search(with_real_names=has_real_name_access)
 
 		if len(name_results) == 1 and len(results) == 0:
-			messages.success(request, "One match found for '%s'" % query)
-			return redirect(name_results[0].instance)
+			# iterating skips hits for objects deleted since they were indexed
+			name_hits = list(name_results)
+			if name_hits:
+				messages.success(request, "One match found for '%s'" % query)
+				return redirect(name_hits[0].instance)
 		page = get_page(results, request.GET.get('page', '1'))
+		narrowing = narrowing_options(request, facet_counts)
+		page_url = narrowing_url(request)
 	else:
 		query = None
 		page = None
 		name_results = None
 		resultset = None
+		narrowing = None
+		page_url = None
 	return render(request, 'search/search.html', {
 		'form': form,
 		'query': query,
@@ -33,6 +76,8 @@ def search(request):
 		'name_results': name_results,
 		'page': page,
 		'resultset': resultset,
+		'narrowing': narrowing,
+		'page_url': page_url,
 	})
 
 
@@ -41,6 +86,15 @@ def live_search(request):
 	if query:
 		query = unidecode(query)
 		has_real_name_access = request.user.has_perm('demoscene.view_releaser_real_names')
+
+		index = autocomplete.get_index()
+		if index is not None:
+			return HttpResponse(
+				index.search_json(query, limit=10, include_restricted=has_real_name_access),
+				content_type='application/json'
+			)
+
+		# autocomplete index not loaded yet - fall back on Xapian
 		results = (name_indexer_with_real_names if has_real_name_access else name_indexer).search(query).flags(name_indexer.flags.PARTIAL)[0:10].prefetch()
 		results = [hit.instance.search_result_json() for hit in results]
 	else:
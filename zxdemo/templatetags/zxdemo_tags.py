@@ -19,11 +19,11 @@ def byline(context, production, check_spectrum=False):
 			spectrum_releaser_ids = set(spectrum_releasers().values_list('id', flat=True))
 			context['spectrum_releaser_ids'] = spectrum_releaser_ids
 
-		authors = [(nick, nick.releaser_id in spectrum_releaser_ids) for nick in production.author_nicks.all()]
-		affiliations = [(nick, nick.releaser_id in spectrum_releaser_ids) for nick in production.author_affiliation_nicks.all()]
+		authors = [(nick, nick.releaser_id in spectrum_releaser_ids) for nick in production.author_nicks_with_authors()]
+		affiliations = [(nick, nick.releaser_id in spectrum_releaser_ids) for nick in production.author_affiliation_nicks_with_groups()]
 	else:
-		authors = [(author, True) for author in production.author_nicks.all()]
-		affiliations = [(affiliation, True) for affiliation in production.author_affiliation_nicks.all()]
+		authors = [(author, True) for author in production.author_nicks_with_authors()]
+		affiliations = [(affiliation, True) for affiliation in production.author_affiliation_nicks_with_groups()]
 
 	return {
 		'unparsed_byline': production.unparsed_byline,
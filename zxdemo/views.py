@@ -7,11 +7,12 @@ from django.http import Http404
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 
 import math
+import random
 import urllib
 
 from demoscene.models import Releaser, ReleaserExternalLink, Membership
 from productions.models import Production, Screenshot, ProductionLink, Credit
-from parties.models import Party, PartyExternalLink
+from parties.models import Party, PartyExternalLink, get_competition_results
 from zxdemo.models import NewsItem, Article, spectrum_releasers, filter_releasers_queryset_to_spectrum
 
 def home(request):
@@ -329,19 +330,31 @@ def party(request, party_id):
 		placings__production__platforms__id__in=ZXDEMO_PLATFORM_IDS
 	).distinct().order_by('name', 'id')
 	competitions_with_placings = []
-
-	for competition in competitions:
-		placings = competition.placings.order_by('position', 'production__id').prefetch_related(
-			'production__author_nicks__releaser', 'production__author_affiliation_nicks__releaser', 'production__platforms', 'production__types'
-		).defer('production__notes', 'production__author_nicks__releaser__notes', 'production__author_affiliation_nicks__releaser__notes')
-
-		screenshots = Screenshot.objects.filter(
-			production__competition_placings__competition=competition,
-			production__platforms__id__in=ZXDEMO_PLATFORM_IDS).order_by('?')[:math.ceil(len(placings) / 6.0)]
+	results = get_competition_results(competitions)
+
+	# pick screenshots for each competition from its Spectrum entries, fetched in one query
+	spectrum_production_ids = set(
+		placing.production_id
+		for competition, placings in results
+		for placing in placings
+		if any(platform.id in ZXDEMO_PLATFORM_IDS for platform in placing.production.platforms.all())
+	)
+	screenshots_by_production_id = {}
+	for screenshot in Screenshot.objects.filter(production_id__in=spectrum_production_ids):
+		screenshots_by_production_id.setdefault(screenshot.production_id, []).append(screenshot)
+
+	for competition, placings in results:
+		screenshots = []
+		for placing in placings:
+			for screenshot in screenshots_by_production_id.get(placing.production_id, []):
+				# avoid a query for the production title in the template
+				screenshot.production = placing.production
+				screenshots.append(screenshot)
+		random.shuffle(screenshots)
 
 		competitions_with_placings.append(
 			(
-				competition, placings, screenshots,
+				competition, placings, screenshots[:int(math.ceil(len(placings) / 6.0))],
 			)
 		)
 